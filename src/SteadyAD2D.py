@@ -4,16 +4,29 @@
 @summary: 
     A steady 2D advection-diffusion FEM solver in Python 2.7
     using NumPy, SciPy and MatPlotLib
-@version: 1.6
+
+    Modules are imported when they are first needed, so runs that do not
+    plot do not import matplotlib, for instance. To avoid the startup time
+    for many short jobs, the solver can also be run as a server that keeps
+    the modules loaded and solves jobs given as lines of command line
+    arguments, from the standard input or a Unix socket:
+        python SteadyAD2D.py --serve -P < jobs.txt
+        python SteadyAD2D.py --serve /tmp/steadyad2d.sock -P
+    Missing arguments of a job are taken from the ones of the server, and a
+    JSON line with the result is written back for each job.
+@version: 1.8
 """
 
-if __name__ == "__main__":
+# Modules imported by the server before serving, which every job needs
+ServerModules = ("numpy", "scipy.sparse", "scipy.sparse.linalg", "psetup",
+                 "gsystem", "solveproc", "writers")
+
+
+def get_parser():
     import argparse
 
-    from psetup import get_problem_data
-    from gsystem import calc_global
-    from solveproc import post_process, solve_system
-    from time import time
+    from reorder import Orderings
+    from writers import Writers
 
     parser = argparse.ArgumentParser(
         description='Solves steady and 2D advection/diffusion problems using '
@@ -21,27 +34,352 @@ if __name__ == "__main__":
     )
     parser.add_argument('-i', '--input', default='', help='Input file path.')
     parser.add_argument('-o', '--output', default='', help='Output file path.')
+    parser.add_argument('-F', '--format', default=None,
+                        choices=tuple(sorted(Writers)),
+                        help='Output format. Defaults to the one of the '
+                             'output file extension, or JSON.')
     parser.add_argument('-P', '--dontplot', default=False, action='store_true',
                         help='Do not create a contour plot of the solution.')
+    parser.add_argument('--plot-file', default=None, metavar='FILE',
+                        help='Render the plot to this image file (e.g. PNG) '
+                             'without a display instead of showing it.')
+    parser.add_argument('--plot-style', default='contour',
+                        choices=('contour', 'color'),
+                        help='Plot filled contours (contour) or linearly '
+                             'interpolated colors, which is faster for large '
+                             'meshes (color).')
+    parser.add_argument('--dpi', default=100, type=int,
+                        help='Resolution of the rendered plot.')
+    parser.add_argument('--size', default=None, type=float, nargs=2,
+                        metavar=('WIDTH', 'HEIGHT'),
+                        help='Size of the plot in inches. Defaults to 8 6.')
     parser.add_argument('-S', '--dontsave', default=False, action='store_true',
                         help='Do not save the solution to a file.')
-    arguments = parser.parse_args()
+    parser.add_argument('--quantities', default=None, metavar='FILE',
+                        help='Calculate the gradients, fluxes, boundary '
+                             'fluxes, integrals and error norms of the '
+                             'solution and save them to this file: a JSON '
+                             'summary, or all arrays if it ends with .npz.')
+    parser.add_argument('-r', '--reader', default='stream',
+                        choices=('stream', 'json'),
+                        help='Stream the mesh arrays of the input directly '
+                             'into arrays (stream) or use json.load (json).')
+    parser.add_argument('--compare-readers', default=False,
+                        action='store_true',
+                        help='Report the peak memory and time of both readers '
+                             'for the input file before running.')
+    parser.add_argument('-A', '--assembly', default='batch',
+                        choices=('batch', 'element'),
+                        help='Calculate elemental systems for all elements at '
+                             'once (batch) or element by element (element).')
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help='Number of worker processes for batch assembly. '
+                             '0 uses all available CPUs.')
+    parser.add_argument('-E', '--ebc', default='row',
+                        choices=('row', 'symmetric'),
+                        help='Apply EBCs by replacing their rows (row) or by '
+                             'also eliminating their columns, which keeps K '
+                             'symmetric for diffusion problems (symmetric).')
+    parser.add_argument('-s', '--solver', default=None,
+                        choices=('direct', 'gmres', 'bicgstab', 'cg'),
+                        help='Linear solver, overriding the one in the input. '
+                             'Defaults to the direct solver.')
+    parser.add_argument('-p', '--precond', default=None,
+                        choices=('none', 'ilu', 'jacobi'),
+                        help='Preconditioner for the iterative solvers.')
+    parser.add_argument('--tol', default=None, type=float,
+                        help='Relative tolerance for the iterative solvers.')
+    parser.add_argument('--maxiter', default=None, type=int,
+                        help='Iteration cap for the iterative solvers.')
+    parser.add_argument('-C', '--factor-cache', default=None, metavar='DIR',
+                        help='Reuse the factorization of K from this directory '
+                             'when only F has changed, storing it there '
+                             'otherwise. Only used with the direct solver and '
+                             'row EBCs.')
+    parser.add_argument('-R', '--reorder', default='none',
+                        choices=('none',) + tuple(sorted(Orderings)),
+                        help='Renumber the nodes to reduce the bandwidth of '
+                             'K before assembly.')
+    parser.add_argument('--adapt', default=None, type=float, metavar='TOL',
+                        help='Refine the mesh adaptively until the estimated '
+                             'relative error is below TOL. Linear elements '
+                             'only; the solution is saved on the refined '
+                             'mesh.')
+    parser.add_argument('--max-elements', default=None, type=int,
+                        help='Element budget of adaptive refinement. The '
+                             'elements to refine are limited so that the '
+                             'refined mesh stays within it.')
+    parser.add_argument('--max-refinements', default=10, type=int,
+                        help='Maximum number of adaptive refinements.')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='Write a JSON report of the time, memory usage '
+                             'and statistics of each phase to this file.')
+    parser.add_argument('--cprofile', default=None, metavar='DIR',
+                        help='Run each phase under cProfile, writing the '
+                             'statistics to this directory.')
+    parser.add_argument('--serve', default=None, nargs='?', const='-',
+                        metavar='SOCKET',
+                        help='Keep running and solve the jobs read from the '
+                             'standard input, or from connections to this '
+                             'Unix socket. Each job is a line of arguments.')
+    return parser
+
+
+def parse_arguments(parser, args=None, namespace=None):
+    arguments = parser.parse_args(args, namespace)
+    if arguments.adapt and arguments.reorder != "none":
+        parser.error("--adapt cannot be used with --reorder.")
+    return arguments
+
+
+def run(arguments):
+    """
+    Solves the problem given by the command line arguments and post
+    processes the solution. Returns the problem data and the solution.
+    """
+    import os
+    from time import time
+
+    import instrument
+    from instrument import phase, record
+
+    # Started before importing the modules, so that their imports are timed
+    profiler = None
+    if arguments.profile or arguments.cprofile:
+        profiler = instrument.Profiler(arguments.cprofile)
+        instrument.activate(profiler)
+
+    try:
+        from psetup import read_problem_data, process_problem_data, \
+            compare_readers
+        from gsystem import calc_global, calc_operator_key
+        from solveproc import post_process, solve_system, \
+            get_solver_settings, get_factorization, store_factorization, \
+            solve_factorized
+        from reorder import reorder, restore_order
+        from writers import Extensions, get_format, check_format
+
+        if arguments.workers < 1:
+            from multiprocessing import cpu_count
+            arguments.workers = cpu_count()
+
+        if arguments.compare_readers:
+            print("Comparing input readers...")
+            compare_readers(arguments.input)
+
+        with phase("read"):
+            problem_data = read_problem_data(arguments.input, arguments.output,
+                                             arguments.reader)
+        with phase("process"):
+            problem_data = process_problem_data(problem_data)
+        if arguments.format and not arguments.output:
+            # Default output names get the extension of the chosen format
+            problem_data["output"] = \
+                os.path.splitext(problem_data["output"])[0] + \
+                Extensions[arguments.format]
+        if not arguments.dontsave:
+            # Found before solving, not after it when the output is written
+            check_format(arguments.format or
+                         get_format(problem_data["output"]), problem_data)
+        if arguments.reorder != "none":
+            with phase("reorder"):
+                problem_data = reorder(problem_data, arguments.reorder)
+        solver_settings = get_solver_settings(problem_data, arguments)
+
+        # Exclude input reading time from total time
+        t = time()
+
+        # calc_global drops the functions, UV and BCs of the problem data it
+        # is given, which the derived quantities need
+        assembly_data = problem_data
+        if arguments.quantities:
+            assembly_data = dict(problem_data)
+
+        factor_key = factor = None
+        if arguments.factor_cache and \
+                solver_settings["method"] == "direct" and \
+                arguments.ebc == "row" and not arguments.adapt:
+            factor_key = calc_operator_key(problem_data)
+            factor = get_factorization(factor_key, arguments.factor_cache)
+
+        if arguments.adapt:
+            from adapt import solve_adaptive
 
-    problem_data = get_problem_data(arguments.input, arguments.output)
+            with phase("adapt"):
+                solution, history = solve_adaptive(
+                    problem_data, solver_settings, arguments.adapt,
+                    arguments.max_elements, arguments.max_refinements,
+                    workers=arguments.workers, ebc_method=arguments.ebc
+                )
+            record(adapt=history)
+        elif factor is not None:
+            # K is unchanged, so only F is calculated and the system is solved
+            # using the cached factorization
+            with phase("assembly"):
+                K, F = calc_global(assembly_data, arguments.assembly,
+                                   arguments.workers, rhs_only=True)
+            with phase("solve"):
+                solution = solve_factorized(factor, F)
+            record(solver={"method": "cached factorization"})
+        else:
+            # Calculate the system
+            with phase("assembly"):
+                K, F = calc_global(assembly_data, arguments.assembly,
+                                   arguments.workers, ebc_method=arguments.ebc)
 
-    # Exclude input reading time from total time
+            # Solve the system
+            with phase("solve"):
+                solution = solve_system(K, F, solver_settings)
+            report = solver_settings["report"]
+            record(solver=report)
+            if "fill_in" in report:
+                record(fill_ratio=float(report["fill_in"]) / K.nnz)
+
+            if factor_key:
+                store_factorization(factor_key, solver_settings["factor"],
+                                    arguments.factor_cache)
+
+        # Map the solution back to the node numbering of the input
+        solution = restore_order(problem_data, solution)
+
+        # Calculate the total running time
+        t = time() - t
+
+        print("Total run time: {0} seconds.".format(t))
+
+        # Exclude the post processing time from total time
+        with phase("output"):
+            post_process(problem_data, solution, arguments)
+
+        if profiler:
+            profiler.print_summary()
+            if arguments.profile:
+                profiler.save(arguments.profile)
+    finally:
+        if profiler:
+            instrument.activate(None)
+            profiler.stop()
+
+    return problem_data, solution
+
+
+def run_job(parser, defaults, line):
+    """
+    Runs a job of the server given as a line of command line arguments, with
+    the defaults taken from the arguments of the server. The output of the
+    job goes to the standard error, so that only the results are written to
+    the standard output. Returns the result of the job.
+    """
+    import sys
+    import shlex
+    import traceback
+    from copy import copy
+    from time import time
+
+    result = {"job": line}
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
     t = time()
+    try:
+        try:
+            arguments = parse_arguments(parser, shlex.split(line),
+                                        copy(defaults))
+        except SystemExit:
+            # Invalid arguments, which argparse has reported. Only this exit
+            # is caught, the one of SIGTERM stops the server.
+            arguments = None
+            result["status"] = "error"
+            result["error"] = "Invalid arguments."
+        if arguments is not None:
+            if not arguments.input:
+                raise ValueError("An input file is needed.")
+            # There is no display to show the plots
+            if not arguments.plot_file:
+                arguments.dontplot = True
+            problem_data, solution = run(arguments)
+            result["status"] = "ok"
+            if not arguments.dontsave:
+                result["output"] = problem_data["output"]
+    except Exception as error:
+        traceback.print_exc()
+        result["status"] = "error"
+        result["error"] = "{0}: {1}".format(type(error).__name__, error)
+    finally:
+        sys.stdout = stdout
+    result["time"] = time() - t
+    return result
+
+
+def serve(parser, arguments):
+    """
+    Solves the jobs read from the standard input if arguments.serve is "-",
+    or from the connections to the Unix socket at that path otherwise, one
+    at a time, until the input ends or the server is interrupted. A JSON
+    line with the result of each job is written back.
+    """
+    import os
+    import sys
+    import signal
+    import stat
+    from copy import copy
+    from importlib import import_module
+    from json import dumps
+
+    for name in ServerModules:
+        import_module(name)
+
+    defaults = copy(arguments)
+    defaults.serve = None
 
-    # Calculate the system
-    K, F = calc_global(problem_data)
+    def handle_(lines, write_):
+        for line in lines:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                write_(dumps(run_job(parser, defaults, line)) + "\n")
 
-    # Solve the system
-    solution = solve_system(K, F)
+    if arguments.serve == "-":
+        def write_(text):
+            sys.stdout.write(text)
+            sys.stdout.flush()
 
-    # Calculate the total running time
-    t = time() - t
+        sys.stderr.write("Serving jobs from the standard input...\n")
+        handle_(iter(sys.stdin.readline, ""), write_)
+        return
 
-    print("Total run time: {0} seconds.".format(t))
+    try:
+        import socketserver
+    except ImportError:
+        import SocketServer as socketserver
 
-    # Exclude the post processing time from total time
-    post_process(problem_data, solution, arguments)
+    class JobHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            handle_((line.decode("utf-8")
+                     for line in iter(self.rfile.readline, b"")),
+                    lambda text: self.wfile.write(text.encode("utf-8")))
+
+    address = arguments.serve
+    if os.path.exists(address):
+        # Only a socket left by a previous server is replaced
+        if not stat.S_ISSOCK(os.stat(address).st_mode):
+            parser.error("{0} exists and is not a socket.".format(address))
+        os.remove(address)
+    server = socketserver.UnixStreamServer(address, JobHandler)
+    # Terminating the server also removes its socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    sys.stderr.write("Serving jobs at {0}...\n".format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(address)
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    arguments = parse_arguments(parser)
+    if arguments.serve:
+        serve(parser, arguments)
+    else:
+        run(arguments)
@@ -0,0 +1,376 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    A transient 2D advection-diffusion FEM solver, for
+        dT/dt - a * div(grad(T)) + V . grad(T) + c * T = f
+    with the same problem files and boundary conditions as SteadyAD2D. Time
+    is advanced with the theta method: theta = 1 is implicit Euler and
+    theta = 0.5 is Crank-Nicolson. The mass and stiffness matrixes are
+    assembled once, with the same sparsity pattern, and the system matrix
+    M + theta * dt * K is factorized (or preconditioned) once, so every time
+    step only costs a matrix-vector product and a back substitution.
+
+    The time settings are read from the "transient" entry of the problem
+    data, which can be overridden by the command line arguments:
+        python TransientAD2D.py -i Sample.json --dt 0.01 --steps 500
+    The "initial" setting is an expression of the x and y coordinates, in
+    which a bare x or y is the coordinate rather than the U or V field.
+    Snapshots of the solution are streamed into a NPY file of shape
+    (snapshots, NN) as they are calculated, and the final solution is post
+    processed like a steady one.
+@version: 1.1
+"""
+
+# Default time settings, which can be overridden by the "transient" entry of
+# the problem data and by the command line arguments
+DefaultTransientSettings = {
+    "dt": 0.01,
+    "steps": 100,
+    "theta": 1.0,
+    "initial": "0",
+    "save_every": 1
+}
+
+
+def get_transient_settings(problem_data, arguments=None):
+    """
+    Merges the time settings from the defaults, the problem data and the
+    command line arguments, in increasing order of precedence.
+    """
+
+    settings = dict(DefaultTransientSettings)
+    settings.update(problem_data.get("transient") or {})
+    if arguments is not None:
+        for key in DefaultTransientSettings:
+            value = getattr(arguments, key, None)
+            if value is not None:
+                settings[key] = value
+
+    if not 0. <= settings["theta"] <= 1.:
+        raise ValueError("theta must be between 0 and 1.")
+    if settings["dt"] <= 0. or settings["steps"] < 0 or \
+            settings["save_every"] < 1:
+        raise ValueError("dt and save_every must be positive and steps must "
+                         "not be negative.")
+    return settings
+
+
+def get_snapshot_count(settings):
+    """
+    Returns the number of snapshots saved: the initial condition, every
+    save_every steps and the last step.
+    """
+    steps = settings["steps"]
+    save_every = settings["save_every"]
+    return 1 + steps // save_every + (1 if steps % save_every else 0)
+
+
+def get_initial_condition(problem_data, source):
+    """
+    Evaluates the initial condition at the nodes. It is an expression of the
+    x and y coordinates with the names of the coefficient functions, but a
+    bare "x" or "y" is the coordinate, not the U or V field. EBC nodes get
+    their values.
+    """
+    from numpy import asarray, broadcast_to
+    from psetup import compile_expression
+
+    nodes = asarray(problem_data["nodes"], dtype=float)
+    func = compile_expression(str(source), "initial")
+    values = broadcast_to(func(nodes[:, 0], nodes[:, 1]), (len(nodes),))
+    values = asarray(values, dtype=float).copy()
+
+    EBC = problem_data["BCs"]["EBC"]
+    values[EBC["node"]] = EBC["data"][:, 0]
+    return values
+
+
+def step_transient(problem_data, settings, solver_settings, mode="batch",
+                   workers=1):
+    """
+    Advances the processed problem in time from the initial condition,
+    yielding the step number, the time and the solution of every step,
+    starting with step 0. Every step yields a new solution array.
+    """
+    from numpy import asarray, zeros
+    from scipy import sparse
+    from gsystem import calc_global, calc_mass, get_sparsity_pattern, \
+        get_group_nodes, get_entry_rows, get_diagonal_positions
+    from instrument import phase, record
+
+    dt = float(settings["dt"])
+    theta = float(settings["theta"])
+    NN = problem_data["NN"]
+    EBC = problem_data["BCs"]["EBC"]
+    EBC_nodes = EBC["node"]
+    EBC_values = EBC["data"][:, 0]
+
+    solution = get_initial_condition(problem_data, settings["initial"])
+
+    # K and M share the sparsity pattern, so the operators of the theta
+    # method are combinations of their data arrays
+    with phase("assembly"):
+        pattern = get_sparsity_pattern(
+            [e_nodes for _, _, e_nodes in get_group_nodes(problem_data)], NN
+        )
+        M = calc_mass(problem_data, pattern)
+        # calc_global drops the functions and BCs of the problem data it is
+        # given, which are still needed for post processing
+        K, F = calc_global(dict(problem_data), mode, workers,
+                           ebc_method="none", pattern=pattern)
+        F = asarray(F).ravel() * dt
+        A = sparse.csr_matrix((M.data + theta * dt * K.data, K.indices,
+                               K.indptr), shape=K.shape)
+        B = sparse.csr_matrix((M.data - (1. - theta) * dt * K.data,
+                               K.indices, K.indptr), shape=K.shape)
+        del M, K
+
+        # EBC rows of A are replaced by identity rows, their values are set
+        # in the right hand side
+        is_EBC = zeros(NN, dtype=bool)
+        is_EBC[EBC_nodes] = True
+        A.data[is_EBC[get_entry_rows(A)]] = 0.
+        A.data[get_diagonal_positions(A)[EBC_nodes]] = 1.
+    record(nnz=A.nnz)
+
+    method = solver_settings["method"]
+    print("Preparing the time stepping system ({0})...".format(method))
+    with phase("factorize"):
+        if method == "direct":
+            from scipy.sparse import linalg
+
+            factor = linalg.splu(A.tocsc())
+            record(fill_ratio=float(factor.L.nnz + factor.U.nnz) / A.nnz)
+        else:
+            from solveproc import Preconditioners
+
+            factor = None
+            solver_settings["preconditioner_operator"] = \
+                Preconditioners[solver_settings["preconditioner"]](
+                    A, solver_settings
+                )
+
+    print("Stepping {0} steps of {1}...".format(settings["steps"], dt))
+    yield 0, 0., solution
+    iterations = 0
+    try:
+        for step in range(1, settings["steps"] + 1):
+            rhs = B.dot(solution)
+            rhs += F
+            rhs[EBC_nodes] = EBC_values
+            if factor is not None:
+                solution = factor.solve(rhs)
+            else:
+                from solveproc import Solvers
+
+                report = {}
+                solver_settings["x0"] = solution
+                solution = Solvers[method](A, rhs, solver_settings, report)
+                iterations += report["iterations"]
+                if not report["converged"]:
+                    print(" ! Step {0} did not converge.".format(step))
+            yield step, step * dt, solution
+    finally:
+        solver_settings.pop("x0", None)
+        solver_settings.pop("preconditioner_operator", None)
+        if factor is None:
+            record(iterations=iterations)
+
+
+def get_parser():
+    import argparse
+
+    from reorder import Orderings
+    from writers import Writers
+
+    parser = argparse.ArgumentParser(
+        description='Solves transient 2D advection/diffusion problems using '
+                    'finite elements method.'
+    )
+    parser.add_argument('-i', '--input', default='', help='Input file path.')
+    parser.add_argument('-o', '--output', default='',
+                        help='Output file path of the final solution.')
+    parser.add_argument('-F', '--format', default=None,
+                        choices=tuple(sorted(Writers)),
+                        help='Output format of the final solution. Defaults '
+                             'to the one of the output file extension, or '
+                             'JSON.')
+    parser.add_argument('--snapshots', default='', metavar='FILE',
+                        help='NPY file the snapshots are streamed to. '
+                             'Defaults to the input path with _transient.npy '
+                             'suffix.')
+    parser.add_argument('--dt', default=None, type=float,
+                        help='Time step size.')
+    parser.add_argument('--steps', default=None, type=int,
+                        help='Number of time steps.')
+    parser.add_argument('--theta', default=None, type=float,
+                        help='Implicitness of the theta method: 1 is '
+                             'implicit Euler, 0.5 is Crank-Nicolson.')
+    parser.add_argument('--initial', default=None, metavar='EXPRESSION',
+                        help='Initial condition as an expression of the x and '
+                             'y coordinates. Unlike the coefficient '
+                             'functions, a bare x or y is the coordinate, not '
+                             'the U or V field.')
+    parser.add_argument('--save-every', default=None, type=int,
+                        dest='save_every', metavar='N',
+                        help='Save a snapshot every N steps. The last step is '
+                             'always saved.')
+    parser.add_argument('-P', '--dontplot', default=False, action='store_true',
+                        help='Do not create a contour plot of the final '
+                             'solution.')
+    parser.add_argument('--plot-file', default=None, metavar='FILE',
+                        help='Render the plot to this image file (e.g. PNG) '
+                             'without a display instead of showing it.')
+    parser.add_argument('--plot-style', default='contour',
+                        choices=('contour', 'color'),
+                        help='Plot filled contours (contour) or linearly '
+                             'interpolated colors (color).')
+    parser.add_argument('-S', '--dontsave', default=False, action='store_true',
+                        help='Do not save the final solution to a file.')
+    parser.add_argument('--quantities', default=None, metavar='FILE',
+                        help='Calculate the gradients, fluxes, boundary '
+                             'fluxes, integrals and error norms of the final '
+                             'solution and save them to this file: a JSON '
+                             'summary, or all arrays if it ends with .npz.')
+    parser.add_argument('-r', '--reader', default='stream',
+                        choices=('stream', 'json'),
+                        help='Stream the mesh arrays of the input directly '
+                             'into arrays (stream) or use json.load (json).')
+    parser.add_argument('-A', '--assembly', default='batch',
+                        choices=('batch', 'element'),
+                        help='Calculate elemental systems for all elements at '
+                             'once (batch) or element by element (element).')
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help='Number of worker processes for batch assembly. '
+                             '0 uses all available CPUs.')
+    parser.add_argument('-s', '--solver', default=None,
+                        choices=('direct', 'gmres', 'bicgstab', 'cg'),
+                        help='Linear solver, overriding the one in the input. '
+                             'Defaults to the direct solver.')
+    parser.add_argument('-p', '--precond', default=None,
+                        choices=('none', 'ilu', 'jacobi'),
+                        help='Preconditioner for the iterative solvers, '
+                             'built once for all steps.')
+    parser.add_argument('--tol', default=None, type=float,
+                        help='Relative tolerance for the iterative solvers.')
+    parser.add_argument('--maxiter', default=None, type=int,
+                        help='Iteration cap for the iterative solvers.')
+    parser.add_argument('-R', '--reorder', default='none',
+                        choices=('none',) + tuple(sorted(Orderings)),
+                        help='Renumber the nodes to reduce the bandwidth of '
+                             'the system before assembly.')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='Write a JSON report of the time, memory usage '
+                             'and statistics of each phase to this file.')
+    parser.add_argument('--cprofile', default=None, metavar='DIR',
+                        help='Run each phase under cProfile, writing the '
+                             'statistics to this directory.')
+    return parser
+
+
+def run(arguments):
+    """
+    Solves the transient problem given by the command line arguments,
+    streaming the snapshots and post processing the final solution. Returns
+    the problem data and the final solution.
+    """
+    import os
+    from time import time
+    from numpy import empty_like
+
+    import instrument
+    from instrument import phase, record
+
+    profiler = None
+    if arguments.profile or arguments.cprofile:
+        profiler = instrument.Profiler(arguments.cprofile)
+        instrument.activate(profiler)
+
+    try:
+        from psetup import read_problem_data, process_problem_data
+        from solveproc import post_process, get_solver_settings
+        from reorder import reorder, restore_order
+        from writers import Extensions, SnapshotWriter, get_format, \
+            check_format
+
+        if arguments.workers < 1:
+            from multiprocessing import cpu_count
+            arguments.workers = cpu_count()
+
+        with phase("read"):
+            problem_data = read_problem_data(arguments.input, arguments.output,
+                                             arguments.reader)
+        with phase("process"):
+            problem_data = process_problem_data(problem_data)
+        if arguments.format and not arguments.output:
+            # Default output names get the extension of the chosen format
+            problem_data["output"] = \
+                os.path.splitext(problem_data["output"])[0] + \
+                Extensions[arguments.format]
+        if not arguments.dontsave:
+            # Found before solving, not after it when the output is written
+            check_format(arguments.format or
+                         get_format(problem_data["output"]), problem_data)
+        snapshot_name = arguments.snapshots or os.path.splitext(
+            arguments.input or problem_data["output"]
+        )[0] + "_transient.npy"
+        if arguments.reorder != "none":
+            with phase("reorder"):
+                problem_data = reorder(problem_data, arguments.reorder)
+        solver_settings = get_solver_settings(problem_data, arguments)
+        settings = get_transient_settings(problem_data, arguments)
+        record(transient=settings)
+
+        t = time()
+        order = problem_data.get("node_order")
+        writer = SnapshotWriter(snapshot_name, get_snapshot_count(settings),
+                                problem_data["NN"])
+
+        def save_(step_time, solution):
+            # Snapshots are written in the node numbering of the input
+            snapshot = solution
+            if order is not None:
+                snapshot = empty_like(solution)
+                snapshot[order] = solution
+            writer.write(step_time, snapshot)
+
+        try:
+            # The first step is the initial condition, which is yielded
+            # after the system is assembled and factorized
+            steps = step_transient(problem_data, settings, solver_settings,
+                                   arguments.assembly, arguments.workers)
+            step, step_time, solution = next(steps)
+            save_(step_time, solution)
+            with phase("steps"):
+                for step, step_time, solution in steps:
+                    if step % settings["save_every"] == 0 or \
+                            step == settings["steps"]:
+                        save_(step_time, solution)
+        finally:
+            writer.close()
+        print(" * Snapshots written to {0}.".format(snapshot_name))
+
+        # Map the final solution and the mesh back to the node numbering of
+        # the input
+        final = restore_order(problem_data, solution)
+        t = time() - t
+        print("Total run time: {0} seconds.".format(t))
+
+        with phase("output"):
+            post_process(problem_data, final, arguments)
+
+        if profiler:
+            profiler.print_summary()
+            if arguments.profile:
+                profiler.save(arguments.profile)
+    finally:
+        if profiler:
+            instrument.activate(None)
+            profiler.stop()
+
+    return problem_data, final
+
+
+if __name__ == "__main__":
+    run(get_parser().parse_args())
@@ -0,0 +1,345 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides adaptive mesh refinement for meshes of linear triangles, which
+    meshes with linear quads are converted to before refinement. The
+    error of each element is estimated with the Zienkiewicz-Zhu gradient
+    recovery estimator, the elements with the largest errors are marked and
+    refined by longest edge bisection, and the problem is solved again,
+    starting from the previous solution, until the estimated error or the
+    element budget is reached.
+@version: 1.0
+"""
+
+from gsystem import calc_global, calc_gradients, calc_nodal_gradients
+from solveproc import solve_system
+
+
+def estimate_error(problem_data, solution):
+    """
+    Estimates the error of every element as the L2 norm of the difference of
+    the recovered (nodal averaged) gradient and the gradient of the solution.
+    Returns the squared errors of the elements and the relative error, which
+    is the total error divided by the L2 norm of the recovered gradient.
+    """
+    from numpy import einsum, asarray, sqrt
+
+    gradients, wdetJ = calc_gradients(problem_data, solution)
+    recovered = calc_nodal_gradients(problem_data, solution, gradients, wdetJ)
+    # Recovered gradients at the GQ points, interpolated from the nodes
+    recovered = einsum("gn,eni->egi", problem_data["ref"].S,
+                       recovered[asarray(problem_data["LtoG"])])
+
+    errors = einsum("eg,egi->e", wdetJ, (recovered - gradients) ** 2)
+    norm = einsum("eg,egi->", wdetJ, recovered ** 2)
+    return errors, sqrt(errors.sum() / norm) if norm else 0.
+
+
+def mark_elements(errors, fraction=.5):
+    """
+    Marks the smallest set of elements whose squared errors add up to the
+    given fraction of the total (Dorfler marking).
+    """
+    from numpy import argsort, cumsum, searchsorted, zeros
+
+    order = argsort(errors)[::-1]
+    count = searchsorted(cumsum(errors[order]), fraction * errors.sum()) + 1
+    marked = zeros(len(errors), dtype=bool)
+    marked[order[:count]] = True
+    return marked
+
+
+def bisect_edges(nodes, LtoG, edges, edge_index, marked):
+    """
+    Finds the edges to bisect to refine the marked triangles: their longest
+    edges and, to keep the mesh conforming, the longest edge of every element
+    with a bisected edge. edges and edge_index are given by psetup.get_edges.
+    Returns LtoG and edge_index with the elements rotated so that their
+    longest edge is edge 0, which keeps them counter-clockwise, and whether
+    each edge is bisected. An element with k bisected edges is split into
+    k + 1 children.
+    """
+    from numpy import arange, argmax, hypot, zeros, take_along_axis
+
+    # Rotate the elements so that their longest edge is edge 0
+    lengths = hypot(*(nodes[edges[:, 0]] - nodes[edges[:, 1]]).T)
+    rotation = argmax(lengths[edge_index], axis=1)
+    local = (arange(3)[None, :] + rotation[:, None]) % 3
+    LtoG = take_along_axis(LtoG, local, axis=1)
+    edge_index = take_along_axis(edge_index, local, axis=1)
+
+    # Bisect the longest edges of the marked elements, then of all elements
+    # with a bisected edge until the mesh is conforming
+    bisected = zeros(len(edges), dtype=bool)
+    bisected[edge_index[marked, 0]] = True
+    while True:
+        refined = bisected[edge_index].any(axis=1)
+        longest = edge_index[refined, 0]
+        if bisected[longest].all():
+            break
+        bisected[longest] = True
+    return LtoG, edge_index, bisected
+
+
+def limit_marked(problem_data, marked, errors, max_elements):
+    """
+    Unmarks the elements with the smallest errors until the refined mesh has
+    at most max_elements elements, counting the elements that are refined to
+    keep the mesh conforming. Returns the marked elements, which are none if
+    refining any element would exceed the budget.
+    """
+    from numpy import asarray, flatnonzero, zeros
+    from psetup import get_edges
+
+    nodes = asarray(problem_data["nodes"])
+    LtoG = asarray(problem_data["LtoG"])
+    edges, edge_index = get_edges(LtoG, 3)
+    order = flatnonzero(marked)
+    order = order[errors[order].argsort()[::-1]]
+
+    def count_(count):
+        subset = zeros(len(LtoG), dtype=bool)
+        subset[order[:count]] = True
+        _, indexes, bisected = bisect_edges(nodes, LtoG, edges,
+                                            edge_index, subset)
+        return len(LtoG) + int(bisected[indexes].sum()), subset
+
+    # The number of elements grows with the number of marked elements, so
+    # the largest number that fits is found by bisection
+    low, high = 0, len(order)
+    if count_(high)[0] <= max_elements:
+        return marked
+    while high - low > 1:
+        middle = (low + high) // 2
+        if count_(middle)[0] <= max_elements:
+            low = middle
+        else:
+            high = middle
+    return count_(low)[1]
+
+
+def refine(problem_data, marked, solution=None):
+    """
+    Refines the marked triangles by bisecting their longest edges. To keep
+    the mesh conforming, the longest edge of every element with a bisected
+    edge is bisected too, so that elements are split into 2, 3 or 4
+    children. nodes, LtoG, UV and the BC tables of the problem data are
+    updated. If a solution is given, it is interpolated to the new nodes and
+    returned, to start the next solution from.
+    """
+    from numpy import asarray, arange, concatenate, stack, flatnonzero, \
+        full, bincount, zeros, sort, searchsorted, nan, isnan
+    from psetup import get_edges
+
+    nodes = asarray(problem_data["nodes"])
+    LtoG = asarray(problem_data["LtoG"])
+    NN = len(nodes)
+    BCs = problem_data["BCs"]
+    edges, edge_index = get_edges(LtoG, 3)
+    is_boundary = bincount(edge_index.ravel(), minlength=len(edges)) == 1
+
+    # Nodes and edges of the NBC and MBC faces, to find them again in the
+    # refined mesh
+    faces = {}
+    for BC_type in ("NBC", "MBC"):
+        table = BCs[BC_type]
+        faces[BC_type] = (
+            stack((LtoG[table["element"], table["face"]],
+                   LtoG[table["element"], (table["face"] + 1) % 3]), axis=1),
+            edge_index[table["element"], table["face"]]
+        )
+
+    LtoG, edge_index, bisected = bisect_edges(nodes, LtoG, edges, edge_index,
+                                              marked)
+    refined = bisected[edge_index].any(axis=1)
+
+    new_edges = flatnonzero(bisected)
+    midpoint = full(len(edges), -1, dtype="int64")
+    midpoint[new_edges] = NN + arange(len(new_edges))
+    mid_edges = edges[new_edges]
+
+    # Edge 0 is bisected for all refined elements. The halves are split again
+    # if edge 1 or edge 2 is also bisected.
+    v0, v1, v2 = LtoG.T
+    m0, m1, m2 = midpoint[edge_index].T
+    children = [LtoG[~refined]]
+    for condition, child in (
+            (refined & (m2 < 0), (v0, m0, v2)),
+            (refined & (m2 >= 0), (v0, m0, m2)),
+            (refined & (m2 >= 0), (m2, m0, v2)),
+            (refined & (m1 < 0), (m0, v1, v2)),
+            (refined & (m1 >= 0), (m0, v1, m1)),
+            (refined & (m1 >= 0), (m0, m1, v2))):
+        children.append(stack([node[condition] for node in child], axis=1))
+    LtoG = concatenate(children).astype("int32")
+    new_NN = NN + len(new_edges)
+
+    problem_data["nodes"] = concatenate((nodes,
+                                         nodes[mid_edges].mean(axis=1)))
+    if problem_data.get("UV") is not None:
+        UV = asarray(problem_data["UV"])
+        problem_data["UV"] = concatenate(
+            (UV, UV[:, mid_edges].mean(axis=2)), axis=1
+        )
+    problem_data["LtoG"] = LtoG
+    problem_data["NN"] = new_NN
+    problem_data["NE"] = len(LtoG)
+    if solution is not None:
+        solution = asarray(solution).ravel()
+        solution = concatenate((solution, solution[mid_edges].mean(axis=1)))
+
+    # Midpoints of boundary edges between two EBC nodes are EBC nodes with
+    # the mean value
+    EBC = BCs["EBC"] = dict(BCs["EBC"])
+    EBC_values = full(NN, nan)
+    EBC_values[EBC["node"]] = EBC["data"][:, 0]
+    mid_values = EBC_values[mid_edges].mean(axis=1)
+    on_EBC = is_boundary[new_edges] & ~isnan(mid_values)
+    EBC_data = zeros((on_EBC.sum(), 2))
+    EBC_data[:, 0] = mid_values[on_EBC]
+    EBC["node"] = concatenate(
+        (EBC["node"], NN + flatnonzero(on_EBC))
+    ).astype("int32")
+    EBC["data"] = concatenate((EBC["data"], EBC_data))
+
+    # Bisected faces are replaced by their halves, then all faces are found
+    # by their nodes among the faces of the refined mesh
+    all_faces = sort(stack((LtoG, LtoG[:, [1, 2, 0]]), axis=2), axis=2)
+    face_keys = (all_faces[..., 0].astype("int64") * new_NN +
+                 all_faces[..., 1]).ravel()
+    face_order = face_keys.argsort()
+
+    for BC_type, (pairs, face_edges) in faces.items():
+        table = BCs[BC_type] = dict(BCs[BC_type])
+        halves = midpoint[face_edges]
+        split = halves >= 0
+        pairs = sort(concatenate((
+            pairs[~split],
+            stack((pairs[split, 0], halves[split]), axis=1),
+            stack((halves[split], pairs[split, 1]), axis=1)
+        )), axis=1)
+        keys = pairs[:, 0].astype("int64") * new_NN + pairs[:, 1]
+        found = face_order[searchsorted(face_keys, keys, sorter=face_order)]
+        table["element"] = (found // 3).astype("int32")
+        table["face"] = (found % 3).astype("int32")
+        table["data"] = concatenate((table["data"][~split],
+                                     table["data"][split],
+                                     table["data"][split]))
+
+    return problem_data, solution
+
+
+def split_quads(problem_data, NGP=3):
+    """
+    Converts a mesh of linear quads, or of linear triangles and quads, into
+    linear triangles by splitting every quad along its 0-2 diagonal. Faces 0
+    and 1 of a quad are faces 0 and 1 of its first triangle, faces 2 and 3
+    are faces 1 and 2 of the second one. Triangles are numbered first, then
+    the first and the second triangles of the quads.
+    """
+    from numpy import asarray, concatenate, array, flatnonzero, empty, \
+        arange, where
+    from psetup import get_ref_element, get_element_widths
+
+    LtoG = asarray(problem_data["LtoG"])
+    widths = get_element_widths(LtoG)
+    triangles = flatnonzero(widths == 3)
+    quads = flatnonzero(widths == 4)
+    first = empty(len(LtoG), dtype="int32")
+    first[triangles] = arange(len(triangles))
+    first[quads] = len(triangles) + arange(len(quads))
+
+    problem_data["LtoG"] = concatenate((LtoG[triangles, :3],
+                                        LtoG[quads][:, [0, 1, 2]],
+                                        LtoG[quads][:, [0, 2, 3]]))
+    problem_data["LtoG"] = problem_data["LtoG"].astype("int32")
+    problem_data["NE"] = len(problem_data["LtoG"])
+    problem_data["eType"] = "tri"
+    problem_data["NEN"] = 3
+    problem_data["NGP"] = NGP
+    problem_data["ref"] = get_ref_element("tri", 3, NGP)
+
+    second = array([0, 0, 1, 1])
+    faces = array([0, 1, 1, 2])
+    for BC_type in ("NBC", "MBC"):
+        table = problem_data["BCs"][BC_type] = \
+            dict(problem_data["BCs"][BC_type])
+        element = table["element"]
+        face = table["face"]
+        is_quad = widths[element] == 4
+        table["element"] = (first[element] + where(
+            is_quad, len(quads) * second[face % 4], 0
+        )).astype("int32")
+        table["face"] = where(is_quad, faces[face % 4], face).astype("int32")
+
+    return problem_data
+
+
+def solve_adaptive(problem_data, settings, tol=1e-2, max_elements=None,
+                   max_iterations=10, fraction=.5, workers=1,
+                   ebc_method="row"):
+    """
+    Solves the processed problem on adaptively refined meshes, until the
+    estimated relative error is below tol, no more elements can be refined
+    without the mesh having more than max_elements elements or
+    max_iterations refinements are done. Every solution starts from the
+    previous one when an iterative solver is used. Returns the solution on
+    the final mesh, which is kept in the problem data, and the history of
+    the refinement.
+    """
+    from numpy import asarray
+
+    BCs = problem_data["BCs"]
+    problem_data["BCs"] = dict((BC_type, dict(table))
+                               for BC_type, table in BCs.items())
+
+    element = (problem_data["eType"], problem_data["NEN"])
+    if element in (("quad", 4), ("mixed", 4)):
+        print("Splitting quads into triangles for refinement...")
+        problem_data = split_quads(problem_data)
+    elif element != ("tri", 3):
+        raise ValueError("Adaptive refinement is only supported for linear "
+                         "elements.")
+    history = []
+    x0 = None
+    iteration = 0
+    while True:
+        print("Adaptive iteration {0}: {1} elements, {2} nodes".format(
+            iteration, len(problem_data["LtoG"]), len(problem_data["nodes"])
+        ))
+        # calc_global drops the functions and BCs of the problem data it is
+        # given, which are still needed here
+        K, F = calc_global(dict(problem_data), "batch", workers,
+                           ebc_method=ebc_method)
+        settings["x0"] = x0
+        solution = solve_system(K, F, settings)
+        del K, F
+
+        errors, error = estimate_error(problem_data, solution)
+        report = settings["report"]
+        history.append({
+            "NE": len(problem_data["LtoG"]),
+            "NN": len(problem_data["nodes"]),
+            "error": float(error),
+            "iterations": report.get("iterations"),
+            "time": report["time"]
+        })
+        print(" * Estimated relative error: {0:.4e}".format(error))
+
+        if error <= tol or iteration >= max_iterations or (
+                max_elements and len(problem_data["LtoG"]) >= max_elements):
+            break
+
+        marked = mark_elements(errors, fraction)
+        if max_elements:
+            marked = limit_marked(problem_data, marked, errors, max_elements)
+            if not marked.any():
+                print(" * Refining any element would exceed the budget of "
+                      "{0} elements.".format(max_elements))
+                break
+        problem_data, x0 = refine(problem_data, marked, solution)
+        iteration += 1
+
+    settings.pop("x0", None)
+    return asarray(solution), history
@@ -0,0 +1,299 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Benchmarks the solver on generated problems of growing size for all
+    element types, timing reading, processing, assembly, BC application,
+    solving and output separately. Every case runs in a fresh process so that
+    its peak memory is not affected by the others. Results are saved as JSON
+    and can be compared with an earlier run:
+        python benchmark.py -e tri3 quad4 -n 1000 10000 -o new.json
+        python benchmark.py -e tri3 quad4 -n 1000 10000 --compare old.json
+@version: 1.0
+"""
+
+import os
+
+# Version of the results format
+RESULTS_VERSION = 1
+
+DefaultSizes = (1000, 10000, 100000, 1000000)
+
+# Phases that are reported, in pipeline order
+Phases = ("read", "process", "reorder", "assembly.kernels",
+          "assembly.triplets", "assembly.csr", "assembly.bc", "solve",
+          "output")
+
+
+def get_environment():
+    """
+    Describes the machine and the library versions the benchmark runs with.
+    """
+    import platform
+    from multiprocessing import cpu_count
+    import numpy
+    import scipy
+
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "scipy": scipy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": cpu_count()
+    }
+
+
+def run_case(case, arguments):
+    """
+    Generates the problem of a case, writes it to a file and runs the whole
+    pipeline on it under a profiler. Returns the profiler report.
+    """
+    import tempfile
+    import shutil
+
+    import instrument
+    from instrument import phase
+    from meshgen import generate_problem, write_problem
+    from psetup import read_problem_data, process_problem_data
+    from gsystem import calc_global
+    from reorder import reorder, restore_order
+    from solveproc import solve_system, save_solution, get_solver_settings
+    from writers import Extensions
+
+    work_dir = tempfile.mkdtemp(prefix="benchmark")
+    try:
+        input_name = os.path.join(work_dir, "problem." + arguments.format)
+        output_name = os.path.join(
+            work_dir, "problem_output" + Extensions[arguments.output_format]
+        )
+        write_problem(generate_problem(case["eType"], case["NEN"], case["NE"],
+                                       case["mesh"], arguments.seed),
+                      input_name)
+
+        profiler = instrument.Profiler()
+        instrument.activate(profiler)
+        with phase("read"):
+            problem_data = read_problem_data(input_name, output_name)
+        with phase("process"):
+            problem_data = process_problem_data(problem_data)
+        if arguments.reorder != "none":
+            with phase("reorder"):
+                problem_data = reorder(problem_data, arguments.reorder)
+        settings = get_solver_settings(problem_data, arguments)
+        with phase("assembly"):
+            K, F = calc_global(problem_data, "batch", arguments.workers,
+                               ebc_method=arguments.ebc)
+        with phase("solve"):
+            solution = solve_system(K, F, settings)
+        with phase("output"):
+            solution = restore_order(problem_data, solution)
+            save_solution(problem_data["output"], solution, problem_data)
+        instrument.activate(None)
+        profiler.stop()
+
+        report = profiler.get_report()
+        report["stats"]["solver"] = settings["report"]
+        return report
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_isolated(case, arguments):
+    """
+    Runs a case in a new process, so that the memory used by the earlier
+    cases does not show up in its peak.
+    """
+    import multiprocessing
+
+    try:
+        context = multiprocessing.get_context("fork")
+    except (AttributeError, ValueError):
+        context = multiprocessing
+    pool = context.Pool(1)
+    try:
+        return pool.apply(run_case, (case, arguments))
+    finally:
+        pool.terminate()
+
+
+def summarize(case, reports):
+    """
+    Reduces the reports of the repeats of a case to one result, taking the
+    fastest time of each phase.
+    """
+    times = {}
+    for report in reports:
+        for info in report["phases"]:
+            if info["name"] in Phases:
+                times[info["name"]] = min(times.get(info["name"], info["time"]),
+                                          info["time"])
+    stats = reports[0]["stats"]
+    solver = stats["solver"]
+    return dict(case, **{
+        "NN": stats["NN"],
+        "nnz": stats.get("nnz"),
+        "bandwidth": stats.get("bandwidth_after"),
+        "elements_per_second": max(report["stats"]["elements_per_second"]
+                                   for report in reports),
+        "times": times,
+        "total_time": sum(times.values()),
+        "peak_rss": max(report["peak_rss"] for report in reports),
+        "solver": dict((key, solver.get(key)) for key in
+                       ("method", "preconditioner", "iterations",
+                        "residual", "converged", "fill_in"))
+    })
+
+
+def get_case_name(case):
+    return "{eType}{NEN}-{mesh}-{NE}".format(**case)
+
+
+def print_result(result, baseline=None):
+    """
+    Prints the phase times of a result, along with the ratio of the baseline
+    time to the new one for each phase if a baseline result is given.
+    """
+    print("{0}: {1} elements, {2} nodes, {3:.1f} MB peak".format(
+        result["name"], result["elements"], result["NN"],
+        result["peak_rss"] / 1048576.
+    ))
+    for name in Phases + ("total",):
+        time = result["total_time"] if name == "total" else \
+            result["times"].get(name)
+        if time is None:
+            continue
+        line = " * {0:<20} {1:10.4f} s".format(name, time)
+        if baseline:
+            old_time = baseline["total_time"] if name == "total" else \
+                baseline["times"].get(name)
+            if old_time:
+                line += " {0:8.2f}x".format(old_time / max(time, 1e-9))
+        print(line)
+
+
+def load_results(file_name):
+    from json import load
+
+    with open(file_name) as input_file:
+        results = load(input_file)
+    if results.get("version", 0) > RESULTS_VERSION:
+        raise ValueError("Unsupported benchmark results version.")
+    return results
+
+
+def save_results(file_name, results):
+    from json import dump
+
+    with open(file_name, "w") as output_file:
+        dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from meshgen import get_element_names
+
+    element_names = get_element_names()
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the solver on generated problems.'
+    )
+    parser.add_argument('-e', '--elements', nargs='+',
+                        default=sorted(element_names),
+                        choices=sorted(element_names),
+                        help='Element types to benchmark. Defaults to all.')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int,
+                        default=list(DefaultSizes),
+                        help='Approximate numbers of elements.')
+    parser.add_argument('-m', '--meshes', nargs='+',
+                        default=['structured', 'unstructured'],
+                        choices=('structured', 'unstructured'),
+                        help='Kinds of meshes to benchmark.')
+    parser.add_argument('-f', '--format', default='fpb',
+                        choices=('json', 'fpb'),
+                        help='Format of the generated problem files.')
+    parser.add_argument('-O', '--output-format', default='json',
+                        choices=('json', 'raw', 'npy', 'npz', 'vtk', 'xdmf'),
+                        help='Format of the solution files.')
+    parser.add_argument('-r', '--repeat', default=1, type=int,
+                        help='Number of runs of each case. The fastest time '
+                             'of each phase is reported.')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='Random seed of unstructured meshes.')
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help='Number of worker processes for assembly.')
+    parser.add_argument('-E', '--ebc', default='row',
+                        choices=('row', 'symmetric'),
+                        help='EBC application method.')
+    parser.add_argument('-R', '--reorder', default='none',
+                        choices=('none', 'rcm'),
+                        help='Node renumbering before assembly.')
+    parser.add_argument('-s', '--solver', default=None,
+                        choices=('direct', 'gmres', 'bicgstab', 'cg'),
+                        help='Linear solver. Defaults to the direct solver.')
+    parser.add_argument('-p', '--precond', default=None,
+                        choices=('none', 'ilu', 'jacobi'),
+                        help='Preconditioner for the iterative solvers.')
+    parser.add_argument('--tol', default=None, type=float,
+                        help='Relative tolerance for the iterative solvers.')
+    parser.add_argument('--maxiter', default=None, type=int,
+                        help='Iteration cap for the iterative solvers.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the results to this JSON file.')
+    parser.add_argument('-c', '--compare', default=None, metavar='FILE',
+                        help='Compare the results with the ones in this '
+                             'file.')
+    arguments = parser.parse_args()
+
+    baseline = {}
+    if arguments.compare:
+        baseline = dict((result["name"], result) for result in
+                        load_results(arguments.compare)["results"])
+
+    results = {
+        "version": RESULTS_VERSION,
+        "environment": get_environment(),
+        "settings": {
+            "format": arguments.format,
+            "output_format": arguments.output_format,
+            "repeat": arguments.repeat,
+            "workers": arguments.workers,
+            "ebc": arguments.ebc,
+            "reorder": arguments.reorder,
+            "solver": arguments.solver or "direct",
+            "precond": arguments.precond
+        },
+        "results": []
+    }
+
+    for element in arguments.elements:
+        eType, NEN = element_names[element]
+        for mesh in arguments.meshes:
+            # Mixed meshes are only generated as structured meshes
+            if eType == "mixed" and mesh != "structured":
+                continue
+            for NE in arguments.sizes:
+                case = {"eType": eType, "NEN": NEN, "mesh": mesh, "NE": NE}
+                name = get_case_name(case)
+                print("Running {0}...".format(name))
+                sys.stdout.flush()
+
+                # The pipeline's own progress messages are not needed here
+                with open(os.devnull, "w") as devnull:
+                    stdout = sys.stdout
+                    sys.stdout = devnull
+                    try:
+                        reports = [run_isolated(case, arguments)
+                                   for _ in range(arguments.repeat)]
+                    finally:
+                        sys.stdout = stdout
+
+                result = summarize(case, reports)
+                result["name"] = name
+                result["elements"] = reports[0]["stats"]["NE"]
+                results["results"].append(result)
+                print_result(result, baseline.get(name))
+
+                if arguments.output:
+                    save_results(arguments.output, results)
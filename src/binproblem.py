@@ -0,0 +1,169 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides a binary problem file format that can be loaded without parsing
+    by memory-mapping its arrays, and a converter from JSON problem files.
+
+    A binary problem file starts with a magic string and the length of a JSON
+    header. The header has the scalar problem data (title, eType, NEN, NGP,
+    functions etc.) and the dtype, shape and offset of every array. The arrays
+    (nodes, LtoG, UV and the BC tables) follow as raw little-endian data,
+    each aligned to 64 bytes.
+
+    Running this module converts a JSON problem file:
+        python binproblem.py Sample.json [-o Sample.fpb]
+@version: 1.0
+"""
+
+from json import dumps as json_dumps, loads as json_loads
+import struct
+
+from psetup import BCFields, process_bcs
+
+MAGIC = b"FEMPYBIN"
+VERSION = 1
+EXTENSION = ".fpb"
+ALIGNMENT = 64
+
+# Array keys of the problem data and the dtypes they are stored with
+ArrayTypes = {
+    "nodes": "<f8",
+    "LtoG": "<i4",
+    "UV": "<f8"
+}
+
+
+def get_padding(position):
+    return (-position) % ALIGNMENT
+
+
+def get_arrays(problem_data):
+    """
+    Collects the arrays to be stored from the problem data, including the
+    columns of the BC tables.
+    """
+    from numpy import asarray
+
+    arrays = {}
+    for key, dtype in ArrayTypes.items():
+        if problem_data.get(key) is not None:
+            arrays[key] = asarray(problem_data[key], dtype=dtype)
+
+    # The fields of the BC tables are stored as arrays named like "EBC.node"
+    BCs = process_bcs(problem_data.get("BCs"))
+    for BC_type, fields in BCFields.items():
+        for field, dtype in fields:
+            arrays[BC_type + "." + field] = BCs[BC_type][field]
+
+    return arrays
+
+
+def write_binary(problem_data, file_name):
+    """
+    Writes the raw problem data, as read from a JSON file, in binary format.
+    """
+
+    arrays = get_arrays(problem_data)
+    header = dict((key, value) for key, value in problem_data.items()
+                  if key not in ArrayTypes and key != "BCs")
+    # Outputs default to the name of the input file, which changes here
+    header.pop("output", None)
+
+    # Arrays are placed after the header, which has their offsets, so the
+    # header is regenerated until its length settles
+    relative_offsets = {}
+    position = 0
+    for name in sorted(arrays):
+        relative_offsets[name] = position
+        position += arrays[name].nbytes
+        position += get_padding(position)
+
+    header["arrays"] = dict(
+        (name, {"dtype": array.dtype.str, "shape": list(array.shape)})
+        for name, array in arrays.items()
+    )
+    start = 0
+    while True:
+        for name, offset in relative_offsets.items():
+            header["arrays"][name]["offset"] = start + offset
+        header_bytes = json_dumps(header).encode("utf-8")
+        end = len(MAGIC) + 12 + len(header_bytes)
+        if end <= start:
+            break
+        start = end + get_padding(end)
+    header_bytes += b" " * (start - end)
+
+    with open(file_name, "wb") as output_file:
+        output_file.write(MAGIC)
+        output_file.write(struct.pack("<IQ", VERSION, len(header_bytes)))
+        output_file.write(header_bytes)
+        for name in sorted(arrays):
+            output_file.seek(header["arrays"][name]["offset"])
+            arrays[name].tofile(output_file)
+
+
+def read_binary(file_name):
+    """
+    Reads a problem file in binary format. The arrays are memory-mapped as
+    read-only, so they are only loaded from the disk as they are used.
+    """
+    from numpy import memmap, zeros, dtype as numpy_dtype
+
+    with open(file_name, "rb") as input_file:
+        if input_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{0} is not a binary problem file.".format(
+                file_name
+            ))
+        version, header_length = struct.unpack("<IQ", input_file.read(12))
+        if version > VERSION:
+            raise ValueError("Unsupported binary problem file version.")
+        header = input_file.read(header_length).decode("utf-8")
+        problem_data = json_loads(header)
+
+    arrays = {}
+    for name, info in problem_data.pop("arrays").items():
+        shape = tuple(info["shape"])
+        if 0 in shape:
+            # Empty arrays cannot be memory-mapped
+            arrays[name] = zeros(shape, dtype=info["dtype"])
+        else:
+            arrays[name] = memmap(file_name, dtype=numpy_dtype(info["dtype"]),
+                                  mode="r", offset=info["offset"], shape=shape)
+
+    for key in ArrayTypes:
+        problem_data[key] = arrays.get(key)
+
+    problem_data["BCs"] = dict(
+        (BC_type, dict((field, arrays[BC_type + "." + field])
+                       for field, dtype in fields))
+        for BC_type, fields in BCFields.items()
+    )
+
+    return problem_data
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from psetup import read_json
+
+    parser = argparse.ArgumentParser(
+        description='Converts JSON problem files to the binary problem format.'
+    )
+    parser.add_argument('inputs', nargs='+', help='JSON problem files.')
+    parser.add_argument('-o', '--output', default='',
+                        help='Output file path, only for a single input. '
+                             'Defaults to the input path with {0} '
+                             'extension.'.format(EXTENSION))
+    arguments = parser.parse_args()
+
+    if arguments.output and len(arguments.inputs) > 1:
+        parser.error("--output can only be used with a single input.")
+
+    for input_name in arguments.inputs:
+        output_name = arguments.output or \
+            os.path.splitext(input_name)[0] + EXTENSION
+        print("Converting {0} to {1}...".format(input_name, output_name))
+        write_binary(read_json(input_name), output_name)
@@ -7,21 +7,67 @@
 @version: 1.1
 """
 
-from numpy import array, zeros, linalg, matrix
-from scipy import sparse
-from math import sqrt
+from numpy import zeros, linalg, matrix, asarray, einsum, empty_like, \
+    repeat, tile, bincount, concatenate, arange, diff, flatnonzero, hypot, \
+    take_along_axis, add
 
-global NEN, NEN_range, functions, a, V1, V2, c, f, shape_funcs
+from instrument import phase, record
+
+add_at = add.at
+
+global NEN, NEN_range, functions, a, V1, V2, c, f, ref, assembly_data, \
+    assembly_groups
+
+# Version of the calculation of K. It is a part of the operator keys, so that
+# cached factorizations of K are invalidated when the calculation changes.
+OPERATOR_VERSION = 3
+
+# Number of elements whose elemental systems are calculated together in batch
+# mode. It is fixed, not derived from the number of workers, so that the
+# results are the same for any number of workers.
+BATCH_SIZE = 8192
 
 
 def get_element_coords(problem_data, e_nodes):
     """
     Calculates elemental coordinates that are needed both in elemental and
-    global system calculations.
+    global system calculations. If e_nodes is a 2D array of element node
+    lists, an (NE, NEN, 2) stack of elemental coordinates is returned.
+    """
+    return asarray(problem_data["nodes"], dtype=float)[asarray(e_nodes)]
+
+
+def calc_elem_geometry(e_coords, S, DS):
+    """
+    Calculates the Jacobian determinants, the global derivatives of the shape
+    functions and the global coordinates at every GQ point of a stack of
+    elements with the same type and order.
+    Returns detJ as (NE, NGP), gDS as (NE, NGP, 2, NEN) and x, y as (NE, NGP).
+    """
+    Jacob = einsum("gin,enj->egij", DS, e_coords)
+    detJ = Jacob[..., 0, 0] * Jacob[..., 1, 1] - \
+        Jacob[..., 0, 1] * Jacob[..., 1, 0]
+
+    invJacob = empty_like(Jacob)
+    invJacob[..., 0, 0] = Jacob[..., 1, 1] / detJ
+    invJacob[..., 0, 1] = -Jacob[..., 0, 1] / detJ
+    invJacob[..., 1, 0] = -Jacob[..., 1, 0] / detJ
+    invJacob[..., 1, 1] = Jacob[..., 0, 0] / detJ
+    gDS = einsum("egij,gjn->egin", invJacob, DS)
+
+    xy = einsum("gn,enj->egj", S, e_coords)
+    return detJ, gDS, xy[..., 0], xy[..., 1]
+
+
+def eval_coefficient(func, problem_data, e_nodes, S, x, y):
+    """
+    Evaluates a coefficient function at the GQ points of the elements. Nodal
+    fields of the problem are interpolated directly with the shape functions
+    S, other functions are evaluated at the global coordinates x and y.
     """
-    def get_node_coords_(node_no):
-        return array(problem_data["nodes"][node_no])
-    return array(map(get_node_coords_, e_nodes))
+    if func.component is None:
+        return func(x, y)
+    return asarray(problem_data["UV"][func.component])[e_nodes].dot(S.T)
 
 
 def calc_elem(problem_data, e_nodes):
@@ -32,22 +78,11 @@ def calc_elem(problem_data, e_nodes):
     # Initializing elemental values
     Fe = zeros((NEN, 1))
     Ke = zeros((NEN, NEN))
-    Se = [0] * NEN
-    DKe = [0] * NEN
-    DEe = [0] * NEN
 
     e_coord = get_element_coords(problem_data, e_nodes)
 
-    for GQ_info in problem_data["GQ"]:
-        ksi = GQ_info["coord"][0]
-        eta = GQ_info["coord"][1]
-
-        for k, shape_func in enumerate(shape_funcs):
-            Se[k] = shape_func["main"](ksi, eta)
-            DKe[k] = shape_func["dKsi"](ksi, eta)
-            DEe[k] = shape_func["dEta"](ksi, eta)
-
-        DS = matrix((DKe, DEe))
+    for Se, DS, weight in zip(ref.S, ref.DS, ref.weights):
+        DS = matrix(DS)
         Jacob = DS * matrix(e_coord)
         invJacob = linalg.inv(Jacob)
         detJ = linalg.det(Jacob)
@@ -59,29 +94,226 @@ def calc_elem(problem_data, e_nodes):
             x += Se[i] * coord[0]
             y += Se[i] * coord[1]
 
+        # Coefficient values at the GQ point
+        a_GP, V1_GP, V2_GP, c_GP, f_GP = [
+            eval_coefficient(func, problem_data, e_nodes, Se, x, y)
+            for func in (a, V1, V2, c, f)
+        ]
+
         # Main loop for elemental K calculation
         for i in NEN_range:
-            weight = GQ_info["weight"]
-            Fe[i] = Fe[i] + Se[i] * f(x, y) * detJ * weight
+            Fe[i] = Fe[i] + Se[i] * f_GP * detJ * weight
             for j in NEN_range:
-                Ke[i][j] += (a(x, y) * (gDS[0, i] * gDS[0, j] + gDS[1, i] * gDS[1, j]) + Se[i] * (V1(x, y) * gDS[0, j] + V2(x, y) * gDS[1, j]) + c(x, y) * Se[i] * Se[j]) * detJ * weight
+                Ke[i][j] += (a_GP * (gDS[0, i] * gDS[0, j] + gDS[1, i] * gDS[1, j]) + Se[i] * (V1_GP * gDS[0, j] + V2_GP * gDS[1, j]) + c_GP * Se[i] * Se[j]) * detJ * weight
+
+    return Ke, Fe
+
+
+def calc_elem_batch(problem_data, e_ref, e_nodes, rhs_only=False):
+    """
+    Calculates the elemental systems of a batch of elements with the same type
+    and order at once using array operations instead of looping over elements
+    and GQ points. e_ref is the reference element of the elements. Returns
+    (NE, NEN, NEN) and (NE, NEN) stacks of Ke and Fe. If rhs_only is set,
+    only Fe is calculated and Ke is None.
+    """
+
+    S = e_ref.S
+    e_coords = get_element_coords(problem_data, e_nodes)
+    detJ, gDS, x, y = calc_elem_geometry(e_coords, S, e_ref.DS)
+    wdetJ = detJ * e_ref.weights
+
+    def eval_(func):
+        return eval_coefficient(func, problem_data, e_nodes, S, x, y)
+
+    if f.constant == 0:
+        Fe = zeros(e_coords.shape[:2])
+    else:
+        Fe = einsum("eg,gn->en", eval_(f) * wdetJ, S)
+
+    if rhs_only:
+        return None, Fe
+
+    # Diffusion term
+    Ke = einsum("eg,egin,egim->enm", eval_(a) * wdetJ, gDS, gDS)
+    # Advection term, skipped if there is no flow
+    if V1.constant != 0 or V2.constant != 0:
+        adv = eval_(V1)[..., None] * gDS[:, :, 0, :] + \
+            eval_(V2)[..., None] * gDS[:, :, 1, :]
+        Ke += einsum("eg,gn,egm->enm", wdetJ, S, adv)
+    # Reaction term, skipped if there is no reaction
+    if c.constant != 0:
+        Ke += einsum("eg,gn,gm->enm", eval_(c) * wdetJ, S, S)
 
     return Ke, Fe
 
 
-def calc_global(problem_data):
+def calc_elem_range(bounds):
+    """
+    Calculates the elemental systems of the elements in the [start, stop)
+    range of an element group of the problem being assembled. This is the
+    unit of work of both serial and parallel batch assembly.
+    """
+    group, start, stop, rhs_only = bounds
+    e_ref, elements, e_nodes = assembly_groups[group]
+    return calc_elem_batch(assembly_data, e_ref,
+                           asarray(e_nodes[start:stop]), rhs_only)
+
+
+def get_group_nodes(problem_data):
+    """
+    Returns the reference element, the element indexes and the element nodes
+    of each group of elements with the same type and number of nodes. See
+    psetup.get_element_groups; meshes of a single type have one group.
+    """
+    from psetup import get_element_groups
+
+    LtoG = asarray(problem_data["LtoG"])
+    return [(group.ref, group.elements, LtoG[group.elements, :group.ref.NEN])
+            for group in get_element_groups(problem_data)]
+
+
+def join(arrays):
+    """
+    Concatenates the arrays of element groups, without copying a single one.
+    """
+    return arrays[0] if len(arrays) == 1 else concatenate(arrays)
+
+
+def calc_gradients(problem_data, solution):
+    """
+    Calculates the gradient of the solution at the GQ points of all elements,
+    in batches of elements. Returns the gradients as (NE, NGP, 2) and the GQ
+    weights multiplied by the Jacobian determinants as (NE, NGP), which
+    integrate over the elements. For mixed meshes, NGP is the largest number
+    of GQ points of the element groups and the extra points of the other
+    elements have zero weights.
+    """
+    solution = asarray(solution).ravel()
+    groups = get_group_nodes(problem_data)
+    NE = len(problem_data["LtoG"])
+    NGP = max(e_ref.NGP for e_ref, elements, e_nodes in groups)
+    gradients = zeros((NE, NGP, 2))
+    wdetJ = zeros((NE, NGP))
+    for e_ref, elements, e_nodes in groups:
+        indexes = arange(NE)[elements]
+        for start in range(0, len(e_nodes), BATCH_SIZE):
+            batch = asarray(e_nodes[start:start + BATCH_SIZE])
+            rows = indexes[start:start + BATCH_SIZE]
+            e_coords = get_element_coords(problem_data, batch)
+            detJ, gDS, x, y = calc_elem_geometry(e_coords, e_ref.S, e_ref.DS)
+            gradients[rows, :e_ref.NGP] = einsum("egin,en->egi", gDS,
+                                                 solution[batch])
+            wdetJ[rows, :e_ref.NGP] = detJ * e_ref.weights
+    return gradients, wdetJ
+
+
+def calc_nodal_gradients(problem_data, solution, gradients=None, wdetJ=None):
+    """
+    Recovers a continuous gradient field by averaging the mean gradients of
+    the elements around each node, weighted by the element areas. The
+    gradients from calc_gradients can be passed if they are already
+    calculated. Returns (NN, 2) gradients.
+    """
+    if gradients is None:
+        gradients, wdetJ = calc_gradients(problem_data, solution)
+    NN = len(problem_data["nodes"])
+
+    # Area times the mean gradient is the integral of the gradient
+    areas = wdetJ.sum(axis=1)
+    integrals = einsum("eg,egi->ei", wdetJ, gradients)
+    node_areas = zeros(NN)
+    nodal = zeros((NN, 2))
+    for e_ref, elements, e_nodes in get_group_nodes(problem_data):
+        e_nodes = e_nodes.ravel()
+        node_areas += bincount(e_nodes, minlength=NN,
+                               weights=repeat(areas[elements], e_ref.NEN))
+        for i in range(2):
+            nodal[:, i] += bincount(
+                e_nodes, minlength=NN,
+                weights=repeat(integrals[elements, i], e_ref.NEN)
+            )
+    return nodal / node_areas[:, None]
+
+
+def get_pool(workers):
+    """
+    Creates a pool of worker processes. The workers are forked so that they
+    inherit the module state set up before the pool is created. Where forking
+    is not available, threads are used instead since NumPy releases the GIL
+    in the kernels.
+    """
+    import multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    try:
+        return multiprocessing.get_context("fork").Pool(workers)
+    except (AttributeError, ValueError):
+        if hasattr(multiprocessing, "get_context"):
+            return ThreadPool(workers)
+        # Python 2 always forks on POSIX systems
+        return multiprocessing.Pool(workers)
+
+
+def map_parallel(func, items, workers):
+    """
+    Maps func over items using a pool of worker processes, preserving the
+    order of the results. See get_pool for how the workers are created.
+    """
+    pool = get_pool(workers)
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def calc_mass(problem_data, pattern=None):
+    """
+    Calculates the global mass matrix, the integrals of the products of the
+    shape functions, in CSR format. If the sparsity pattern K is assembled
+    with is given, the mass matrix has the same structure as K, so that the
+    two can be combined through their data arrays.
+    """
+    print("Calculating mass matrix...")
+
+    groups = get_group_nodes(problem_data)
+    Me_all = []
+    with phase("mass"):
+        for e_ref, elements, e_nodes in groups:
+            Me_group = []
+            for start in range(0, len(e_nodes), BATCH_SIZE):
+                batch = asarray(e_nodes[start:start + BATCH_SIZE])
+                e_coords = get_element_coords(problem_data, batch)
+                detJ = calc_elem_geometry(e_coords, e_ref.S, e_ref.DS)[0]
+                Me_group.append(einsum("eg,gn,gm->enm", detJ * e_ref.weights,
+                                       e_ref.S, e_ref.S))
+            Me_all.append(join(Me_group))
+        M, F = assemble([e_nodes for e_ref, elements, e_nodes in groups],
+                        Me_all, [zeros(e_nodes.shape)
+                                 for e_ref, elements, e_nodes in groups],
+                        problem_data["NN"], pattern)
+    return M
+
+
+def calc_global(problem_data, mode="batch", workers=1, rhs_only=False,
+                ebc_method="row", pattern=None):
     """
     Calculates global stiffness matrix. Assembly of elemental systems are
     included here instead of defining an extra function for assembly.
+    The elemental systems are either calculated in batches of elements
+    ("batch" mode) or element by element ("element" mode). In batch mode,
+    batches can be distributed to multiple worker processes.
+    If rhs_only is set, only F is calculated and returned K is None.
+    See apply_bc for the EBC methods. A sparsity pattern from
+    get_sparsity_pattern can be given to skip building the structure of K
+    when many problems on the same mesh are assembled.
     """
 
     print("Calculating global system...")
 
-    global NEN, NEN_range, functions, a, V1, V2, c, f, shape_funcs
-
-    # Defining global variables
-    NEN = problem_data["NEN"]
-    NEN_range = range(NEN)
+    global NEN, NEN_range, functions, a, V1, V2, c, f, ref, assembly_data, \
+        assembly_groups
 
     # Taking coefficient functions of DE out of problem data
     functions = problem_data["functions"]
@@ -91,85 +323,352 @@ def calc_global(problem_data):
     c = functions["c"]
     f = functions["f"]
 
-    # Defining shape functions
-    shape_funcs = problem_data["shapefunc"]
-
-    print(" * Creating matrixes...")
-    NN = problem_data["NN"]
-    K = sparse.lil_matrix((NN, NN))
-    F = zeros((NN, 1))
-
-    print(" * Calculating K and F matrixes...")
-    for e_nodes in problem_data["LtoG"]:
-        Ke, Fe = calc_elem(problem_data, e_nodes)
-        for i, node_i in enumerate(e_nodes):
-            F[node_i] += Fe[i]
-            for j, node_j in enumerate(e_nodes):
-                K[node_i, node_j] += Ke[i][j]
+    # Reference element tables of shape functions and GQ, and the nodes of
+    # each group of elements with the same type
+    groups = get_group_nodes(problem_data)
+
+    print(" * Calculating elemental systems...")
+    NE = len(problem_data["LtoG"])
+    Ke_all = []
+    Fe_all = []
+    with phase("kernels") as kernels:
+        if mode == "batch":
+            # The elements of each group are split into equally sized
+            # batches, which are calculated with the tables of the group
+            assembly_data = problem_data
+            assembly_groups = groups
+            batches = [(group, start, min(start + BATCH_SIZE, len(e_nodes)),
+                        rhs_only)
+                       for group, (e_ref, elements, e_nodes)
+                       in enumerate(groups)
+                       for start in range(0, len(e_nodes), BATCH_SIZE)]
+            if workers > 1 and len(batches) > 1:
+                print("  * Using {0} workers...".format(workers))
+                results = map_parallel(calc_elem_range, batches, workers)
+            else:
+                results = [calc_elem_range(batch) for batch in batches]
+            assembly_data = assembly_groups = None
+
+            for group in range(len(groups)):
+                group_results = [result for batch, result
+                                 in zip(batches, results) if batch[0] == group]
+                if not rhs_only:
+                    Ke_all.append(join([Ke for Ke, Fe in group_results]))
+                Fe_all.append(join([Fe for Ke, Fe in group_results]))
+            del results, group_results
+        else:
+            for ref, elements, e_nodes in groups:
+                NEN = ref.NEN
+                NEN_range = range(NEN)
+                Ke_group = zeros((len(e_nodes), NEN, NEN))
+                Fe_group = zeros((len(e_nodes), NEN))
+                for e, element_nodes in enumerate(e_nodes):
+                    Ke, Fe = calc_elem(problem_data, element_nodes)
+                    Ke_group[e] = Ke
+                    Fe_group[e] = Fe[:, 0]
+                if not rhs_only:
+                    Ke_all.append(Ke_group)
+                Fe_all.append(Fe_group)
+
+    if kernels is not None:
+        record(NE=NE, NN=problem_data["NN"],
+               elements_per_second=NE / max(kernels["time"], 1e-9))
+
+    print(" * Assembling K and F matrixes...")
+    K, F = assemble([e_nodes for e_ref, elements, e_nodes in groups],
+                    Ke_all if not rhs_only else None, Fe_all,
+                    problem_data["NN"], pattern)
+    if K is not None:
+        record(nnz=K.nnz)
 
     print(" * Freeing up memory (1/2)...")
-    del problem_data["GQ"]
     del problem_data["UV"]
     del problem_data["functions"]
 
-    if problem_data["BCs"]:
-        K, F = apply_bc(problem_data, K, F)
+    with phase("bc"):
+        K, F = apply_bc(problem_data, K, F, ebc_method)
     print (" * Freeing up memory (2/2)...")
 
-    del problem_data["LtoG"]
+    # LtoG is kept with the nodes since the mesh is written with the solution
     del problem_data["BCs"]
 
-    print(" * Converting LIL to CSR format...")
-    K = K.tocsr()
     return K, F
 
 
-def apply_bc(problem_data, K, F):
+def assemble(LtoG, Ke_all, Fe_all, NN, pattern=None):
     """
-    Applies all boundary conditions, according to input
+    Assembles stacks of elemental systems into the global system. K is built
+    in one step from the row/column/value triplets of all elemental entries
+    with duplicates summed, and returned in CSR format with sorted indices.
+    If the sparsity pattern of the mesh is given, the entries are scattered
+    directly into its K.data instead. If Ke_all is None, only F is assembled
+    and K is None. For meshes with several element types, LtoG, Ke_all and
+    Fe_all are lists with the element nodes and the stacks of each group.
     """
-    print(" * Applying boundary conditions...")
+    from scipy import sparse
+
+    if not isinstance(LtoG, list):
+        LtoG = [LtoG]
+        Fe_all = [Fe_all]
+        if Ke_all is not None:
+            Ke_all = [Ke_all]
+
+    with phase("triplets"):
+        F = zeros(NN)
+        for e_nodes, Fe in zip(LtoG, Fe_all):
+            F += bincount(e_nodes.ravel(), weights=Fe.ravel(), minlength=NN)
+        F = F.reshape((NN, 1))
+        if Ke_all is None:
+            return None, F
+
+        if pattern is not None:
+            indptr, indices, scatter = pattern
+            data = bincount(scatter, minlength=len(indices),
+                            weights=join([Ke.ravel() for Ke in Ke_all]))
+            return sparse.csr_matrix((data, indices, indptr),
+                                     shape=(NN, NN)), F
+
+        # For the (e, i, j) entry of a Ke stack, row is LtoG[e, i] and
+        # column is LtoG[e, j]
+        rows, cols = get_entry_nodes(LtoG)
+        K = sparse.coo_matrix((join([Ke.ravel() for Ke in Ke_all]),
+                               (rows, cols)), shape=(NN, NN))
+
+    with phase("csr"):
+        K = K.tocsr()
+        K.sum_duplicates()
 
-    print("  * Applying EBCs...")
-    for BC in problem_data["BCs"]["EBC"]:
-        node = BC["node"]
-        data = BC["data"][0]
-        F[node] = data
-        K[node, :] = 0.0
-        K[node, node] = 1.0
+    return K, F
 
-    print("  * Applying NBCs...")
-    NEN = problem_data["NEN"]
-    for BC in problem_data["BCs"]["NBC"]:
-        node1 = BC["face"]
-        node2 = (node1 + 1) % NEN
-        SV = BC["data"][0]
 
-        e_nodes = problem_data["LtoG"][BC["element"]]
-        e_coord = get_element_coords(problem_data, e_nodes)
-        length = sqrt(((e_coord[node1] - e_coord[node2]) ** 2).sum())
+def get_entry_nodes(LtoG):
+    """
+    Returns the rows and columns of K that the entries of the elemental
+    matrix stacks of the element nodes in the LtoG list are added to.
+    """
+    rows = []
+    cols = []
+    for e_nodes in LtoG:
+        NEN = e_nodes.shape[1]
+        rows.append(repeat(e_nodes, NEN, axis=1).ravel())
+        cols.append(tile(e_nodes, (1, NEN)).ravel())
+    return join(rows), join(cols)
+
+
+def get_sparsity_pattern(LtoG, NN):
+    """
+    Calculates the CSR structure of K for a mesh, which only depends on LtoG,
+    or on the list of the element nodes of each group for meshes with several
+    element types (see get_group_nodes). Returns indptr and indices of K, and
+    the position in K.data of every entry of the (NE, NEN, NEN) stacks of
+    elemental matrixes, so that the values of any problem on the mesh can be
+    assembled with one bincount.
+    """
+    from numpy import unique, cumsum
+
+    if not isinstance(LtoG, list):
+        LtoG = [asarray(LtoG)]
+    rows, cols = get_entry_nodes(LtoG)
+    # Unique keys are sorted by row, then by column, as in a CSR matrix
+    keys, scatter = unique(rows.astype("int64") * NN + cols,
+                           return_inverse=True)
+    indptr = zeros(NN + 1, dtype="int32")
+    cumsum(bincount(keys // NN, minlength=NN), out=indptr[1:])
+    indices = (keys % NN).astype("int32")
+    return indptr, indices, scatter.ravel()
+
+
+def calc_operator_key(problem_data):
+    """
+    Calculates a key that identifies the K matrix of a problem: the mesh, the
+    coefficient functions of the operator and the boundary conditions that
+    modify K. Problems with the same key only differ in F, so they can share
+    the factorization of K.
+    """
+    from hashlib import sha1
+
+    key = sha1()
+
+    def update_(value):
+        if hasattr(value, "tobytes"):
+            key.update(repr((value.dtype.str, value.shape)).encode("utf-8"))
+            key.update(value.tobytes())
+        else:
+            key.update(repr(value).encode("utf-8"))
+
+    update_((OPERATOR_VERSION, problem_data["eType"], problem_data["NEN"],
+             problem_data["NGP"], problem_data["NN"]))
+    update_(asarray(problem_data["nodes"], dtype=float))
+    update_(asarray(problem_data["LtoG"]))
+
+    functions = problem_data["functions"]
+    sources = [functions[name].source for name in ("a", "V1", "V2", "c")]
+    update_(sources)
+    if "x" in sources or "y" in sources:
+        update_(asarray(problem_data["UV"], dtype=float))
+
+    BCs = problem_data["BCs"]
+    update_(asarray(BCs["EBC"]["node"]))
+    for field in ("element", "face"):
+        update_(asarray(BCs["MBC"][field]))
+    update_(asarray(BCs["MBC"]["data"][:, 0]))
+
+    return key.hexdigest()
+
+
+def get_entry_rows(K):
+    """
+    Returns the row of every entry of K.data for a CSR matrix K.
+    """
+    return repeat(arange(K.shape[0]), diff(K.indptr))
+
 
-        SV *= .5 * length
-        F[e_nodes[node1]] += SV
-        F[e_nodes[node2]] += SV
+def get_diagonal_positions(K):
+    """
+    Finds the positions of the diagonal entries of all rows in K.data. K has
+    to be in CSR format and the diagonal entries have to be in its sparsity
+    pattern, which is always the case for the nodes of the mesh.
+    """
+    rows = get_entry_rows(K)
+    on_diagonal = flatnonzero(K.indices == rows)
+    positions = zeros(K.shape[0], dtype=on_diagonal.dtype)
+    positions[rows[on_diagonal]] = on_diagonal
+    return positions
+
+
+def get_face_nodes(problem_data, table):
+    """
+    Finds the global corner nodes and the lengths of the element faces of a
+    NBC or MBC table. Returns (n, 2) nodes and (n,) lengths.
+    """
+    from numpy import stack
+    from psetup import get_element_corners
+
+    # Face k of an element is between its corners k and k + 1
+    e_nodes = asarray(problem_data["LtoG"])[table["element"]]
+    corners = get_element_corners(problem_data["eType"], e_nodes)
+    local_nodes = stack((table["face"], (table["face"] + 1) % corners),
+                        axis=1)
+    face_nodes = take_along_axis(e_nodes, local_nodes, axis=1)
+    face_coords = get_element_coords(problem_data, face_nodes)
+    lengths = hypot(*(face_coords[:, 0] - face_coords[:, 1]).T)
+    return face_nodes, lengths
+
+
+def get_face_groups(problem_data, table):
+    """
+    Groups the faces of a NBC or MBC table by the type of their elements and
+    their face index, which share a psetup.FaceTable. Yields the FaceTable,
+    the rows of the faces in the table and their (n, m) global nodes.
+    """
+    from numpy import full, unique
+    from psetup import ElementTypes, get_element_widths, get_face_table
+
+    e_nodes = asarray(problem_data["LtoG"])[table["element"]]
+    faces = asarray(table["face"])
+    if problem_data["eType"] == "mixed":
+        widths = get_element_widths(e_nodes)
+    else:
+        widths = full(len(faces), problem_data["NEN"])
+    for width in unique(widths):
+        eType, NEN = ElementTypes[width]
+        for face in unique(faces[widths == width]):
+            rows = flatnonzero((widths == width) & (faces == face))
+            face_table = get_face_table(eType, NEN, face)
+            yield face_table, rows, e_nodes[rows][:, face_table.nodes]
+
+
+def get_entry_positions(K, rows, columns):
+    """
+    Finds the positions of the (rows, columns) entries in K.data. K has to be
+    in CSR format and the entries have to be in its sparsity pattern, which
+    is the case for the nodes of an element. The indices of K are sorted in
+    place if they are not sorted.
+    """
+    from numpy import searchsorted, int64
+
+    K.sort_indices()
+    keys = get_entry_rows(K).astype(int64) * K.shape[1] + K.indices
+    return searchsorted(keys, asarray(rows, dtype=int64) * K.shape[1] +
+                        columns)
+
+
+def add_to_nodes(F, nodes, values):
+    """
+    Adds the values to the given rows of the (NN, 1) F vector, summing the
+    values of repeated nodes.
+    """
+    F[:, 0] += bincount(nodes.ravel(), weights=values.ravel(),
+                        minlength=len(F))
+
+
+def apply_bc(problem_data, K, F, ebc_method="row"):
+    """
+    Applies all boundary conditions, according to input. K is expected in
+    CSR format and is modified in place without changing its sparsity pattern.
+    If K is None, the boundary conditions are only applied to F.
+
+    EBCs are applied last so that they are not altered by the other BCs. With
+    the "row" method, the rows of EBC nodes are replaced by identity rows.
+    With the "symmetric" method, the known values are also eliminated from
+    the other rows by moving their columns to F, which keeps K symmetric for
+    diffusion problems. That method needs K, even for F only. With the
+    "none" method, EBCs are left to the caller, which is the case for
+    transient problems.
+    """
+    print(" * Applying boundary conditions...")
+    BCs = problem_data["BCs"]
+
+    print("  * Applying NBCs...")
+    table = BCs["NBC"]
+    if len(table["element"]):
+        lengths = get_face_nodes(problem_data, table)[1]
+        SV = table["data"][:, 0] * lengths
+        for face_table, rows, nodes in get_face_groups(problem_data, table):
+            loads = face_table.weights.dot(face_table.S)
+            add_to_nodes(F, nodes, SV[rows, None] * loads)
 
     print("  * Applying MBCs...")
-    for BC in problem_data["BCs"]["MBC"]:
-        element = BC["element"]
-        node1 = BC["face"]
-        node2 = (node1 + 1) % NEN
-        alpha = BC["data"][0]
-        beta = BC["data"][1]
-
-        e_nodes = problem_data["LtoG"][element]
-        e_coord = get_element_coords(problem_data, e_nodes)
-        length = sqrt(((e_coord[node1] - e_coord[node2]) ** 2).sum())
-
-        node1 = e_nodes[node1]
-        node2 = e_nodes[node2]
-        F[node1] += 0.5 * beta * length
-        F[node2] += 0.5 * beta * length
-        K[node1, node1] -= (alpha * length) / 3.
-        K[node2, node2] -= (alpha * length) / 6.
+    table = BCs["MBC"]
+    if len(table["element"]):
+        lengths = get_face_nodes(problem_data, table)[1]
+        alpha = table["data"][:, 0] * lengths
+        beta = table["data"][:, 1] * lengths
+        for face_table, rows, nodes in get_face_groups(problem_data, table):
+            loads = face_table.weights.dot(face_table.S)
+            add_to_nodes(F, nodes, beta[rows, None] * loads)
+            if K is not None:
+                mass = einsum("g,gi,gj->ij", face_table.weights,
+                              face_table.S, face_table.S)
+                positions = get_entry_positions(K, nodes[:, :, None],
+                                                nodes[:, None, :])
+                add_at(K.data, positions, -alpha[rows, None, None] * mass)
+
+    if ebc_method == "none":
+        return K, F
+
+    print("  * Applying EBCs...")
+    table = BCs["EBC"]
+    nodes = table["node"]
+    values = table["data"][:, 0]
+    if len(nodes) and K is not None:
+        is_EBC = zeros(len(F), dtype=bool)
+        is_EBC[nodes] = True
+        rows = get_entry_rows(K)
+
+        if ebc_method == "symmetric":
+            # Lift the known values to the right hand side, then drop their
+            # columns
+            known = zeros(len(F))
+            known[nodes] = values
+            F[:, 0] -= K.dot(known)
+            K.data[is_EBC[K.indices]] = 0.0
+
+        K.data[is_EBC[rows]] = 0.0
+        K.data[get_diagonal_positions(K)[nodes]] = 1.0
+    elif len(nodes) and ebc_method == "symmetric":
+        raise ValueError("Symmetric EBC elimination needs K.")
+
+    F[nodes, 0] = values
 
     return K, F
@@ -0,0 +1,263 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides the instrumentation of the solution pipeline: timers and peak
+    resident memory for each phase (reading, assembly, solving etc.),
+    arbitrary statistics recorded by the phases and optional cProfile runs
+    around the top level phases. Modules mark their phases with phase() and
+    record statistics with record(), which do nothing unless a Profiler is
+    activated. While a profiler is active, the time of every import that
+    loads new modules is also measured, with the phase it happened in, since
+    modules are imported lazily when they are first needed. The collected
+    data is reported as JSON.
+@version: 1.0
+"""
+
+from contextlib import contextmanager
+from time import time
+import threading
+import os
+import sys
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+# Version of the report format
+REPORT_VERSION = 1
+
+# The profiler that phase() and record() report to, if any
+active = None
+
+# The import function replaced by timed_import() while profiling
+original_import = None
+
+
+def get_rss():
+    """
+    Returns the current resident set size of the process in bytes. Falls back
+    to the peak of the whole process where the current size is unavailable.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, AttributeError):
+        import resource
+        import sys
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler(threading.Thread):
+    """
+    Samples the resident set size periodically in the background, keeping
+    the peak value for each of the phases that are running.
+    """
+
+    def __init__(self, interval):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.peaks = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def sample(self):
+        rss = get_rss()
+        with self.lock:
+            for key in self.peaks:
+                self.peaks[key] = max(self.peaks[key], rss)
+        return rss
+
+    def begin(self, key):
+        with self.lock:
+            self.peaks[key] = 0
+        self.sample()
+
+    def end(self, key):
+        self.sample()
+        with self.lock:
+            return self.peaks.pop(key)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class Profiler(object):
+    """
+    Collects the phase timings, memory usage and statistics of a run.
+    If cprofile_dir is given, each top level phase is also run under cProfile
+    and its statistics are dumped to <cprofile_dir>/<phase>.prof.
+    """
+
+    def __init__(self, cprofile_dir=None, sample_interval=0.005):
+        self.cprofile_dir = cprofile_dir
+        self.phases = []
+        self.stats = {}
+        self.imports = []
+        self.importing = False
+        self.stack = []
+        self.start = time()
+        self.sampler = MemorySampler(sample_interval)
+        self.sampler.start()
+
+    @contextmanager
+    def phase(self, name):
+        full_name = ".".join(self.stack + [name])
+        info = {"name": full_name, "rss_start": get_rss()}
+        self.phases.append(info)
+
+        profile = None
+        if self.cprofile_dir and not self.stack:
+            import cProfile
+            profile = cProfile.Profile()
+
+        self.stack.append(name)
+        self.sampler.begin(full_name)
+        t = time()
+        if profile:
+            profile.enable()
+        try:
+            yield info
+        finally:
+            if profile:
+                profile.disable()
+            info["time"] = time() - t
+            info["peak_rss"] = self.sampler.end(full_name)
+            info["rss_end"] = get_rss()
+            self.stack.pop()
+
+            if profile:
+                if not os.path.isdir(self.cprofile_dir):
+                    os.makedirs(self.cprofile_dir)
+                profile.dump_stats(
+                    os.path.join(self.cprofile_dir, full_name + ".prof")
+                )
+
+    def record(self, **stats):
+        self.stats.update(stats)
+
+    def record_import(self, name, import_time, modules):
+        self.imports.append({
+            "name": name,
+            "phase": ".".join(self.stack),
+            "time": import_time,
+            "modules": modules
+        })
+
+    def stop(self):
+        """
+        Stops the memory sampling. The profiler cannot be used afterwards.
+        """
+        self.sampler.stop()
+
+    def get_report(self):
+        return {
+            "version": REPORT_VERSION,
+            "total_time": time() - self.start,
+            "peak_rss": max([info["peak_rss"] for info in self.phases
+                             if "peak_rss" in info] + [get_rss()]),
+            "phases": self.phases,
+            "import_time": sum(info["time"] for info in self.imports),
+            "imports": self.imports,
+            "stats": self.stats
+        }
+
+    def print_summary(self):
+        print("Profile:")
+        for info in self.phases:
+            print(" * {0:<28} {1:10.4f} s {2:10.1f} MB peak".format(
+                info["name"], info.get("time", 0.),
+                info.get("peak_rss", 0) / 1048576.
+            ))
+        if self.imports:
+            print(" * {0:<28} {1:10.4f} s {2:10d} modules".format(
+                "imports", sum(info["time"] for info in self.imports),
+                sum(info["modules"] for info in self.imports)
+            ))
+            slowest = sorted(self.imports, key=lambda info: -info["time"])
+            for info in slowest[:5]:
+                print("   - {0:<26} {1:10.4f} s {2:>17}".format(
+                    info["name"], info["time"], info["phase"] or "-"
+                ))
+
+    def save(self, file_name):
+        """
+        Writes the report as JSON. NumPy numbers and arrays in the
+        statistics are converted to their Python equivalents.
+        """
+        from json import dump
+
+        def convert_(value):
+            if hasattr(value, "tolist"):
+                return value.tolist()
+            raise TypeError("{0!r} is not JSON serializable".format(value))
+
+        self.stop()
+        with open(file_name, "w") as output_file:
+            dump(self.get_report(), output_file, indent=2, default=convert_)
+
+
+def timed_import(name, *args, **kwargs):
+    """
+    Replaces the import function while profiling, reporting the time of the
+    outermost imports that load new modules to the active profiler. Nested
+    imports are included in the time of the import that triggers them.
+    """
+    profiler = active
+    if profiler is None or profiler.importing:
+        return original_import(name, *args, **kwargs)
+
+    modules = len(sys.modules)
+    profiler.importing = True
+    t = time()
+    try:
+        return original_import(name, *args, **kwargs)
+    finally:
+        t = time() - t
+        profiler.importing = False
+        if len(sys.modules) > modules:
+            profiler.record_import(name, t, len(sys.modules) - modules)
+
+
+def activate(profiler):
+    """
+    Makes the profiler the one that phase() and record() report to, and
+    starts timing imports. Passing None deactivates profiling.
+    """
+    global active, original_import
+    active = profiler
+    if profiler is not None and original_import is None:
+        original_import = builtins.__import__
+        builtins.__import__ = timed_import
+    elif profiler is None and original_import is not None:
+        builtins.__import__ = original_import
+        original_import = None
+
+
+@contextmanager
+def phase(name):
+    """
+    Marks a phase of the pipeline to be timed by the active profiler.
+    """
+    if active is None:
+        yield None
+    else:
+        with active.phase(name) as info:
+            yield info
+
+
+def record(**stats):
+    """
+    Records statistics to the active profiler.
+    """
+    if active is not None:
+        active.record(**stats)
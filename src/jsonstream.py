@@ -0,0 +1,212 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides a streaming reader for JSON problem files. The large numeric
+    arrays of a problem (nodes, LtoG, UV) are parsed chunk by chunk straight
+    into compact NumPy arrays, without building the nested lists of Python
+    numbers json.load would create. All other values are small and are parsed
+    with the standard json module.
+@version: 1.0
+"""
+
+from json import JSONDecoder
+from array import array as compact_array
+
+# Size of the chunks read from the input file, in characters
+CHUNK_SIZE = 1 << 20
+
+# Keys of the numeric arrays to be streamed and their types, both as NumPy
+# dtypes and as the typecodes of the compact buffers they are collected in
+ArrayKeys = {
+    "nodes": ("float64", "d"),
+    "LtoG": ("int32", "i"),
+    "UV": ("float64", "d")
+}
+
+DECODER = JSONDecoder()
+WHITESPACE = " \t\r\n"
+DELIMITERS = WHITESPACE + ",]}"
+# Maps the JSON array syntax to whitespace, leaving only the numbers
+SEPARATORS = dict((ord(char), u" ") for char in u"[],")
+
+
+class JSONStream(object):
+    """
+    A character stream over a file that is read in chunks.
+    """
+
+    def __init__(self, input_file):
+        self.file = input_file
+        self.buffer = ""
+        self.pos = 0
+
+    def fill(self):
+        """
+        Reads the next chunk, dropping the consumed part of the buffer.
+        Returns False at the end of the file.
+        """
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        return self.extend()
+
+    def extend(self):
+        """
+        Reads the next chunk, keeping the whole buffer. Returns False at the
+        end of the file.
+        """
+        chunk = self.file.read(CHUNK_SIZE)
+        self.buffer += chunk
+        return bool(chunk)
+
+    def peek(self):
+        """
+        Returns the next non-whitespace character without consuming it.
+        """
+        while True:
+            while self.pos < len(self.buffer):
+                if self.buffer[self.pos] not in WHITESPACE:
+                    return self.buffer[self.pos]
+                self.pos += 1
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input.")
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(
+                "Expected one of '{0}', found '{1}'.".format(chars, char)
+            )
+        self.pos += 1
+        return char
+
+    def read_value(self):
+        """
+        Reads the next JSON value with the standard decoder, reading more
+        chunks as long as the value is incomplete in the buffer.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                end = None
+
+            # A number is only complete if it is followed by a delimiter, as
+            # it may continue in the next chunk
+            if end is not None and end < len(self.buffer) and (
+                    not isinstance(value, (int, float)) or
+                    self.buffer[end] in DELIMITERS):
+                self.pos = end
+                return value
+
+            if not self.extend():
+                if end is None:
+                    raise ValueError("Invalid JSON input.")
+                self.pos = end
+                return value
+
+    def read_numeric_array(self, dtype, typecode):
+        """
+        Reads a nested array of numbers into a NumPy array. Only the outermost
+        and the row brackets are tracked, so one and two dimensional arrays
+        are supported. Rows of different lengths, like the LtoG rows of mixed
+        meshes, are padded with -1 to the longest one.
+        """
+        from numpy import frombuffer, array, cumsum, flatnonzero, uint8, \
+            where, full, arange, diff, concatenate
+
+        values = compact_array(typecode)
+        # Python 2 arrays have no frombytes
+        append_ = getattr(values, "frombytes", None) or values.fromstring
+        # Number of commas inside the rows read before the end of each row
+        row_ends = []
+        commas = 0
+        carry = ""
+        self.expect("[")
+        depth = 1
+        while True:
+            segment = self.buffer[self.pos:]
+            end = len(segment)
+
+            # Nesting level after each bracket and comma, to find where the
+            # array and its rows end. Arrays of numbers are ASCII, so byte
+            # positions are character positions up to the end of the array.
+            codes = frombuffer(segment.encode("utf-8"), dtype=uint8)
+            opening = codes == ord("[")
+            closing = codes == ord("]")
+            comma = codes == ord(",")
+            marks = flatnonzero(opening | closing | comma)
+            levels = depth + cumsum(where(opening[marks], 1, 0) -
+                                    closing[marks])
+            is_closing = closing[marks]
+            is_comma = comma[marks]
+            del codes, opening, closing, comma
+            closed = flatnonzero(levels == 0)
+            if len(closed):
+                end = marks[closed[0]] + 1
+                segment = segment[:end]
+                levels = levels[:closed[0] + 1]
+                is_closing = is_closing[:closed[0] + 1]
+                is_comma = is_comma[:closed[0] + 1]
+                depth = 0
+            elif len(levels):
+                depth = levels[-1]
+
+            row_commas = commas + cumsum(is_comma & (levels == 2))
+            row_ends.append(row_commas[is_closing & (levels == 1)])
+            if len(row_commas):
+                commas = row_commas[-1]
+
+            tokens = (carry + segment.translate(SEPARATORS)).split()
+            carry = ""
+            if end == len(self.buffer) - self.pos and tokens and \
+                    not segment[-1:].isspace() and segment[-1:] not in "[],":
+                # The last number may continue in the next chunk
+                carry = tokens.pop()
+            if tokens:
+                append_(array(tokens, dtype=dtype).tobytes())
+
+            self.pos += end
+            if depth == 0:
+                break
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON input.")
+
+        result = frombuffer(values, dtype=dtype)
+        # Rows have one more value than commas
+        lengths = diff(concatenate([[0]] + row_ends)) + 1
+        if len(lengths) and lengths.sum() != len(result):
+            raise ValueError("Rows of the array can not be empty.")
+        if len(lengths) and (lengths == lengths[0]).all():
+            result = result.reshape((len(lengths), lengths[0]))
+        elif len(lengths):
+            # Rows of different lengths are padded
+            padded = full((len(lengths), lengths.max()), -1, dtype=dtype)
+            padded[arange(lengths.max())[None, :] < lengths[:, None]] = result
+            result = padded
+        return result
+
+
+def load(input_file):
+    """
+    Reads a JSON object from the input file, streaming the large numeric
+    arrays of the problem data into NumPy arrays.
+    """
+
+    stream = JSONStream(input_file)
+    data = {}
+    stream.expect("{")
+    if stream.peek() == "}":
+        return data
+
+    while True:
+        key = stream.read_value()
+        stream.expect(":")
+        if key in ArrayKeys and stream.peek() == "[":
+            data[key] = stream.read_numeric_array(*ArrayKeys[key])
+        else:
+            data[key] = stream.read_value()
+
+        if stream.expect(",}") == "}":
+            return data
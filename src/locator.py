@@ -0,0 +1,193 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides point location in a mesh: finding the element that contains a
+    point and the reference element coordinates of the point, so that nodal
+    fields can be interpolated at arbitrary points with the shape functions.
+    Candidate elements are found with a KD-tree of the element centers.
+@version: 1.0
+"""
+
+from psetup import Corners, ElementTypes, eval_shape_functions, \
+    get_element_widths
+
+# Linear elements used to map points to reference coordinates. Elements are
+# assumed to have straight edges, so only the corners define their geometry.
+GeometryNodes = {"tri": 3, "quad": 4}
+
+# Number of nearest element centers tried for each point, which is
+# multiplied by this for the points that are not found, up to MAX_CANDIDATES
+CANDIDATES = 8
+MAX_CANDIDATES = 512
+
+# Tolerance of the reference coordinates for points on element edges
+TOLERANCE = 1e-9
+
+
+class PointLocator(object):
+    """
+    Locates points in a mesh of elements with the given type and number of
+    nodes, or in a mixed mesh if eType is "mixed".
+    """
+
+    def __init__(self, nodes, LtoG, eType, NEN):
+        from numpy import asarray, zeros, unique
+        from scipy.spatial import cKDTree
+
+        self.nodes = asarray(nodes, dtype=float)
+        self.LtoG = asarray(LtoG)
+        # Elements are handled by their kind, the index of their type and
+        # number of nodes in self.elements
+        if eType == "mixed":
+            widths = get_element_widths(self.LtoG)
+            self.elements = [ElementTypes[width] for width in unique(widths)]
+            self.kinds = zeros(len(self.LtoG), dtype="int32")
+            for kind, (eType, NEN) in enumerate(self.elements):
+                self.kinds[widths == NEN] = kind
+        else:
+            self.elements = [(eType, NEN)]
+            self.kinds = zeros(len(self.LtoG), dtype="int32")
+
+        centers = zeros((len(self.LtoG), 2))
+        for kind, selected in self.get_kinds_(self.kinds):
+            corners = Corners[self.elements[kind][0]]
+            centers[selected] = \
+                self.nodes[self.LtoG[selected, :corners]].mean(axis=1)
+        self.tree = cKDTree(centers)
+
+    def get_kinds_(self, kinds):
+        """
+        Yields each kind of elements and the positions of its elements in
+        the given kinds array.
+        """
+        from numpy import flatnonzero
+
+        for kind in range(len(self.elements)):
+            selected = flatnonzero(kinds == kind) \
+                if len(self.elements) > 1 else slice(None)
+            yield kind, selected
+
+    def to_reference(self, eType, elements, points, iterations=8):
+        """
+        Maps the points to the reference coordinates of the given elements
+        of the given type with Newton iterations, which are exact after the
+        first one for triangles. Returns the reference coordinates and
+        whether the iterations converged, which they may not for points
+        outside distorted quads.
+        """
+        from numpy import zeros, einsum, linalg
+
+        coords = self.nodes[self.LtoG[elements, :Corners[eType]]]
+        ref_coords = zeros(points.shape)
+        if eType == "tri":
+            ref_coords += 1. / 3.
+        for _ in range(iterations):
+            S, DS = eval_shape_functions(eType, GeometryNodes[eType],
+                                         ref_coords[:, 0], ref_coords[:, 1])
+            residual = points - einsum("pn,pnj->pj", S, coords)
+            # Jacobian of the mapping, dx_j / dksi_i as J[p, j, i]
+            J = einsum("pin,pnj->pji", DS, coords)
+            step = linalg.solve(J, residual[..., None])[..., 0]
+            ref_coords += step
+        return ref_coords, abs(step).max(axis=1) < TOLERANCE
+
+    def is_inside(self, eType, ref_coords):
+        ksi, eta = ref_coords.T
+        if eType == "tri":
+            return (ksi >= -TOLERANCE) & (eta >= -TOLERANCE) & \
+                (ksi + eta <= 1. + TOLERANCE)
+        return (abs(ksi) <= 1. + TOLERANCE) & (abs(eta) <= 1. + TOLERANCE)
+
+    def clamp(self, eType, ref_coords):
+        """
+        Moves reference coordinates outside the reference element onto it.
+        """
+        from numpy import clip, maximum
+
+        if eType == "tri":
+            ref_coords = clip(ref_coords, 0., None)
+            total = maximum(ref_coords.sum(axis=1), 1.)
+            return ref_coords / total[:, None]
+        return clip(ref_coords, -1., 1.)
+
+    def try_elements(self, elements, points):
+        """
+        Maps the points to the reference coordinates of the given elements of
+        any kind. Returns the reference coordinates, whether the points are
+        inside the elements and the reference coordinates moved onto the
+        elements.
+        """
+        from numpy import zeros
+
+        ref_coords = zeros(points.shape)
+        clamped = zeros(points.shape)
+        inside = zeros(len(points), dtype=bool)
+        for kind, selected in self.get_kinds_(self.kinds[elements]):
+            eType = self.elements[kind][0]
+            ref_coords[selected], converged = self.to_reference(
+                eType, elements[selected], points[selected]
+            )
+            inside[selected] = converged & \
+                self.is_inside(eType, ref_coords[selected])
+            clamped[selected] = self.clamp(eType, ref_coords[selected])
+        return ref_coords, inside, clamped
+
+    def locate(self, points):
+        """
+        Finds the elements containing the (n, 2) points and the reference
+        coordinates of the points in them. The elements with the nearest
+        centers are tried first, and more of them for the points that are
+        not found. Points outside the mesh are placed on the element with
+        the nearest center.
+        """
+        from numpy import zeros, arange
+
+        limit = min(MAX_CANDIDATES, len(self.LtoG))
+        elements = zeros(len(points), dtype="int64")
+        ref_coords = zeros(points.shape)
+        remaining = arange(len(points))
+        tried = 0
+        count = min(CANDIDATES, limit)
+        while len(remaining) and tried < limit:
+            candidates = self.tree.query(points[remaining], count)[1]
+            candidates = candidates.reshape((len(remaining), count))
+            if not tried:
+                elements[:] = candidates[:, 0]
+            for k in range(tried, count):
+                trial, inside, clamped = self.try_elements(
+                    candidates[:, k], points[remaining]
+                )
+                if k == 0:
+                    ref_coords[:] = clamped
+                located = remaining[inside]
+                elements[located] = candidates[inside, k]
+                ref_coords[located] = trial[inside]
+                remaining = remaining[~inside]
+                candidates = candidates[~inside]
+                if not len(remaining):
+                    break
+            tried = count
+            count = min(count * CANDIDATES, limit)
+        return elements, ref_coords
+
+    def interpolate(self, values, x, y):
+        """
+        Interpolates the nodal values at the points given by the x and y
+        arrays, or scalars, with the shape functions of the elements.
+        """
+        from numpy import asarray, broadcast_arrays, stack, einsum, zeros
+
+        x, y = broadcast_arrays(asarray(x, dtype=float),
+                                asarray(y, dtype=float))
+        points = stack((x.ravel(), y.ravel()), axis=1)
+        elements, ref_coords = self.locate(points)
+        values = asarray(values)
+        result = zeros(len(points))
+        for kind, selected in self.get_kinds_(self.kinds[elements]):
+            eType, NEN = self.elements[kind]
+            S = eval_shape_functions(eType, NEN, ref_coords[selected, 0],
+                                     ref_coords[selected, 1])[0]
+            e_values = values[self.LtoG[elements[selected], :NEN]]
+            result[selected] = einsum("pn,pn->p", S, e_values)
+        return result.reshape(x.shape)
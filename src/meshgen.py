@@ -0,0 +1,383 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides synthetic mesh and problem generators for the unit square, for
+    all element types and orders in psetup.Order, and for mixed meshes of
+    triangles and quads. Structured meshes are regular grids, unstructured
+    meshes are Delaunay triangulations of perturbed points with a random
+    node numbering. Unstructured quad meshes are made by splitting each
+    triangle into 3 quads. Structured mixed meshes alternate quad cells with
+    cells split into 2 triangles. Quadratic and cubic elements get their edge
+    and interior nodes from their linear counterparts.
+
+    Running this module writes a generated problem file:
+        python meshgen.py tri6 100000 -m unstructured -o Tri6.fpb
+@version: 1.0
+"""
+
+from psetup import Order, Corners, DefaultNGP, get_element_corners, \
+    get_edges, get_boundary_faces
+
+# Number of elements each grid cell (structured) or triangle (unstructured)
+# is split into
+CellElements = {"tri": 2, "quad": 1, "mixed": 1.5}
+
+# Polynomial degree of the element orders
+Degrees = {"linear": 1, "quadratic": 2, "cubic": 3}
+
+# Reference coordinates of the interior nodes of the elements of each order
+InteriorNodes = {
+    "linear": {"tri": [], "quad": []},
+    "quadratic": {"tri": [], "quad": [(0., 0.)]},
+    "cubic": {
+        "tri": [(1. / 3., 1. / 3.)],
+        "quad": [(-1. / 3., -1. / 3.), (1. / 3., -1. / 3.),
+                 (1. / 3., 1. / 3.), (-1. / 3., 1. / 3.)]
+    }
+}
+
+DefaultFunctions = {
+    "a": "1.0",
+    "V1": "1.0",
+    "V2": "0.5",
+    "c": "0.0",
+    "f": "sin(pi * x) * sin(pi * y)",
+    "exactSoln": "?"
+}
+
+TOLERANCE = 1e-9
+
+
+def get_element_names():
+    """
+    Returns the short names of all supported elements like "tri3" mapped to
+    (eType, NEN). Mixed meshes of triangles and quads are named by the
+    number of nodes of their quads, like "mixed9".
+    """
+    names = dict((eType + str(NEN), (eType, NEN))
+                 for eType, orders in Order.items() for NEN in orders)
+    names.update(("mixed" + str(NEN), ("mixed", NEN))
+                 for NEN in Order["quad"])
+    return names
+
+
+def get_order(eType, NEN):
+    """
+    Returns the order of the elements of a mesh, like "quadratic". Mixed
+    meshes have elements of the same order as their quads.
+    """
+    return Order["quad" if eType == "mixed" else eType][NEN]
+
+
+def get_corner_groups(corners):
+    """
+    Yields the element type, the number of corners and the elements with
+    that many corners of a linear mesh, for the corners from get_edges.
+    """
+    from numpy import flatnonzero
+
+    for eType, count in sorted(Corners.items()):
+        if isinstance(corners, int):
+            if corners == count:
+                yield eType, count, slice(None)
+        else:
+            selected = flatnonzero(corners == count)
+            if len(selected):
+                yield eType, count, selected
+
+
+def make_high_order(nodes, LtoG, eType, order):
+    """
+    Adds the nodes of quadratic or cubic elements to a linear mesh: nodes
+    at equal intervals along every edge, which are listed in the direction
+    of the edge for each element, and the interior nodes of the elements.
+    The new nodes are numbered after the existing ones. Elements with
+    straight edges are assumed.
+    """
+    from numpy import concatenate, arange, array, full, roll, where, stack, \
+        einsum
+    from psetup import eval_shape_functions
+
+    corners = get_element_corners(eType, LtoG)
+    degree = Degrees[order]
+    NN = len(nodes)
+    edges, edge_index = get_edges(LtoG, corners)
+
+    # Edge nodes, numbered from the lower numbered node of each edge
+    fractions = arange(1, degree) / float(degree)
+    new_nodes = [nodes, (nodes[edges[:, 0], None] * (1. - fractions[:, None]) +
+                         nodes[edges[:, 1], None] * fractions[:, None])
+                 .reshape((-1, 2))]
+    next_node = NN + len(edges) * (degree - 1)
+
+    groups = list(get_corner_groups(corners))
+    NEN = max(NEN for e_type, _, _ in groups
+              for NEN, name in Order[e_type].items() if name == order)
+    new_LtoG = full((len(LtoG), NEN), -1, dtype="int64")
+    for e_type, count, selected in groups:
+        e_corners = LtoG[selected, :count]
+        e_edges = edge_index[selected, :count]
+        forward = e_corners < roll(e_corners, -1, axis=1)
+        edge_nodes = stack([NN + e_edges * (degree - 1) +
+                            where(forward, m, degree - 2 - m)
+                            for m in range(degree - 1)], axis=2)
+        columns = [e_corners, edge_nodes.reshape((len(e_corners), -1))]
+
+        interior = array(InteriorNodes[order][e_type]).reshape((-1, 2))
+        if len(interior):
+            S = eval_shape_functions(e_type, count, interior[:, 0],
+                                     interior[:, 1])[0]
+            new_nodes.append(einsum("in,enj->eij", S, nodes[e_corners])
+                             .reshape((-1, 2)))
+            columns.append(next_node + arange(len(e_corners) * len(interior))
+                           .reshape((len(e_corners), len(interior))))
+            next_node += len(e_corners) * len(interior)
+
+        columns = concatenate(columns, axis=1)
+        new_LtoG[selected, :columns.shape[1]] = columns
+
+    return concatenate(new_nodes), new_LtoG
+
+
+def split_to_quads(nodes, LtoG):
+    """
+    Splits each triangle into 3 quads using the mid-edge nodes and the
+    centroid.
+    """
+    from numpy import concatenate, arange, stack
+
+    NN = len(nodes)
+    NE = len(LtoG)
+    edges, edge_index = get_edges(LtoG, 3)
+    mids = NN + edge_index
+    centers = NN + len(edges) + arange(NE)
+    nodes = concatenate((nodes, nodes[edges].mean(axis=1),
+                         nodes[LtoG].mean(axis=1)))
+    # Quad k starts at corner k and goes through the middle of the edge
+    # (k, k + 1), the centroid and the middle of the edge (k - 1, k)
+    LtoG = concatenate([stack((LtoG[:, k], mids[:, k], centers,
+                               mids[:, (k - 1) % 3]), axis=1)
+                        for k in range(3)])
+    return nodes, LtoG
+
+
+def structured_mesh(eType, nx, ny):
+    """
+    Generates an nx by ny grid of linear elements on the unit square. Each
+    cell is either a quad or split into 2 triangles, and mixed meshes
+    alternate between the two like a checkerboard.
+    """
+    from numpy import linspace, meshgrid, stack, arange, concatenate, \
+        indices, full
+
+    x, y = meshgrid(linspace(0., 1., nx + 1), linspace(0., 1., ny + 1))
+    nodes = stack((x.ravel(), y.ravel()), axis=1)
+
+    # Corners of the cells counter-clockwise, starting from the lower left
+    node_ids = arange((nx + 1) * (ny + 1)).reshape((ny + 1, nx + 1))
+    cells = stack((node_ids[:-1, :-1], node_ids[:-1, 1:], node_ids[1:, 1:],
+                   node_ids[1:, :-1]), axis=2).reshape((-1, 4))
+    if eType == "tri":
+        LtoG = concatenate((cells[:, [0, 1, 2]], cells[:, [0, 2, 3]]))
+    elif eType == "mixed":
+        # Rows of triangles are padded with -1
+        is_quad = (indices((ny, nx)).sum(axis=0) % 2 == 0).ravel()
+        triangles = full((2 * (~is_quad).sum(), 4), -1)
+        triangles[:, :3] = concatenate((cells[~is_quad][:, [0, 1, 2]],
+                                        cells[~is_quad][:, [0, 2, 3]]))
+        LtoG = concatenate((cells[is_quad], triangles))
+    else:
+        LtoG = cells
+    return nodes, LtoG
+
+
+def unstructured_mesh(eType, n, seed=0):
+    """
+    Generates an unstructured mesh of linear elements on the unit square
+    from about n * n points. Interior points of a grid are perturbed and
+    shuffled, then triangulated. Triangles are split into quads for quad
+    meshes.
+    """
+    from numpy import linspace, meshgrid, stack, random
+    from scipy.spatial import Delaunay
+
+    rng = random.RandomState(seed)
+    x, y = meshgrid(linspace(0., 1., n + 1), linspace(0., 1., n + 1))
+    nodes = stack((x.ravel(), y.ravel()), axis=1)
+    interior = ((nodes > TOLERANCE) & (nodes < 1. - TOLERANCE)).all(axis=1)
+    nodes[interior] += rng.uniform(-.35, .35, (interior.sum(), 2)) / n
+    nodes = nodes[rng.permutation(len(nodes))]
+
+    LtoG = Delaunay(nodes).simplices
+    # Make all triangles counter-clockwise
+    u, v = (nodes[LtoG[:, 1:]] - nodes[LtoG[:, :1]]).transpose((1, 2, 0))
+    clockwise = u[0] * v[1] - u[1] * v[0] < 0
+    LtoG[clockwise] = LtoG[clockwise][:, [0, 2, 1]]
+
+    if eType == "quad":
+        nodes, LtoG = split_to_quads(nodes, LtoG)
+    return nodes, LtoG
+
+
+def generate_mesh(eType, NEN, NE, mesh="structured", seed=0):
+    """
+    Generates a mesh of about NE elements of the given type and number of
+    nodes. Returns nodes and LtoG.
+    """
+    from math import sqrt
+
+    if mesh == "structured":
+        n = max(1, int(round(sqrt(float(NE) / CellElements[eType]))))
+        nodes, LtoG = structured_mesh(eType, n, n)
+    elif eType == "mixed":
+        raise ValueError("Mixed meshes can only be structured.")
+    elif mesh == "unstructured":
+        # A triangulation of n * n points has about 2 * n * n triangles
+        triangles = NE / 3. if eType == "quad" else NE
+        n = max(2, int(round(sqrt(triangles / 2.))))
+        nodes, LtoG = unstructured_mesh(eType, n, seed)
+    else:
+        raise ValueError("Unknown mesh kind: {0}".format(mesh))
+
+    order = get_order(eType, NEN)
+    if order != "linear":
+        nodes, LtoG = make_high_order(nodes, LtoG, eType, order)
+    return nodes, LtoG.astype("int32")
+
+
+def get_boundary_conditions(nodes, LtoG, eType, NEN=None):
+    """
+    Creates the BC tables of a generated mesh: T = 1 on the left and T = 0
+    on the top edges, a unit flux on the bottom edge and a convective
+    boundary on the right edge.
+    """
+    from numpy import stack, full, zeros, isnan, flatnonzero, nan
+
+    corners = get_element_corners(eType, LtoG)
+    element, face = get_boundary_faces(LtoG, corners)
+    if not isinstance(corners, int):
+        corners = corners[element]
+    degree = Degrees[get_order(eType, NEN or LtoG.shape[1])]
+    # The edge nodes of faces are numbered like the faces after the corners
+    columns = [face, (face + 1) % corners] + \
+        [corners + face * (degree - 1) + m for m in range(degree - 1)]
+    face_nodes = LtoG[element[:, None], stack(columns, axis=1)]
+    middle = nodes[face_nodes[:, :2]].mean(axis=1)
+
+    def on_side_(axis, value):
+        return abs(middle[:, axis] - value) < TOLERANCE
+
+    def data_(n, first, second=0.):
+        data = zeros((n, 2))
+        data[:, 0] = first
+        data[:, 1] = second
+        return data
+
+    # The top edge wins on the shared corner
+    values = full(len(nodes), nan)
+    values[face_nodes[on_side_(0, 0.)]] = 1.
+    values[face_nodes[on_side_(1, 1.)]] = 0.
+    EBC_nodes = flatnonzero(~isnan(values))
+    bottom = on_side_(1, 0.)
+    right = on_side_(0, 1.)
+
+    return {
+        "EBC": {
+            "node": EBC_nodes.astype("int32"),
+            "data": data_(len(EBC_nodes), values[EBC_nodes])
+        },
+        "NBC": {
+            "element": element[bottom].astype("int32"),
+            "face": face[bottom].astype("int32"),
+            "data": data_(bottom.sum(), 1.)
+        },
+        "MBC": {
+            "element": element[right].astype("int32"),
+            "face": face[right].astype("int32"),
+            "data": data_(right.sum(), -1.)
+        }
+    }
+
+
+def generate_problem(eType, NEN, NE, mesh="structured", seed=0,
+                     functions=None):
+    """
+    Generates raw problem data, as it would be read from a problem file, for
+    a mesh of about NE elements.
+    """
+
+    nodes, LtoG = generate_mesh(eType, NEN, NE, mesh, seed)
+    return {
+        "title": "{0} {1}{2} mesh of {3} elements".format(
+            mesh.capitalize(), eType, NEN, len(LtoG)
+        ),
+        "eType": eType,
+        "NEN": NEN,
+        "NGP": DefaultNGP[eType][NEN] if eType != "mixed" else None,
+        "NN": len(nodes),
+        "NE": len(LtoG),
+        "nodes": nodes,
+        "LtoG": LtoG,
+        "UV": None,
+        "functions": dict(functions or DefaultFunctions),
+        "BCs": get_boundary_conditions(nodes, LtoG, eType, NEN)
+    }
+
+
+def write_problem(problem_data, file_name):
+    """
+    Writes generated problem data either as a JSON or as a binary problem
+    file, depending on the extension of the file name.
+    """
+    from binproblem import write_binary, EXTENSION
+
+    if file_name.endswith(EXTENSION):
+        write_binary(problem_data, file_name)
+        return
+
+    from json import dump
+
+    def convert_(value):
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        raise TypeError("{0!r} is not JSON serializable".format(value))
+
+    # BC tables are written as lists of records, as in the problem files
+    BCs = dict(
+        (BC_type, [dict((field, column[i].tolist())
+                        for field, column in table.items())
+                   for i in range(len(table["data"]))])
+        for BC_type, table in problem_data["BCs"].items()
+    )
+    problem_data = dict(problem_data, BCs=BCs)
+    with open(file_name, "w") as output_file:
+        dump(problem_data, output_file, default=convert_)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    element_names = get_element_names()
+    parser = argparse.ArgumentParser(
+        description='Generates synthetic problems on the unit square.'
+    )
+    parser.add_argument('element', choices=sorted(element_names),
+                        help='Element type and number of nodes.')
+    parser.add_argument('NE', type=int, help='Approximate number of elements.')
+    parser.add_argument('-m', '--mesh', default='structured',
+                        choices=('structured', 'unstructured'),
+                        help='Kind of mesh to generate.')
+    parser.add_argument('--seed', default=0, type=int,
+                        help='Random seed of unstructured meshes.')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Output file path, .json or .fpb.')
+    arguments = parser.parse_args()
+
+    eType, NEN = element_names[arguments.element]
+    problem_data = generate_problem(eType, NEN, arguments.NE, arguments.mesh,
+                                    arguments.seed)
+    print("Writing {0} nodes and {1} elements to {2}...".format(
+        problem_data["NN"], problem_data["NE"], arguments.output
+    ))
+    write_problem(problem_data, arguments.output)
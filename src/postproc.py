@@ -0,0 +1,310 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides the derived quantities of a solution: the gradients and fluxes
+    at the GQ points, nodal averaged gradients, the fluxes through the NBC
+    and MBC faces and the integrals and norms over the domain, including the
+    errors against the exact solution if it is given. Everything is
+    calculated in one pass over the element groups, in batches of elements,
+    with the reference element tables used in the assembly.
+
+    The flux is the diffusive flux -a * grad(T) and the advective flux is
+    V * T. The NBC data is a * dT/dn on the faces and the MBC data gives
+    a * dT/dn = alpha * T + beta, with n the outward normal.
+@version: 1.0
+"""
+
+from numpy import zeros, asarray, einsum, arange, broadcast_to, hypot, stack
+
+from gsystem import BATCH_SIZE, get_group_nodes, get_element_coords, \
+    calc_elem_geometry, eval_coefficient, calc_nodal_gradients, \
+    get_face_groups
+from instrument import phase
+
+def has_exact_solution(problem_data):
+    exact = problem_data["functions"].get("exactSoln")
+    return exact is not None and exact.source != '?'
+
+
+def get_functions(problem_data):
+    if "functions" not in problem_data:
+        raise ValueError("The coefficient functions are needed for the "
+                         "post processing, which calc_global drops; pass it "
+                         "a copy of the problem data.")
+    return problem_data["functions"]
+
+
+def calc_gauss_point_fields(problem_data, solution):
+    """
+    Calculates the solution, its gradient and the fluxes at the GQ points of
+    all elements and sums the integrals over the domain while doing so.
+    The fields are (NE, NGP) or (NE, NGP, 2) arrays padded with zero weights
+    for mixed meshes, as in gsystem.calc_gradients. Returns the fields and
+    the integrals.
+    """
+    functions = get_functions(problem_data)
+    solution = asarray(solution).ravel()
+    exact = functions["exactSoln"] if has_exact_solution(problem_data) \
+        else None
+    groups = get_group_nodes(problem_data)
+    NE = len(problem_data["LtoG"])
+    NGP = max(e_ref.NGP for e_ref, elements, e_nodes in groups)
+    fields = {
+        "x": zeros((NE, NGP)),
+        "y": zeros((NE, NGP)),
+        "wdetJ": zeros((NE, NGP)),
+        "T": zeros((NE, NGP)),
+        "gradient": zeros((NE, NGP, 2)),
+        "flux": zeros((NE, NGP, 2)),
+        "advective_flux": zeros((NE, NGP, 2))
+    }
+    names = ["area", "T", "T2", "gradient2", "source", "reaction"]
+    if exact is not None:
+        names += ["exact2", "error2", "error_gradient2"]
+    integrals = dict((name, 0.) for name in names)
+
+    for e_ref, elements, e_nodes in groups:
+        indexes = arange(NE)[elements]
+        for start in range(0, len(e_nodes), BATCH_SIZE):
+            batch = asarray(e_nodes[start:start + BATCH_SIZE])
+            rows = indexes[start:start + BATCH_SIZE]
+            points = slice(None, e_ref.NGP)
+            e_coords = get_element_coords(problem_data, batch)
+            detJ, gDS, x, y = calc_elem_geometry(e_coords, e_ref.S, e_ref.DS)
+            wdetJ = detJ * e_ref.weights
+
+            def eval_(name):
+                return broadcast_to(eval_coefficient(
+                    functions[name], problem_data, batch, e_ref.S, x, y
+                ), x.shape)
+
+            e_values = solution[batch]
+            T = e_values.dot(e_ref.S.T)
+            gradient = einsum("egin,en->egi", gDS, e_values)
+            velocity = stack((eval_("V1"), eval_("V2")), axis=-1)
+
+            fields["x"][rows, points] = x
+            fields["y"][rows, points] = y
+            fields["wdetJ"][rows, points] = wdetJ
+            fields["T"][rows, points] = T
+            fields["gradient"][rows, points] = gradient
+            fields["flux"][rows, points] = -eval_("a")[..., None] * gradient
+            fields["advective_flux"][rows, points] = velocity * T[..., None]
+
+            gradient2 = (gradient ** 2).sum(axis=-1)
+            integrals["area"] += wdetJ.sum()
+            integrals["T"] += (wdetJ * T).sum()
+            integrals["T2"] += (wdetJ * T ** 2).sum()
+            integrals["gradient2"] += (wdetJ * gradient2).sum()
+            integrals["source"] += (wdetJ * eval_("f")).sum()
+            integrals["reaction"] += (wdetJ * eval_("c") * T).sum()
+            if exact is not None:
+                T_exact = broadcast_to(exact(x, y), x.shape)
+                integrals["exact2"] += (wdetJ * T_exact ** 2).sum()
+                integrals["error2"] += (wdetJ * (T - T_exact) ** 2).sum()
+                # The exact gradient is approximated by central
+                # differences, since only the exact solution itself is
+                # given. The step is 1e-3 times the size h of each element,
+                # so the truncation error is about 1e-6 * h ** 2 times the
+                # third derivatives, far below the FE error of the
+                # gradient, while the round-off error is O(eps / step).
+                step = 1e-3 * wdetJ.sum(axis=1, keepdims=True) ** .5
+                error_gradient = stack((
+                    exact(x + step, y) - exact(x - step, y),
+                    exact(x, y + step) - exact(x, y - step)
+                ), axis=-1) / (2. * step[..., None])
+                integrals["error_gradient2"] += (
+                    wdetJ * ((gradient - error_gradient) ** 2).sum(axis=-1)
+                ).sum()
+
+    return fields, integrals
+
+
+def calc_face_fluxes(problem_data, solution, elements, faces):
+    """
+    Integrates the fluxes through the given faces of the given elements,
+    with the psetup.FaceTable rule that the NBC and MBC loads are assembled
+    with. The elements are counter-clockwise and have straight edges.
+    Returns the (n,) lengths of the faces, the integrals of the solution
+    over them and their outward diffusive and advective fluxes, integrated
+    over each face.
+    """
+    from psetup import Corners, eval_shape_functions
+
+    functions = get_functions(problem_data)
+    solution = asarray(solution).ravel()
+    LtoG = asarray(problem_data["LtoG"])
+    table = {"element": elements, "face": faces}
+
+    lengths = zeros(len(elements))
+    integrals = zeros(len(elements))
+    diffusive = zeros(len(elements))
+    advective = zeros(len(elements))
+    for face_table, rows, nodes in get_face_groups(problem_data, table):
+        eType, NEN, k = face_table.eType, face_table.NEN, faces[rows[0]]
+        w = face_table.weights
+        S, DS = eval_shape_functions(eType, NEN, face_table.points[:, 0],
+                                     face_table.points[:, 1])
+        e_nodes = LtoG[elements[rows], :NEN]
+        e_coords = get_element_coords(problem_data, e_nodes)
+        detJ, gDS, x, y = calc_elem_geometry(e_coords, S, DS)
+
+        def eval_(name):
+            return broadcast_to(eval_coefficient(
+                functions[name], problem_data, e_nodes, S, x, y
+            ), x.shape)
+
+        corners = Corners[eType]
+        tangent = e_coords[:, (k + 1) % corners] - e_coords[:, k]
+        length = hypot(*tangent.T)
+        normal = stack((tangent[:, 1], -tangent[:, 0]), axis=1) / \
+            length[:, None]
+
+        # T is interpolated with the shape functions of the face nodes, as
+        # in the assembly of the MBC mass
+        T = solution[nodes].dot(face_table.S.T)
+        dTdn = einsum("egin,en,ei->eg", gDS, solution[e_nodes], normal)
+        Vn = eval_("V1") * normal[:, 0, None] + \
+            eval_("V2") * normal[:, 1, None]
+        lengths[rows] = length
+        integrals[rows] = length * T.dot(w)
+        diffusive[rows] = -length * (eval_("a") * dTdn).dot(w)
+        advective[rows] = length * (Vn * T).dot(w)
+    return lengths, integrals, diffusive, advective
+
+
+def calc_boundary_fluxes(problem_data, solution):
+    """
+    Calculates the fluxes through the faces of the NBC and MBC tables, and
+    through the whole boundary of the mesh as "boundary". Returns a dict of
+    the per-face arrays and their totals for each. For the NBC and MBC
+    faces, the outward diffusive flux given by the BC data is also
+    returned as "prescribed".
+    """
+    from psetup import get_element_corners, get_boundary_faces
+
+    BCs = problem_data["BCs"]
+    tables = [(BC_type, BCs[BC_type]) for BC_type in ("NBC", "MBC")]
+    LtoG = asarray(problem_data["LtoG"])
+    elements, faces = get_boundary_faces(
+        LtoG, get_element_corners(problem_data["eType"], LtoG)
+    )
+    tables.append(("boundary", {"element": elements, "face": faces}))
+
+    results = {}
+    for name, table in tables:
+        elements = asarray(table["element"])
+        faces = asarray(table["face"])
+        lengths, integrals, diffusive, advective = calc_face_fluxes(
+            problem_data, solution, elements, faces
+        )
+        result = {
+            "length": lengths,
+            "diffusive": diffusive,
+            "advective": advective
+        }
+        if name == "NBC":
+            result["prescribed"] = -table["data"][:, 0] * lengths
+        elif name == "MBC":
+            result["prescribed"] = -(table["data"][:, 0] * integrals +
+                                     table["data"][:, 1] * lengths)
+        result["total"] = dict((key, float(values.sum()))
+                               for key, values in result.items())
+        results[name] = result
+    return results
+
+
+def calc_quantities(problem_data, solution):
+    """
+    Calculates all derived quantities of the solution. Returns a dict of the
+    GQ point fields, the (NN, 2) nodal gradients, the integrals and norms
+    over the domain and the boundary fluxes. The problem data needs its
+    functions, UV and BCs, which calc_global drops.
+    """
+    print(" * Calculating derived quantities...")
+    with phase("quantities"):
+        fields, sums = calc_gauss_point_fields(problem_data, solution)
+        nodal_gradients = calc_nodal_gradients(
+            problem_data, solution, fields["gradient"], fields["wdetJ"]
+        )
+        boundary = calc_boundary_fluxes(problem_data, solution)
+
+    integrals = {
+        "area": sums["area"],
+        "T": sums["T"],
+        "mean_T": sums["T"] / sums["area"],
+        "L2_norm": sums["T2"] ** .5,
+        "H1_seminorm": sums["gradient2"] ** .5,
+        "source": sums["source"],
+        "reaction": sums["reaction"]
+    }
+    if "exact2" in sums:
+        from numpy import nanmax
+
+        functions = problem_data["functions"]
+        nodes = asarray(problem_data["nodes"], dtype=float)
+        exact = broadcast_to(functions["exactSoln"](nodes[:, 0], nodes[:, 1]),
+                             (len(nodes),))
+        integrals.update({
+            "L2_error": sums["error2"] ** .5,
+            "relative_L2_error": (sums["error2"] / sums["exact2"]) ** .5
+            if sums["exact2"] else float("nan"),
+            "H1_error": sums["error_gradient2"] ** .5,
+            "max_nodal_error": float(nanmax(abs(
+                asarray(solution).ravel() - exact
+            )))
+        })
+
+    return {
+        "fields": fields,
+        "nodal_gradients": nodal_gradients,
+        "integrals": integrals,
+        "boundary": boundary
+    }
+
+
+def print_quantities(quantities):
+    print(" * Integrals:")
+    integrals = quantities["integrals"]
+    for name in sorted(integrals):
+        print("  * {0}: {1:.6g}".format(name, integrals[name]))
+    print(" * Outward fluxes:")
+    for name in ("NBC", "MBC", "boundary"):
+        total = quantities["boundary"][name]["total"]
+        print("  * {0}: {1}".format(name, ", ".join(
+            "{0} {1:.6g}".format(key, total[key]) for key in sorted(total)
+        )))
+
+
+def save_quantities(file_name, quantities):
+    """
+    Writes the derived quantities: the integrals and the boundary flux
+    totals as JSON, or also the GQ point fields, nodal gradients and per
+    face fluxes as arrays if the file name ends with .npz.
+    """
+    import json
+    import os
+
+    summary = {
+        "integrals": quantities["integrals"],
+        "boundary": dict((name, result["total"])
+                         for name, result in quantities["boundary"].items())
+    }
+    print(" * Saving quantities to {0}...".format(file_name))
+    if os.path.splitext(file_name)[1].lower() != ".npz":
+        with open(file_name, "w") as output:
+            json.dump(summary, output, indent=2, sort_keys=True)
+        return
+
+    from numpy import savez_compressed
+
+    arrays = dict(("gauss_" + name, values)
+                  for name, values in quantities["fields"].items())
+    arrays["nodal_gradients"] = quantities["nodal_gradients"]
+    for name, result in quantities["boundary"].items():
+        for key, values in result.items():
+            if key != "total":
+                arrays["{0}_{1}".format(name, key)] = values
+    arrays["summary"] = json.dumps(summary, sort_keys=True)
+    savez_compressed(file_name, **arrays)
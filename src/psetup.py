@@ -11,6 +11,7 @@
 
 from math import sqrt
 from json import load as json_load
+from collections import namedtuple
 import os
 
 GQ = {
@@ -46,22 +47,22 @@ GQ = {
         ],
         16:
         [
-            {"coord": (-0.8611363116, -0.8611363116), "weight": 0.3478548451 * 0.3478548451},
-            {"coord": (-0.3399810435, -0.8611363116), "weight": 0.3478548451 * 0.6521451548},
-            {"coord": (0.3399810435, -0.8611363116), "weight": 0.3478548451 * 0.6521451548},
-            {"coord": (0.8611363116, -0.8611363116), "weight": 0.3478548451 * 0.3478548451},
-            {"coord": (-0.8611363116, -0.3399810435), "weight": 0.6521451548 * 0.3478548451},
-            {"coord": (-0.3399810435, -0.3399810435), "weight": 0.6521451548 * 0.6521451548},
-            {"coord": (0.3399810435, -0.3399810435), "weight": 0.6521451548 * 0.6521451548},
-            {"coord": (0.8611363116, -0.3399810435), "weight": 0.6521451548 * 0.3478548451},
-            {"coord": (-0.8611363116, 0.3399810435), "weight": 0.6521451548 * 0.3478548451},
-            {"coord": (-0.3399810435, 0.3399810435), "weight": 0.6521451548 * 0.6521451548},
-            {"coord": (0.3399810435, 0.3399810435), "weight": 0.6521451548 * 0.6521451548},
-            {"coord": (0.8611363116, 0.3399810435), "weight": 0.6521451548 * 0.3478548451},
-            {"coord": (-0.8611363116, 0.8611363116), "weight": 0.3478548451 * 0.3478548451},
-            {"coord": (-0.3399810435, 0.8611363116), "weight": 0.3478548451 * 0.6521451548},
-            {"coord": (0.3399810435, 0.8611363116), "weight": 0.3478548451 * 0.6521451548},
-            {"coord": (0.8611363116, 0.8611363116), "weight": 0.3478548451 * 0.3478548451}
+            {"coord": (-0.8611363115940526, -0.8611363115940526), "weight": 0.3478548451374538 * 0.3478548451374538},
+            {"coord": (-0.3399810435848563, -0.8611363115940526), "weight": 0.3478548451374538 * 0.6521451548625461},
+            {"coord": (0.3399810435848563, -0.8611363115940526), "weight": 0.3478548451374538 * 0.6521451548625461},
+            {"coord": (0.8611363115940526, -0.8611363115940526), "weight": 0.3478548451374538 * 0.3478548451374538},
+            {"coord": (-0.8611363115940526, -0.3399810435848563), "weight": 0.6521451548625461 * 0.3478548451374538},
+            {"coord": (-0.3399810435848563, -0.3399810435848563), "weight": 0.6521451548625461 * 0.6521451548625461},
+            {"coord": (0.3399810435848563, -0.3399810435848563), "weight": 0.6521451548625461 * 0.6521451548625461},
+            {"coord": (0.8611363115940526, -0.3399810435848563), "weight": 0.6521451548625461 * 0.3478548451374538},
+            {"coord": (-0.8611363115940526, 0.3399810435848563), "weight": 0.6521451548625461 * 0.3478548451374538},
+            {"coord": (-0.3399810435848563, 0.3399810435848563), "weight": 0.6521451548625461 * 0.6521451548625461},
+            {"coord": (0.3399810435848563, 0.3399810435848563), "weight": 0.6521451548625461 * 0.6521451548625461},
+            {"coord": (0.8611363115940526, 0.3399810435848563), "weight": 0.6521451548625461 * 0.3478548451374538},
+            {"coord": (-0.8611363115940526, 0.8611363115940526), "weight": 0.3478548451374538 * 0.3478548451374538},
+            {"coord": (-0.3399810435848563, 0.8611363115940526), "weight": 0.3478548451374538 * 0.6521451548625461},
+            {"coord": (0.3399810435848563, 0.8611363115940526), "weight": 0.3478548451374538 * 0.6521451548625461},
+            {"coord": (0.8611363115940526, 0.8611363115940526), "weight": 0.3478548451374538 * 0.3478548451374538}
         ]
     },
     "tri":
@@ -92,6 +93,22 @@ GQ = {
             {"coord": (0.101286507323456, 0.797426985353087), "weight":	0.125939180544 / 2.},
             {"coord": (0.101286507323456, 0.101286507323456), "weight":	0.125939180544 / 2.},
             {"coord": (0.797426985353087, 0.101286507323456), "weight":	0.125939180544 / 2.}
+        ],
+        12:
+        [
+            # Dunavant's rule of degree 6
+            {"coord": (0.249286745170910, 0.249286745170910), "weight": 0.116786275726379 / 2.},
+            {"coord": (0.501426509658179, 0.249286745170910), "weight": 0.116786275726379 / 2.},
+            {"coord": (0.249286745170910, 0.501426509658179), "weight": 0.116786275726379 / 2.},
+            {"coord": (0.063089014491502, 0.063089014491502), "weight": 0.050844906370207 / 2.},
+            {"coord": (0.873821971016996, 0.063089014491502), "weight": 0.050844906370207 / 2.},
+            {"coord": (0.063089014491502, 0.873821971016996), "weight": 0.050844906370207 / 2.},
+            {"coord": (0.310352451033784, 0.053145049844817), "weight": 0.082851075618374 / 2.},
+            {"coord": (0.636502499121399, 0.053145049844817), "weight": 0.082851075618374 / 2.},
+            {"coord": (0.053145049844817, 0.310352451033784), "weight": 0.082851075618374 / 2.},
+            {"coord": (0.636502499121399, 0.310352451033784), "weight": 0.082851075618374 / 2.},
+            {"coord": (0.053145049844817, 0.636502499121399), "weight": 0.082851075618374 / 2.},
+            {"coord": (0.310352451033784, 0.636502499121399), "weight": 0.082851075618374 / 2.}
         ]
     }
 }
@@ -112,9 +129,9 @@ Shape = {
         ],
         "quadratic":
         [
-            {"main": lambda ksi, eta: 2 * (1 - ksi - eta) * (.5 - ksi - eta), "dKsi": lambda ksi, eta :-3 + 4 * eta + 2 * ksi, "dEta": lambda ksi, eta:-3 + 4 * ksi + 2 * eta},
+            {"main": lambda ksi, eta: 2 * (1 - ksi - eta) * (.5 - ksi - eta), "dKsi": lambda ksi, eta :-3 + 4 * ksi + 4 * eta, "dEta": lambda ksi, eta:-3 + 4 * ksi + 4 * eta},
             {"main": lambda ksi, eta: 2 * ksi * (ksi - .5), "dKsi": lambda ksi, eta : 4 * ksi - 1, "dEta": lambda ksi, eta:0},
-            {"main": lambda ksi, eta: 2 * eta * (eta - .5), "dKsi": lambda ksi, eta :0, "dEta": lambda ksi, eta: 4 * ksi - 1},
+            {"main": lambda ksi, eta: 2 * eta * (eta - .5), "dKsi": lambda ksi, eta :0, "dEta": lambda ksi, eta: 4 * eta - 1},
             {"main": lambda ksi, eta: 4 * (1 - ksi - eta) * ksi, "dKsi": lambda ksi, eta : 4 * (1 - 2 * ksi - eta), "dEta": lambda ksi, eta:-4 * ksi},
             {"main": lambda ksi, eta: 4 * ksi * eta, "dKsi": lambda ksi, eta :4 * eta, "dEta": lambda ksi, eta:4 * ksi},
             {"main": lambda ksi, eta: 4 * (1 - ksi - eta) * eta, "dKsi": lambda ksi, eta :-4 * eta, "dEta": lambda ksi, eta:4 * (1 - 2 * eta - ksi)}
@@ -144,100 +161,671 @@ Shape = {
     }
 }
 
+#==============================================================================
+# Cubic shape functions are generated as Lagrange polynomials on the node
+# lattices below, instead of being written out. Nodes are given by their
+# lattice indexes (i, j), at ksi = i / 3, eta = j / 3 for triangles and at
+# ksi = -1 + 2 * i / 3, eta = -1 + 2 * j / 3 for quads. After the corners,
+# each edge has two nodes in the direction of the edge, then come the
+# interior nodes.
+#==============================================================================
+CubicNodes = {
+    "tri": [(0, 0), (3, 0), (0, 3), (1, 0), (2, 0), (2, 1), (1, 2), (0, 2),
+            (0, 1), (1, 1)],
+    "quad": [(0, 0), (3, 0), (3, 3), (0, 3), (1, 0), (2, 0), (3, 1), (3, 2),
+             (2, 3), (1, 3), (0, 2), (0, 1), (1, 1), (2, 1), (2, 2), (1, 2)]
+}
+
+
+def make_product(coordinates, factors):
+    """
+    Creates a shape function, and its derivatives, as the product of the
+    given factors. Each factor is (k, scale, shift, dKsi, dEta) for the value
+    scale * (u - shift) of the coordinate u = coordinates(ksi, eta)[k], whose
+    derivatives wrt. ksi and eta are dKsi and dEta.
+    """
+
+    def values_(ksi, eta):
+        u = coordinates(ksi, eta)
+        return [scale * (u[k] - shift) for k, scale, shift, dKsi, dEta
+                in factors]
+
+    def main_(ksi, eta):
+        result = 1.
+        for value in values_(ksi, eta):
+            result = result * value
+        return result
+
+    def derivative_(direction):
+        def derivative(ksi, eta):
+            values = values_(ksi, eta)
+            result = 0.
+            for f, factor in enumerate(factors):
+                term = factor[1] * factor[3 + direction]
+                for g, value in enumerate(values):
+                    if g != f:
+                        term = term * value
+                result = result + term
+            return result
+        return derivative
+
+    return {"main": main_, "dKsi": derivative_(0), "dEta": derivative_(1)}
+
+
+def make_lagrange_shape(eType, lattice, order):
+    """
+    Generates the shape functions of the Lagrange element of the given order
+    with nodes on the given lattice. Triangle shape functions are products of
+    (order * L - k) / (k + 1) factors of the area coordinates L, quad shape
+    functions are products of 1D Lagrange polynomials in ksi and eta.
+    """
+    shape_funcs = []
+    if eType == "tri":
+        def coordinates(ksi, eta):
+            return (1 - ksi - eta, ksi, eta)
+        derivatives = ((-1, -1), (1, 0), (0, 1))
+
+        for i, j in lattice:
+            factors = []
+            for k, count in enumerate((order - i - j, i, j)):
+                for m in range(count):
+                    factors.append((k, order / (m + 1.), m / float(order)) +
+                                   derivatives[k])
+            shape_funcs.append(make_product(coordinates, factors))
+    else:
+        def coordinates(ksi, eta):
+            return (ksi, eta)
+        derivatives = ((1, 0), (0, 1))
+        points = [-1. + 2. * m / order for m in range(order + 1)]
+
+        for node in lattice:
+            factors = []
+            for k, i in enumerate(node):
+                for m, point in enumerate(points):
+                    if m != i:
+                        factors.append((k, 1. / (points[i] - point), point) +
+                                       derivatives[k])
+            shape_funcs.append(make_product(coordinates, factors))
+    return shape_funcs
+
+
+Shape["tri"]["cubic"] = make_lagrange_shape("tri", CubicNodes["tri"], 3)
+Shape["quad"]["cubic"] = make_lagrange_shape("quad", CubicNodes["quad"], 3)
+
 Order = {
-    "tri": {3: "linear", 6: "quadratic"},
-    "quad": {4: "linear", 9: "quadratic"}
+    "tri": {3: "linear", 6: "quadratic", 10: "cubic"},
+    "quad": {4: "linear", 9: "quadratic", 16: "cubic"}
 }
 
+# Number of corner nodes, which are always the first nodes of an element
+Corners = {"tri": 3, "quad": 4}
+
+# Reference coordinates of the corners, counter-clockwise. Face k of an
+# element is between its corners k and k + 1.
+CornerCoords = {
+    "tri": ((0., 0.), (1., 0.), (0., 1.)),
+    "quad": ((-1., -1.), (1., -1.), (1., 1.), (-1., 1.))
+}
+
+# Element type and number of nodes of each element, which the number of nodes
+# alone identifies. Used to group the elements of mixed meshes.
+ElementTypes = dict((NEN, (eType, NEN))
+                    for eType, orders in Order.items() for NEN in orders)
+
+# GQ points used for each element type and number of nodes when NGP is not
+# given, or for all elements of mixed meshes. The rules integrate the mass
+# terms of elements with straight edges exactly.
+DefaultNGP = {
+    "tri": {3: 3, 6: 7, 10: 12},
+    "quad": {4: 4, 9: 9, 16: 16}
+}
+
+#==============================================================================
+# Reference element tables. S is (NGP, NEN) shape function values, DS is
+# (NGP, 2, NEN) derivatives wrt. ksi (DS[:, 0]) and eta (DS[:, 1]), weights
+# and coords are GQ weights and coordinates, faces is the local node pair of
+# each element face.
+#==============================================================================
+RefElement = namedtuple("RefElement", "eType NEN NGP S DS weights coords faces")
+RefElements = {}
+
+
+def eval_shape_functions(eType, NEN, ksi, eta):
+    """
+    Evaluates the shape functions and their derivatives at arrays of points
+    of the reference element. Returns S as (..., NEN) and DS as (..., 2, NEN)
+    where DS[..., 0, :] are the derivatives wrt. ksi and DS[..., 1, :] wrt. eta.
+    """
+    from numpy import asarray, broadcast_to, stack
+
+    shape_funcs = Shape[eType][Order[eType][NEN]]
+    ksi = asarray(ksi, dtype=float)
+    eta = asarray(eta, dtype=float)
+
+    def eval_(key):
+        # Constant derivatives are returned as scalars by the definitions
+        return stack([broadcast_to(shape_func[key](ksi, eta), ksi.shape)
+                      for shape_func in shape_funcs], axis=-1)
+
+    return eval_("main"), stack((eval_("dKsi"), eval_("dEta")), axis=-2)
+
+
+def get_ref_element(eType, NEN, NGP):
+    """
+    Returns the reference element tables for the given element type, number of
+    element nodes and GQ points. Since these depend on nothing else, they are
+    calculated once and cached as read-only arrays.
+    """
+    from numpy import array
+
+    key = (eType, NEN, NGP)
+    if key in RefElements:
+        return RefElements[key]
+
+    GQ_points = GQ[eType][NGP]
+    coords = array([GQ_point["coord"] for GQ_point in GQ_points], dtype=float)
+    weights = array([GQ_point["weight"] for GQ_point in GQ_points], dtype=float)
+    S, DS = eval_shape_functions(eType, NEN, coords[:, 0], coords[:, 1])
+    corners = Corners[eType]
+    faces = array([(k, (k + 1) % corners) for k in range(corners)])
 
-def process_functions(functions, UV_data, nodes):
+    for table in (coords, weights, S, DS, faces):
+        table.setflags(write=False)
+
+    RefElements[key] = RefElement(eType, NEN, NGP, S, DS, weights, coords,
+                                  faces)
+    return RefElements[key]
+
+
+# Tables of the face k of an element: its type and number of nodes, its local
+# nodes, the (FACE_NGP, 2) reference coordinates of the GQ points along the
+# face, the values of the shape functions of its nodes at them as
+# (FACE_NGP, n) S and the GQ weights, which sum to 1 and are multiplied by
+# the face lengths. Faces are assumed to be straight.
+FaceTable = namedtuple("FaceTable", "eType NEN nodes points S weights")
+FaceTables = {}
+
+# GQ points along the faces, which integrate the products of two shape
+# functions of cubic elements exactly
+FACE_NGP = 4
+
+
+def get_face_table(eType, NEN, face):
+    """
+    Returns the FaceTable of the given face of elements with the given type
+    and number of nodes, which is calculated once and cached.
+    """
+    from numpy import asarray, flatnonzero
+    from numpy.polynomial.legendre import leggauss
+
+    key = (eType, NEN, face)
+    if key in FaceTables:
+        return FaceTables[key]
+
+    # Points along the face from its corner k to corner k + 1
+    s, weights = leggauss(FACE_NGP)
+    s = (s + 1.) / 2.
+    corners = asarray(CornerCoords[eType])
+    start = corners[face]
+    end = corners[(face + 1) % len(corners)]
+    points = start + s[:, None] * (end - start)
+    S = eval_shape_functions(eType, NEN, points[:, 0], points[:, 1])[0]
+    # Only the shape functions of the nodes on the face are nonzero on it
+    nodes = flatnonzero(abs(S).max(axis=0) > 1e-12)
+    S = S[:, nodes]
+    weights = weights / 2.
+
+    for table in (nodes, points, S, weights):
+        table.setflags(write=False)
+
+    FaceTables[key] = FaceTable(eType, NEN, nodes, points, S, weights)
+    return FaceTables[key]
+
+
+# A group of the elements of a mesh with the same type and number of nodes:
+# their reference element tables and their indexes in LtoG, which is a slice
+# of all elements for meshes of a single type
+ElementGroup = namedtuple("ElementGroup", "ref elements")
+
+
+def get_NGP(eType, NEN, NGP=None):
+    """
+    Returns the number of GQ points for the element type and number of nodes,
+    which is chosen from the order of the element if NGP is not given.
+    """
+    if not NGP:
+        return DefaultNGP[eType][NEN]
+    if NGP not in GQ[eType]:
+        raise ValueError("There is no GQ rule with {0} points for {1} "
+                         "elements.".format(NGP, eType))
+    return NGP
+
+
+def get_connectivity(LtoG):
+    """
+    Converts LtoG into an int32 array. Rows of different lengths, which
+    mixed meshes have, are padded with -1 up to the longest one.
+    """
+    from numpy import asarray, full
+
+    if hasattr(LtoG, "dtype") or not len(LtoG):
+        return asarray(LtoG, dtype="int32")
+    widths = [len(row) for row in LtoG]
+    if min(widths) == max(widths):
+        return asarray(LtoG, dtype="int32")
+
+    padded = full((len(LtoG), max(widths)), -1, dtype="int32")
+    for e, row in enumerate(LtoG):
+        padded[e, :len(row)] = row
+    return padded
+
+
+def get_element_widths(LtoG):
+    """
+    Returns the number of nodes of each element of a mixed mesh.
+    """
+    from numpy import asarray
+
+    return (asarray(LtoG) >= 0).sum(axis=1)
+
+
+def get_element_groups(problem_data):
+    """
+    Groups the elements of the mesh by their type and number of nodes, which
+    mixed meshes have several of. The elements of each group are calculated
+    with the reference element tables of the group.
+    """
+    from numpy import unique, flatnonzero
+
+    if problem_data["eType"] != "mixed":
+        return [ElementGroup(problem_data["ref"], slice(None))]
+
+    widths = get_element_widths(problem_data["LtoG"])
+    groups = []
+    for NEN in unique(widths):
+        if NEN not in ElementTypes:
+            raise ValueError("There are no elements with {0} nodes.".format(
+                NEN
+            ))
+        eType = ElementTypes[NEN][0]
+        groups.append(ElementGroup(
+            get_ref_element(eType, NEN, DefaultNGP[eType][NEN]),
+            flatnonzero(widths == NEN)
+        ))
+    return groups
+
+
+def get_element_corners(eType, LtoG):
+    """
+    Returns the number of corners of the elements of a mesh of the given
+    type: a single number for meshes of a single type and an array of the
+    corners of each element for mixed meshes.
+    """
+    from numpy import zeros
+
+    if eType != "mixed":
+        return Corners[eType]
+
+    corners = zeros(max(ElementTypes) + 1, dtype="int32")
+    for NEN, element in ElementTypes.items():
+        corners[NEN] = Corners[element[0]]
+    return corners[get_element_widths(LtoG)]
+
+
+def get_edges(LtoG, corners):
+    """
+    Finds the unique edges of the mesh. Edge k of an element connects its
+    corners k and k + 1. corners is the number of corners of all elements,
+    or an array of the corners of each element for mixed meshes, whose
+    triangles get -1 for their missing fourth edge. Returns (n, 2) edge
+    nodes and the (NE, corners) edge index of each element edge.
+    """
+    from numpy import stack, roll, sort, unique, arange, full, \
+        take_along_axis
+
+    if isinstance(corners, int):
+        corner_nodes = LtoG[:, :corners]
+        edges = stack((corner_nodes, roll(corner_nodes, -1, axis=1)), axis=2)
+        edges, edge_index = unique(sort(edges.reshape((-1, 2)), axis=1),
+                                   axis=0, return_inverse=True)
+        return edges, edge_index.reshape((-1, corners))
+
+    k = arange(corners.max())
+    exists = k[None, :] < corners[:, None]
+    following = take_along_axis(LtoG, (k[None, :] + 1) % corners[:, None],
+                                axis=1)
+    edges = stack((LtoG[:, :len(k)], following), axis=2)[exists]
+    edges, inverse = unique(sort(edges, axis=1), axis=0, return_inverse=True)
+    edge_index = full(exists.shape, -1, dtype=inverse.dtype)
+    edge_index[exists] = inverse.ravel()
+    return edges, edge_index
+
+
+def get_boundary_faces(LtoG, corners):
+    """
+    Finds the element faces that are not shared with another element. Returns
+    the element and face indexes.
+    """
+    from numpy import bincount, flatnonzero
+
+    edges, edge_index = get_edges(LtoG, corners)
+    exists = edge_index >= 0
+    is_boundary = bincount(edge_index[exists], minlength=len(edges)) == 1
+    element, face = divmod(flatnonzero(exists & is_boundary[edge_index]),
+                           edge_index.shape[1])
+    return element, face
+
+
+# Names that can be used in coefficient function expressions, mapped to the
+# NumPy functions that evaluate them element-wise on arrays
+ExpressionNames = {
+    "sin": "sin", "cos": "cos", "tan": "tan",
+    "asin": "arcsin", "acos": "arccos", "atan": "arctan", "atan2": "arctan2",
+    "arcsin": "arcsin", "arccos": "arccos", "arctan": "arctan",
+    "arctan2": "arctan2", "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+    "exp": "exp", "log": "log", "log10": "log10", "sqrt": "sqrt",
+    "abs": "abs", "fabs": "abs", "pow": "power", "hypot": "hypot",
+    "where": "where", "pi": "pi", "e": "e"
+}
+
+
+def maximum(*values):
+    """
+    Element-wise max of any number of arguments, or the max of a sequence.
+    """
+    from functools import reduce
+    import numpy
+
+    if len(values) == 1:
+        return numpy.max(values[0])
+    return reduce(numpy.maximum, values)
+
+
+def minimum(*values):
+    """
+    Element-wise min of any number of arguments, or the min of a sequence.
+    """
+    from functools import reduce
+    import numpy
+
+    if len(values) == 1:
+        return numpy.min(values[0])
+    return reduce(numpy.minimum, values)
+
+
+class CoefficientFunction(object):
+    """
+    A coefficient function of the DE/problem which takes x and y either as
+    scalars or as arrays of coordinates and evaluates element-wise. If the
+    function does not depend on x or y, its value is kept in "constant". If
+    it is a nodal field of the problem, "component" is its row in UV, which
+    is interpolated with the shape functions at GQ points.
+    """
+
+    def __init__(self, source, func, constant=None, component=None):
+        self.source = source
+        self.func = func
+        self.constant = constant
+        self.component = component
+
+    def __call__(self, x, y):
+        if self.constant is not None:
+            from numpy import full, shape
+            return full(shape(x), self.constant)
+        return self.func(x, y)
+
+
+def process_functions(functions, UV_data, nodes, LtoG=None, element=None):
     """
     Processes coefficient functions of the DE/problem to create directly
-    callable functions from Python.
+    callable functions from Python. The created functions are evaluated
+    element-wise on arrays of x and y, so a function can be calculated for
+    all GQ points of a mesh with a single call. The "x" and "y" functions are
+    the U and V values given at the nodes. These are interpolated with the
+    shape functions of the elements, given by LtoG and (eType, NEN) element.
     """
 
-    default_lambda = "lambda x,y:"
-    global_vars = None
+    import numpy
+
+    # The point locator for evaluating nodal fields at arbitrary points is
+    # only built if it is ever needed
+    locators = []
+
+    def get_field_(component):
+        values = numpy.asarray(UV_data[component], dtype=float)
+
+        def field_(x, y):
+            if not locators:
+                if LtoG is None:
+                    raise ValueError("The mesh is needed to evaluate nodal "
+                                     "fields.")
+                from locator import PointLocator
+                locators.append(PointLocator(nodes, LtoG, *element))
+            return locators[0].interpolate(values, x, y)
+        return field_
+
     for name in functions:
-        if functions[name] == '?':
-            functions[name] = '0'
-        elif functions[name] == "x" or functions[name] == "y":
-            #If it is indicated that the provided U & V values to be used
-            if not global_vars:
-                x, y = [0] * nodes.__len__(), [0] * nodes.__len__()
-                for i, node in enumerate(nodes):
-                    x[i] = node[0]
-                    y[i] = node[1]
-
-                from scipy.interpolate import bisplrep, bisplev
-                # Fit a bivariate B-spline to U and V values to calculate
-                # values that are not on the nodes  This "global_vars"
-                # dictionary is provided to eval for the lambda's to work
-                # properly
-                global_vars = {
-                    "x_tck": bisplrep(x, y, UV_data[0]),
-                    "y_tck": bisplrep(x, y, UV_data[1]),
-                    "bisplev": bisplev
-                }
-
-            functions[name] = eval(
-                "lambda x,y: bisplev(x, y, {0}_tck)".format(functions[name]),
-                global_vars
+        source = functions[name]
+        expression = source
+        if source == '?':
+            expression = '0'
+        elif source == "x" or source == "y":
+            # The provided U & V values are to be used
+            component = 0 if source == "x" else 1
+            functions[name] = CoefficientFunction(
+                source, get_field_(component), component=component
             )
             continue
 
-        functions[name] = default_lambda + functions[name]
-        functions[name] = eval(functions[name])
+        functions[name] = compile_expression(expression, name, source)
     return functions
 
 
+def compile_expression(expression, name="expression", source=None):
+    """
+    Compiles an expression of the x and y coordinates into a
+    CoefficientFunction. Expressions are evaluated on whole arrays of x and y
+    with NumPy. Expressions that only work on scalars, like conditional
+    expressions, are evaluated point by point instead when that fails.
+    """
+    import numpy
+
+    namespace = dict((name_, getattr(numpy, numpy_name))
+                     for name_, numpy_name in ExpressionNames.items())
+    namespace.update(min=minimum, max=maximum)
+    code = compile(expression, name, "eval")
+    array_func = eval("lambda x, y: " + expression, namespace)
+    constant = None
+    if "x" not in code.co_names and "y" not in code.co_names:
+        # Fold the expression into its value since it does not depend on
+        # the coordinates
+        constant = float(eval(code, namespace))
+
+    # Set to the point by point function once the array one fails
+    scalar_funcs = []
+
+    def func(x, y):
+        if not scalar_funcs:
+            try:
+                return array_func(x, y)
+            except (ValueError, TypeError):
+                if not numpy.ndim(x) and not numpy.ndim(y):
+                    raise
+                scalar_funcs.append(
+                    numpy.vectorize(array_func, otypes=[float])
+                )
+        return scalar_funcs[0](x, y)
+
+    return CoefficientFunction(
+        expression if source is None else source, func, constant
+    )
+
+
+# Fields of the BC records and the types of the arrays they are kept in
+BCFields = {
+    "EBC": (("node", "<i4"), ("data", "<f8")),
+    "NBC": (("element", "<i4"), ("face", "<i4"), ("data", "<f8")),
+    "MBC": (("element", "<i4"), ("face", "<i4"), ("data", "<f8"))
+}
+
+
+def process_bcs(BCs):
+    """
+    Converts the lists of BC records into tables of arrays, one array for each
+    field, e.g. BCs["EBC"]["node"], so that they can be applied in bulk. Tables
+    that are already in this form are kept as they are.
+    """
+    from numpy import asarray, zeros
+
+    BCs = BCs or {}
+    tables = {}
+    for BC_type, fields in BCFields.items():
+        records = BCs.get(BC_type) or []
+        if isinstance(records, dict):
+            columns = records
+        else:
+            columns = dict((field, [BC[field] for BC in records])
+                           for field, dtype in fields)
+
+        table = tables[BC_type] = {}
+        for field, dtype in fields:
+            table[field] = asarray(columns[field], dtype=dtype)
+        if table["data"].size:
+            table["data"] = table["data"].reshape((len(table["data"]), -1))
+        else:
+            table["data"] = table["data"].reshape((0, 2))
+        if table["data"].shape[1] < 2:
+            # Only the first value is given for EBCs and NBCs
+            data = zeros((len(table["data"]), 2))
+            data[:, :table["data"].shape[1]] = table["data"]
+            table["data"] = data
+
+    return tables
+
+
 def process_problem_data(problem_data):
     """
     Takes the raw problem data then converts the string functions into usable
-    functions with process_functions, determines necessary shape funcstions and
-    embeds them to problem_data with necessary GQ info.
+    functions with process_functions, and embeds the reference element tables
+    of shape functions and GQ info to problem_data.
     """
 
-    eType = problem_data["eType"]
-    eOrder = Order[eType][problem_data["NEN"]]
-    problem_data["GQ"] = GQ[eType][problem_data["NGP"]]
-    problem_data["shapefunc"] = Shape[eType][eOrder]
-
     if not "UV" in problem_data:
         problem_data["UV"] = None
 
+    # Mesh data is kept in compact arrays, whichever reader is used
+    from numpy import asarray
+    problem_data["nodes"] = asarray(problem_data["nodes"], dtype="float64")
+    problem_data["LtoG"] = get_connectivity(problem_data["LtoG"])
+    if problem_data["UV"] is not None:
+        problem_data["UV"] = asarray(problem_data["UV"], dtype="float64")
+    problem_data["BCs"] = process_bcs(problem_data.get("BCs"))
+
+    LtoG = problem_data["LtoG"]
+    if problem_data["eType"] == "mixed" or (LtoG.size and LtoG.min() < 0):
+        # Elements of mixed meshes are grouped by their number of nodes, with
+        # padded LtoG rows, and each group uses the GQ rule of its order
+        if problem_data.get("NGP"):
+            print("Warning: NGP {0} is ignored for the mixed mesh, whose "
+                  "elements use the GQ rules of their orders.".format(
+                      problem_data["NGP"]))
+        problem_data["eType"] = "mixed"
+        problem_data["NEN"] = problem_data["LtoG"].shape[1]
+        problem_data["NGP"] = None
+        problem_data["ref"] = None
+    else:
+        if LtoG.shape[1] != problem_data.get("NEN"):
+            raise ValueError("The elements have {0} nodes but NEN is {1}."
+                             .format(LtoG.shape[1], problem_data.get("NEN")))
+        problem_data["NGP"] = get_NGP(problem_data["eType"],
+                                      problem_data["NEN"],
+                                      problem_data.get("NGP"))
+        problem_data["ref"] = get_ref_element(
+            problem_data["eType"],
+            problem_data["NEN"],
+            problem_data["NGP"]
+        )
+
     if not "title" in problem_data:
         problem_data["title"] = "Untitled Problem"
 
     process_functions(
         problem_data["functions"],
         problem_data["UV"],
-        problem_data["nodes"]
+        problem_data["nodes"],
+        problem_data["LtoG"],
+        (problem_data["eType"], problem_data["NEN"])
     )
 
     return problem_data
 
 
-def read_problem_data(input_name='', output_name=''):
+def read_json(file_name, reader="stream"):
+    """
+    Reads a JSON problem file either with the streaming reader, which reads
+    the mesh arrays directly into NumPy arrays, or with json.load.
+    """
+    if reader == "stream":
+        import io
+        from jsonstream import load as json_stream_load
+
+        with io.open(file_name, "r", encoding="utf-8") as input_file:
+            return json_stream_load(input_file)
+
+    with open(file_name, "r") as input_file:
+        return json_load(input_file)
+
+
+def compare_readers(file_name):
+    """
+    Reads the JSON problem file with both readers, reporting the time and the
+    peak memory used by each.
+    """
+    from time import time
+    import tracemalloc
+    # Imported beforehand so that the import is not measured
+    import numpy  # noqa: F401
+
+    for reader in ("json", "stream"):
+        tracemalloc.start()
+        t = time()
+        problem_data = read_json(file_name, reader)
+        t = time() - t
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del problem_data
+
+        print(" * {0} reader: {1:.3f} seconds, {2:.2f} MB peak memory".format(
+            reader, t, peak / 1048576.
+        ))
+
+
+def read_problem_data(input_name='', output_name='', reader="stream"):
     """
     Reads the problem data from the user provided file name.
-    The file can either be an .inp file or a .json file.
+    The file can either be a .json file or a binary problem file (.fpb).
     """
 
     if not input_name:
-        input_name = raw_input('Enter input file name: ')
+        input_name = input('Enter input file name: ')
 
     file_name, file_ext = os.path.splitext(input_name)
 
     if file_ext == "":
         if os.path.exists(file_name + ".json"):
             file_ext = ".json"
+        elif os.path.exists(file_name + ".fpb"):
+            file_ext = ".fpb"
         else:
-            print("Cannot find valid input file. Expecting a .json file.")
+            print("Cannot find valid input file. Expecting a .json or .fpb "
+                  "file.")
             exit(127)
 
-    with open(file_name + file_ext, "r") as input_file:
-        problem_data = json_load(input_file)
+    if file_ext == ".fpb":
+        from binproblem import read_binary
+        problem_data = read_binary(file_name + file_ext)
+    else:
+        problem_data = read_json(file_name + file_ext, reader)
 
     if output_name:
         problem_data["output"] = output_name
@@ -248,5 +836,7 @@ def read_problem_data(input_name='', output_name=''):
     return problem_data
 
 
-def get_problem_data(input_name='', output_name=''):
-    return process_problem_data(read_problem_data(input_name, output_name))
+def get_problem_data(input_name='', output_name='', reader="stream"):
+    return process_problem_data(
+        read_problem_data(input_name, output_name, reader)
+    )
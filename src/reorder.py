@@ -0,0 +1,163 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides the renumbering of the nodes and elements of a processed problem
+    to reduce the bandwidth of K, which reduces the fill-in of the direct
+    solver and improves the memory locality of assembly. Nodes are renumbered
+    with the Reverse Cuthill-McKee ordering of the mesh graph and elements are
+    sorted by their new node numbers. The solution is mapped back to the
+    original numbering with restore_order().
+@version: 1.0
+"""
+
+from instrument import record
+
+
+def get_lowest_nodes(LtoG):
+    """
+    Returns the lowest node number of each element. Rows of mixed meshes are
+    padded with -1, which is skipped.
+    """
+    from numpy import where, iinfo
+
+    return where(LtoG >= 0, LtoG, iinfo(LtoG.dtype).max).min(axis=1)
+
+
+def get_bandwidth(LtoG):
+    """
+    Returns the bandwidth of K for the given connectivity, which is the
+    largest difference of the node numbers of an element.
+    """
+    if not len(LtoG):
+        return 0
+    return int((LtoG.max(axis=1) - get_lowest_nodes(LtoG)).max())
+
+
+def renumber(new_index, LtoG):
+    """
+    Maps the nodes of LtoG to their new numbers, keeping the padding of mixed
+    meshes.
+    """
+    from numpy import where
+
+    return where(LtoG >= 0, new_index[LtoG], -1).astype("int32")
+
+
+def get_node_graph(LtoG, NN):
+    """
+    Returns the adjacency of the nodes as a sparse matrix, which has the same
+    sparsity pattern as K.
+    """
+    from numpy import repeat, tile, ones
+    from scipy import sparse
+
+    NEN = LtoG.shape[1]
+    rows = repeat(LtoG, NEN, axis=1).ravel()
+    cols = tile(LtoG, (1, NEN)).ravel()
+    if len(rows) and rows.min() < 0:
+        # Padding of mixed meshes
+        connected = (rows >= 0) & (cols >= 0)
+        rows = rows[connected]
+        cols = cols[connected]
+    graph = sparse.coo_matrix((ones(len(rows), dtype="int8"), (rows, cols)),
+                              shape=(NN, NN)).tocsr()
+    graph.sum_duplicates()
+    return graph
+
+
+def get_rcm_order(LtoG, NN):
+    """
+    Returns the Reverse Cuthill-McKee ordering of the nodes, the old number of
+    each node in the new order.
+    """
+    from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+    return reverse_cuthill_mckee(get_node_graph(LtoG, NN),
+                                 symmetric_mode=True)
+
+
+Orderings = {
+    "rcm": get_rcm_order
+}
+
+
+def reorder(problem_data, method="rcm"):
+    """
+    Renumbers the nodes of the processed problem data with the given ordering
+    method and sorts the elements by their lowest node number. LtoG, nodes,
+    UV and the BC tables are all remapped. The original numbering is kept if
+    the ordering does not reduce the bandwidth. The new order is kept in the
+    problem data as "node_order" for restore_order().
+    """
+    from numpy import asarray, empty, arange, argsort
+
+    print("Reordering nodes ({0})...".format(method))
+    NN = problem_data["NN"]
+    LtoG = asarray(problem_data["LtoG"])
+    bandwidth = get_bandwidth(LtoG)
+
+    order = Orderings[method](LtoG, NN)
+    new_index = empty(NN, dtype="int32")
+    new_index[order] = arange(NN)
+    if get_bandwidth(renumber(new_index, LtoG)) >= bandwidth:
+        # Small or already well ordered meshes may not benefit, in which
+        # case only the elements are sorted
+        order = arange(NN)
+        new_index = order.astype("int32")
+
+    LtoG = renumber(new_index, LtoG)
+    element_order = argsort(get_lowest_nodes(LtoG), kind="mergesort")
+    new_element = empty(len(LtoG), dtype="int32")
+    new_element[element_order] = arange(len(LtoG))
+    problem_data["LtoG"] = LtoG[element_order]
+
+    problem_data["nodes"] = asarray(problem_data["nodes"])[order]
+    if problem_data.get("UV") is not None:
+        problem_data["UV"] = asarray(problem_data["UV"])[:, order]
+
+    BCs = problem_data["BCs"]
+    BCs["EBC"]["node"] = new_index[BCs["EBC"]["node"]]
+    for BC_type in ("NBC", "MBC"):
+        BCs[BC_type]["element"] = new_element[BCs[BC_type]["element"]]
+
+    problem_data["node_order"] = order
+    new_bandwidth = get_bandwidth(problem_data["LtoG"])
+    print(" * Bandwidth: {0} -> {1}".format(bandwidth, new_bandwidth))
+    record(bandwidth_before=bandwidth, bandwidth_after=new_bandwidth)
+
+    return problem_data
+
+
+def restore_order(problem_data, solution):
+    """
+    Maps the solution and the remaining mesh data of a reordered problem back
+    to the original node numbering. The solution is returned as it is if the
+    problem was not reordered.
+    """
+    from numpy import asarray, empty_like
+
+    order = problem_data.pop("node_order", None)
+    if order is None:
+        return solution
+
+    def restore_(values, axis=0):
+        values = asarray(values)
+        restored = empty_like(values)
+        if axis:
+            restored[:, order] = values
+        else:
+            restored[order] = values
+        return restored
+
+    problem_data["nodes"] = restore_(problem_data["nodes"])
+    if problem_data.get("UV") is not None:
+        problem_data["UV"] = restore_(problem_data["UV"], axis=1)
+    # Connectivity and BCs may have been freed after assembly
+    if "LtoG" in problem_data:
+        problem_data["LtoG"] = renumber(order, problem_data["LtoG"])
+    if "BCs" in problem_data:
+        EBC = problem_data["BCs"]["EBC"]
+        EBC["node"] = order[EBC["node"]].astype("int32")
+
+    return restore_(solution)
@@ -3,83 +3,434 @@
 @contact: gulen.ilker@hotmail.com, madbyk@gmail.com
 @summary:
     Provides solving and post-processing functions.
-    Solving function uses SciPy's sparse solving function from sparse linear
-    algebra module(sparse.spsolve).
+    Solving functions use SciPy's sparse linear algebra module, either with a
+    direct LU factorization (SuperLU) or with one of its Krylov solvers and an
+    optional preconditioner.
 
-    Post process shapes the coordinates and results into a proper form to be
-    plotted, refines the plotting range and approximates mid values using node
-    neighbors and then produces a smooth contour plot.
+    Post processing writes the solution and plots it on a matplotlib
+    Triangulation of the mesh itself, with elements split into triangles
+    through their nodes, either as filled contours or as linearly
+    interpolated colors. No values are interpolated off the nodes.
 @version: 1.6
 """
 
 
-def solve_system(K, F):
+# Default solver settings, which can be overridden by the "solver" entry of
+# the problem data and by the command line arguments
+DefaultSolverSettings = {
+    "method": "direct",
+    "preconditioner": "none",
+    "tol": 1e-8,
+    "maxiter": None,
+    "restart": 30,
+    "drop_tol": 1e-4,
+    "fill_factor": 10,
+    "residual_history": False
+}
+
+
+def get_solver_settings(problem_data, arguments=None):
+    """
+    Merges the solver settings from the defaults, the problem data and the
+    command line arguments, in increasing order of precedence.
+    """
+
+    settings = dict(DefaultSolverSettings)
+    settings.update(problem_data.get("solver") or {})
+    if arguments is not None:
+        for key, name in (("method", "solver"), ("preconditioner", "precond"),
+                          ("tol", "tol"), ("maxiter", "maxiter")):
+            value = getattr(arguments, name, None)
+            if value is not None:
+                settings[key] = value
+
+    if settings["method"] not in Solvers:
+        raise ValueError("Unknown solver: {0}".format(settings["method"]))
+    if settings["preconditioner"] not in Preconditioners:
+        raise ValueError(
+            "Unknown preconditioner: {0}".format(settings["preconditioner"])
+        )
+
+    return settings
+
+
+def solve_direct(K, F, settings, report):
     """
-    Solves the K * x = F system using the linear sparse matrix solver.
-    The spsolve function used here can be replaced with qmr or some other
-    non-linear solver function for non-linear problems such as N-S problems.
+    Solves the system with a SuperLU factorization of K. The factorization is
+    kept in the settings as "factor" to be reused for other right hand sides.
     """
     from scipy.sparse import linalg
 
-    print("Solving system...")
-    return linalg.spsolve(K, F)
+    factor = linalg.splu(K.tocsc())
+    settings["factor"] = factor
+    report["fill_in"] = factor.L.nnz + factor.U.nnz
+    return factor.solve(F)
 
 
-def save_solution(file_name, solution):
-    from json import dump
+def get_solver_keywords(solver):
+    """
+    Returns the names of the keyword arguments of a SciPy Krylov solver,
+    which changed between SciPy versions: rtol replaced tol, and atol and
+    gmres' callback_type were added.
+    """
+    try:
+        from inspect import signature
+    except ImportError:
+        from inspect import getargspec
+        return set(getargspec(solver).args)
+    return set(signature(solver).parameters)
+
 
-    print(" * Writing output file...")
-    output_file = open(file_name, "w")
-    dump({"T": solution.tolist()}, output_file)
-    output_file.close()
+def solve_krylov(method):
+    """
+    Creates a solving function for the given Krylov solver of SciPy. The
+    iterations are counted through the solver callback. GMRES gives its
+    preconditioned residual norms to the callback, which are recorded to the
+    report as "residuals". Other solvers only give the iterate, so their
+    residual norms are only calculated and recorded, at the cost of a matrix
+    vector product per iteration, if the "residual_history" setting is set.
+    """
+
+    def solve_(K, F, settings, report):
+        from scipy.sparse import linalg
+        from numpy.linalg import norm
+
+        F_norm = norm(F) or 1.
+        # A preconditioner built beforehand can be given in the settings,
+        # to reuse it for many systems with the same K
+        preconditioner = settings.get("preconditioner_operator")
+        if preconditioner is None:
+            preconditioner = \
+                Preconditioners[settings["preconditioner"]](K, settings)
+        solver = getattr(linalg, method)
+        keywords = get_solver_keywords(solver)
+        kwargs = {
+            "maxiter": settings["maxiter"],
+            "M": preconditioner,
+            "x0": settings.get("x0"),
+            "rtol" if "rtol" in keywords else "tol": settings["tol"]
+        }
+        if "atol" in keywords:
+            kwargs["atol"] = 0.
+
+        iterations = []
+        if method == "gmres":
+            kwargs["restart"] = settings["restart"]
+            if "callback_type" in keywords:
+                kwargs["callback_type"] = "pr_norm"
+            kwargs["callback"] = iterations.append
+            report["residuals"] = iterations
+        elif settings.get("residual_history"):
+            kwargs["callback"] = lambda xk: iterations.append(
+                norm(F - K * xk) / F_norm
+            )
+            report["residuals"] = iterations
+        else:
+            kwargs["callback"] = lambda xk: iterations.append(None)
+
+        solution, info = solver(K, F, **kwargs)
+
+        report["iterations"] = len(iterations)
+        report["converged"] = info == 0
+        report["breakdown"] = info < 0
+        report["residual"] = norm(F - K * solution) / F_norm
+        return solution
+
+    return solve_
+
+
+def get_ilu_preconditioner(K, settings):
+    from scipy.sparse import linalg
 
+    ilu = linalg.spilu(K.tocsc(), drop_tol=settings["drop_tol"],
+                       fill_factor=settings["fill_factor"])
+    return linalg.LinearOperator(K.shape, ilu.solve)
 
-def plot_solution(problem_data, solution):
-    from numpy import linspace
-    from matplotlib.pylab import contour, colorbar, contourf, xlabel, ylabel, title, show
-    from matplotlib.mlab import griddata
+
+def get_jacobi_preconditioner(K, settings):
+    from scipy.sparse import linalg
+
+    inv_diagonal = 1. / K.diagonal()
+    return linalg.LinearOperator(K.shape, lambda x: inv_diagonal * x.ravel())
+
+
+Solvers = {
+    "direct": solve_direct,
+    "gmres": solve_krylov("gmres"),
+    "bicgstab": solve_krylov("bicgstab"),
+    "cg": solve_krylov("cg")
+}
+
+Preconditioners = {
+    "none": lambda K, settings: None,
+    "ilu": get_ilu_preconditioner,
+    "jacobi": get_jacobi_preconditioner
+}
+
+
+def solve_system(K, F, settings=None):
+    """
+    Solves the K * x = F system using the solver selected in the settings,
+    which is the direct sparse solver by default. Iterative solvers should be
+    preferred for large systems. GMRES and BiCGSTAB work for any problem
+    while CG requires a symmetric K, i.e. a pure diffusion problem.
+    A report of the solution process is stored in the settings as "report".
+    """
+    from time import time
+    from numpy import asarray
+
+    if settings is None:
+        settings = dict(DefaultSolverSettings)
+
+    method = settings["method"]
+    print("Solving system ({0})...".format(method))
+
+    report = {"method": method, "converged": True}
+    if method != "direct":
+        report["preconditioner"] = settings["preconditioner"]
+
+    t = time()
+    solution = Solvers[method](K.tocsr(), asarray(F).ravel(), settings, report)
+    report["time"] = time() - t
+    settings["report"] = report
+
+    if "iterations" in report:
+        print(" * {0} iterations, final residual {1:.3e}".format(
+            report["iterations"], report["residual"]
+        ))
+        if report["breakdown"]:
+            print(" ! Solver broke down, try another solver or preconditioner.")
+        elif not report["converged"]:
+            print(" ! Solver did not converge to the given tolerance.")
+    print(" * Solved in {0} seconds.".format(report["time"]))
+
+    return solution
+
+
+# Factorizations of K kept in memory, by the operator keys of the problems
+Factorizations = {}
+
+
+class StoredFactorization(object):
+    """
+    An LU factorization read back from the disk, which solves systems the same
+    way as SuperLU does: Pr * K * Pc = L * U.
+    """
+
+    def __init__(self, L, U, perm_r, perm_c):
+        self.L = L.tocsr()
+        self.U = U.tocsr()
+        self.perm_r = perm_r
+        self.perm_c = perm_c
+
+    def solve(self, F):
+        from numpy import empty_like
+        from scipy.sparse.linalg import spsolve_triangular
+
+        PF = empty_like(F)
+        PF[self.perm_r] = F
+        z = spsolve_triangular(self.L, PF, lower=True, unit_diagonal=True)
+        z = spsolve_triangular(self.U, z, lower=False)
+        return z[self.perm_c]
+
+
+def get_factorization_path(cache_dir, key):
+    import os
+
+    return os.path.join(cache_dir, key + ".npz")
+
+
+def get_factorization(key, cache_dir=None):
+    """
+    Returns the cached factorization of the K matrix with the given operator
+    key from the memory or from the cache directory, or None if there is not
+    any.
+    """
+    import os
+
+    if key in Factorizations:
+        return Factorizations[key]
+
+    if cache_dir and os.path.exists(get_factorization_path(cache_dir, key)):
+        from numpy import load
+        from scipy import sparse
+
+        print(" * Loading cached factorization...")
+        data = load(get_factorization_path(cache_dir, key))
+        factor = StoredFactorization(*[
+            sparse.csc_matrix(
+                (data[name + "_data"], data[name + "_indices"],
+                 data[name + "_indptr"]),
+                shape=tuple(data["shape"])
+            )
+            for name in ("L", "U")
+        ] + [data["perm_r"], data["perm_c"]])
+        Factorizations[key] = factor
+        return factor
+
+    return None
+
+
+def store_factorization(key, factor, cache_dir=None):
+    """
+    Keeps the factorization of the K matrix with the given operator key in
+    the memory, and also spills it to the cache directory if one is given.
+    """
+    Factorizations[key] = factor
+
+    if cache_dir:
+        import os
+        from numpy import savez
+
+        print(" * Storing factorization...")
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        L = factor.L.tocsc()
+        U = factor.U.tocsc()
+        savez(get_factorization_path(cache_dir, key), shape=L.shape,
+              L_data=L.data, L_indices=L.indices, L_indptr=L.indptr,
+              U_data=U.data, U_indices=U.indices, U_indptr=U.indptr,
+              perm_r=factor.perm_r, perm_c=factor.perm_c)
+
+
+def solve_factorized(factor, F):
+    """
+    Solves the K * x = F system by back substitution using an existing
+    factorization of K.
+    """
+    from numpy import asarray
+
+    print("Solving system (cached factorization)...")
+    return factor.solve(asarray(F).ravel())
+
+
+def save_solution(file_name, solution, problem_data=None, output_format=None):
+    """
+    Writes the solution with the writer of the given format, or of the format
+    the file extension stands for. See writers for the formats; VTK and XDMF
+    also need the problem data for the mesh.
+    """
+    from numpy import asarray
+    from writers import Writers, get_format
+
+    output_format = output_format or get_format(file_name)
+    print(" * Writing output file ({0})...".format(output_format))
+    Writers[output_format](file_name, asarray(solution).ravel(), problem_data)
+
+
+# Triangles that the elements are split into for plotting, in local nodes.
+# Quads are split along a diagonal and quadratic elements are subdivided
+# through their mid-side (and center) nodes.
+PlotTriangles = {
+    ("tri", 3): [(0, 1, 2)],
+    ("tri", 6): [(0, 3, 5), (3, 1, 4), (5, 4, 2), (3, 4, 5)],
+    ("tri", 10): [(0, 3, 8), (3, 4, 9), (4, 1, 5), (8, 9, 7), (9, 5, 6),
+                  (7, 6, 2), (3, 9, 8), (4, 5, 9), (9, 6, 7)],
+    ("quad", 4): [(0, 1, 2), (0, 2, 3)],
+    ("quad", 9): [(0, 4, 8), (0, 8, 7), (4, 1, 5), (4, 5, 8),
+                  (8, 5, 2), (8, 2, 6), (7, 8, 6), (7, 6, 3)],
+    ("quad", 16): [(0, 4, 12), (0, 12, 11), (4, 5, 13), (4, 13, 12),
+                   (5, 1, 6), (5, 6, 13), (11, 12, 15), (11, 15, 10),
+                   (12, 13, 14), (12, 14, 15), (13, 6, 7), (13, 7, 14),
+                   (10, 15, 9), (10, 9, 3), (15, 14, 8), (15, 8, 9),
+                   (14, 7, 2), (14, 2, 8)]
+}
+
+
+def get_triangulation(problem_data):
+    """
+    Creates a matplotlib triangulation of the mesh directly from LtoG, group
+    by group for mixed meshes.
+    """
+    from numpy import asarray, concatenate
+    from matplotlib.tri import Triangulation
+    from psetup import get_element_groups
+
+    nodes = asarray(problem_data["nodes"])
+    LtoG = asarray(problem_data["LtoG"])
+    triangles = []
+    for ref, elements in get_element_groups(problem_data):
+        local_triangles = asarray(PlotTriangles[(ref.eType, ref.NEN)])
+        triangles.append(LtoG[elements][:, local_triangles].reshape((-1, 3)))
+    return Triangulation(nodes[:, 0], nodes[:, 1], concatenate(triangles))
+
+
+def plot_solution(problem_data, solution, file_name=None, dpi=100,
+                  size=(8., 6.), style="contour"):
+    """
+    Plots the solution on the triangulation of the mesh, either as filled
+    contours with contour lines (contour) or with the values interpolated
+    linearly over the triangles (color), which is faster for large meshes.
+    If a file name is given, the plot is rendered to that image file without
+    a display, otherwise it is shown in a window.
+    """
+    from numpy import asarray
 
     print(" * Preparing for plotting...")
-    NN = problem_data["NN"]
+    triangulation = get_triangulation(problem_data)
+    solution = asarray(solution).ravel()
 
-    # Extract node coordinates seperately for plotting
-    x, y = [0] * NN, [0] * NN
-    for i, node in enumerate(problem_data["nodes"]):
-        x[i] = node[0]
-        y[i] = node[1]
+    if file_name:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-    # Refine the contour plot mesh for a "smoother" image, by generating a
-    # 200*200 grid
-    xi = linspace(min(x), max(x), 200)
-    yi = linspace(min(y), max(y), 200)
+        figure = Figure(figsize=size)
+        FigureCanvasAgg(figure)
+    else:
+        from matplotlib import pyplot
 
-    # Approximate the mid values from neighbors
-    zi = griddata(x, y, solution, xi, yi)
+        figure = pyplot.figure(figsize=size)
+    axes = figure.add_subplot(1, 1, 1)
 
     print(" * Plotting...")
-    # Plot the contour lines with black
-    contour(xi, yi, zi, 15, linewidths=0.5, colors='k')
-    # Plot the filled contour plot
-    plot = contourf(xi, yi, zi, 15, antialiased=True)
+    if style == "color":
+        plot = axes.tripcolor(triangulation, solution, shading="gouraud")
+    else:
+        # Plot the contour lines with black over the filled contour plot
+        plot = axes.tricontourf(triangulation, solution, 15, antialiased=True)
+        axes.tricontour(triangulation, solution, 15, linewidths=0.5,
+                        colors='k')
 
-    colorbar(plot, format="%.3f").set_label("T")
-    xlabel('X')
-    ylabel('Y')
-    title("Contour plot of T values for {0}".format(problem_data["title"]))
+    figure.colorbar(plot, ax=axes, format="%.3f").set_label("T")
+    axes.set_xlabel('X')
+    axes.set_ylabel('Y')
+    axes.set_title("Contour plot of T values for {0}".format(
+        problem_data["title"]
+    ))
 
-    show()
+    if file_name:
+        print(" * Saving plot to {0}...".format(file_name))
+        figure.savefig(file_name, dpi=dpi)
+    else:
+        pyplot.show()
 
 
 def post_process(problem_data, solution, arguments):
     """
     Performs the necessary post processing operations on the "solution"
-    using the problem_data such as contour plotting, SV calculating etc.
+    using the problem_data: saving, plotting and, if arguments.quantities is
+    a file name, calculating and saving the derived quantities, which needs
+    the functions, UV and BCs of the problem data.
     """
 
     print("Post processing...")
 
     if not arguments.dontsave:
-        save_solution(problem_data["output"], solution)
+        save_solution(problem_data["output"], solution, problem_data,
+                      getattr(arguments, "format", None))
 
     if not arguments.dontplot:
-        plot_solution(problem_data, solution)
+        plot_solution(problem_data, solution,
+                      getattr(arguments, "plot_file", None),
+                      getattr(arguments, "dpi", 100),
+                      getattr(arguments, "size", None) or (8., 6.),
+                      getattr(arguments, "plot_style", "contour"))
+
+    if getattr(arguments, "quantities", None):
+        from postproc import calc_quantities, print_quantities, \
+            save_quantities
+
+        quantities = calc_quantities(problem_data, solution)
+        print_quantities(quantities)
+        save_quantities(arguments.quantities, quantities)
@@ -0,0 +1,245 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Solves many variants of a base problem on the same mesh in one process.
+    The mesh is read and processed once, the reference element tables and
+    the sparsity pattern of K are shared by all variants and only the values
+    of each variant's K and F are assembled. Variants that leave K unchanged
+    reuse its factorization. Variants can be solved concurrently by a pool of
+    worker processes, and the solutions are streamed to the output as JSON
+    lines in the order of the parameter table.
+
+    The parameter table is a CSV file with a header row or a JSON list of
+    objects. Its columns are coefficient functions (a, V1, V2, c, f) or BC
+    values (EBC, NBC, MBC.alpha, MBC.beta) that replace the ones of the base
+    problem, and an optional "name":
+        python sweep.py -i Sample.json -t parameters.csv -w 4
+@version: 1.0
+"""
+
+from gsystem import calc_global, calc_operator_key, get_sparsity_pattern, \
+    get_group_nodes, get_pool
+from solveproc import solve_system, get_factorization, store_factorization, \
+    solve_factorized
+
+global sweep_data
+
+# Parameters that replace the BC values of the base problem: the table and
+# the column of the BC data they replace
+BCParameters = {
+    "EBC": ("EBC", 0),
+    "NBC": ("NBC", 0),
+    "MBC.alpha": ("MBC", 0),
+    "MBC.beta": ("MBC", 1)
+}
+
+FunctionParameters = ("a", "V1", "V2", "c", "f")
+
+
+def read_parameters(file_name):
+    """
+    Reads the parameter table of a sweep as a list of dicts, one for each
+    variant.
+    """
+    if file_name.endswith(".csv"):
+        import csv
+
+        with open(file_name) as input_file:
+            variants = [dict((key.strip(), value.strip())
+                             for key, value in row.items() if value.strip())
+                        for row in csv.DictReader(input_file)]
+    else:
+        from json import load
+
+        with open(file_name) as input_file:
+            variants = load(input_file)
+
+    for variant in variants:
+        for key in variant:
+            if key != "name" and key not in FunctionParameters and \
+                    key not in BCParameters:
+                raise ValueError("Unknown sweep parameter: {0}".format(key))
+    return variants
+
+
+def get_variant(problem_data, parameters):
+    """
+    Creates the problem data of a variant from the processed base problem.
+    Only the replaced functions are processed again, and only the replaced BC
+    tables are copied, everything else is shared with the base problem.
+    """
+    from psetup import process_functions
+
+    variant_data = dict(problem_data)
+
+    functions = dict((name, str(parameters[name]))
+                     for name in FunctionParameters if name in parameters)
+    process_functions(functions, problem_data["UV"], problem_data["nodes"],
+                      problem_data["LtoG"],
+                      (problem_data["eType"], problem_data["NEN"]))
+    variant_data["functions"] = dict(problem_data["functions"], **functions)
+
+    BCs = variant_data["BCs"] = dict(problem_data["BCs"])
+    for name, (BC_type, column) in BCParameters.items():
+        if name in parameters:
+            table = BCs[BC_type] = dict(BCs[BC_type])
+            table["data"] = table["data"].copy()
+            table["data"][:, column] = float(parameters[name])
+
+    return variant_data
+
+
+def solve_variant(index):
+    """
+    Solves the variant with the given index of the sweep set up in the
+    module state. Returns the index, the solution and the solver report.
+    """
+    from time import time
+    import os
+    import sys
+
+    problem_data = sweep_data["problem_data"]
+    settings = dict(sweep_data["settings"])
+    ebc_method = sweep_data["ebc_method"]
+    variant_data = get_variant(problem_data, sweep_data["variants"][index])
+
+    stdout = sys.stdout
+    if not sweep_data["verbose"]:
+        sys.stdout = open(os.devnull, "w")
+    try:
+        t = time()
+        key = factor = None
+        if settings["method"] == "direct" and ebc_method == "row":
+            key = calc_operator_key(variant_data)
+            factor = get_factorization(key)
+
+        if factor is not None:
+            K, F = calc_global(variant_data, rhs_only=True)
+            solution = solve_factorized(factor, F)
+            report = {"method": "cached factorization"}
+        else:
+            K, F = calc_global(variant_data, ebc_method=ebc_method,
+                               pattern=sweep_data["pattern"])
+            solution = solve_system(K, F, settings)
+            report = settings["report"]
+            if key:
+                store_factorization(key, settings.pop("factor"))
+        report["total_time"] = time() - t
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    report.pop("residuals", None)
+    return index, solution, report
+
+
+def run_sweep(problem_data, variants, settings, workers=1, ebc_method="row",
+              verbose=False):
+    """
+    Solves the variants of the processed base problem, yielding the index,
+    solution and solver report of each variant in order as they are solved.
+    """
+    global sweep_data
+
+    sweep_data = {
+        "problem_data": problem_data,
+        "variants": variants,
+        "settings": settings,
+        "ebc_method": ebc_method,
+        "verbose": verbose,
+        "pattern": get_sparsity_pattern(
+            [e_nodes for _, _, e_nodes in get_group_nodes(problem_data)],
+            problem_data["NN"]
+        )
+    }
+
+    try:
+        if workers > 1 and len(variants) > 1:
+            pool = get_pool(workers)
+            try:
+                for result in pool.imap(solve_variant, range(len(variants))):
+                    yield result
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for index in range(len(variants)):
+                yield solve_variant(index)
+    finally:
+        sweep_data = None
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from json import dumps
+    from time import time
+
+    from psetup import get_problem_data
+    from solveproc import get_solver_settings
+
+    parser = argparse.ArgumentParser(
+        description='Solves variants of a problem with different parameters.'
+    )
+    parser.add_argument('-i', '--input', default='',
+                        help='Base problem file path.')
+    parser.add_argument('-t', '--table', required=True,
+                        help='Parameter table, .csv or .json.')
+    parser.add_argument('-o', '--output', default='',
+                        help='Output file path. Defaults to the input path '
+                             'with _sweep.jsonl suffix.')
+    parser.add_argument('-w', '--workers', default=1, type=int,
+                        help='Number of worker processes. 0 uses all '
+                             'available CPUs.')
+    parser.add_argument('-E', '--ebc', default='row',
+                        choices=('row', 'symmetric'),
+                        help='EBC application method.')
+    parser.add_argument('-s', '--solver', default=None,
+                        choices=('direct', 'gmres', 'bicgstab', 'cg'),
+                        help='Linear solver, overriding the one in the input.')
+    parser.add_argument('-p', '--precond', default=None,
+                        choices=('none', 'ilu', 'jacobi'),
+                        help='Preconditioner for the iterative solvers.')
+    parser.add_argument('--tol', default=None, type=float,
+                        help='Relative tolerance for the iterative solvers.')
+    parser.add_argument('--maxiter', default=None, type=int,
+                        help='Iteration cap for the iterative solvers.')
+    parser.add_argument('-v', '--verbose', default=False, action='store_true',
+                        help='Show the progress messages of every variant.')
+    arguments = parser.parse_args()
+
+    if arguments.workers < 1:
+        from multiprocessing import cpu_count
+        arguments.workers = cpu_count()
+
+    problem_data = get_problem_data(arguments.input)
+    settings = get_solver_settings(problem_data, arguments)
+    variants = read_parameters(arguments.table)
+    output_name = arguments.output or \
+        os.path.splitext(problem_data["output"])[0].replace(
+            "_output", "") + "_sweep.jsonl"
+
+    print("Solving {0} variants...".format(len(variants)))
+    t = time()
+    with open(output_name, "w") as output_file:
+        for index, solution, report in run_sweep(
+                problem_data, variants, settings, arguments.workers,
+                arguments.ebc, arguments.verbose):
+            parameters = variants[index]
+            output_file.write(dumps({
+                "index": index,
+                "name": parameters.get("name", str(index)),
+                "parameters": parameters,
+                "solver": report,
+                "T": solution.tolist()
+            }) + "\n")
+            output_file.flush()
+            print(" * {0}: {1:.4f} seconds".format(
+                parameters.get("name", index), report["total_time"]
+            ))
+
+    print("Solved {0} variants in {1} seconds, written to {2}.".format(
+        len(variants), time() - t, output_name
+    ))
@@ -0,0 +1,357 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Provides the writers of the solution files. Besides the original JSON
+    format, the solution can be written as raw float64 or NPY data, which can
+    be memory-mapped, as a compressed NPZ archive, or as VTK and XDMF files
+    with the mesh included that can be opened directly in ParaView. Large
+    arrays are written in chunks, without building lists of Python numbers
+    or whole converted copies of the arrays. The snapshots of transient
+    solutions are streamed into a NPY file as they are calculated.
+@version: 1.0
+"""
+
+import os
+
+# Number of array rows converted and written at once
+CHUNK_SIZE = 1 << 16
+
+# VTK cell types and XDMF topology types of the elements. The node order of
+# the elements is the same in both, except for the cubic quads of VTK, whose
+# edge nodes are listed by VTKNodeOrder. XDMF has no cubic elements.
+VTKCellTypes = {
+    ("tri", 3): 5, ("tri", 6): 22, ("tri", 10): 69,
+    ("quad", 4): 9, ("quad", 9): 28, ("quad", 16): 70
+}
+VTKNodeOrder = {
+    ("quad", 16): [0, 1, 2, 3, 4, 5, 6, 7, 9, 8, 11, 10, 12, 13, 15, 14]
+}
+XDMFTopologyTypes = {
+    ("tri", 3): "Triangle", ("tri", 6): "Triangle_6",
+    ("quad", 4): "Quadrilateral", ("quad", 9): "Quadrilateral_9"
+}
+# Element type numbers of mixed XDMF topologies
+XDMFMixedTypes = {
+    ("tri", 3): 4, ("tri", 6): 36,
+    ("quad", 4): 5, ("quad", 9): 35
+}
+
+
+def write_chunks(output_file, array, dtype=None):
+    """
+    Writes the array as raw data, converting it to the given dtype chunk by
+    chunk.
+    """
+    from numpy import asarray
+
+    array = asarray(array)
+    for start in range(0, len(array), CHUNK_SIZE):
+        chunk = array[start:start + CHUNK_SIZE]
+        if dtype is not None:
+            chunk = chunk.astype(dtype)
+        output_file.write(chunk.tobytes())
+
+
+def write_json(file_name, solution, problem_data=None):
+    """
+    Writes the solution in the original JSON format: {"T": [...]}. Values
+    are formatted by json chunk by chunk, so the output is the same as the
+    one of json.dump.
+    """
+    from json import dumps
+
+    with open(file_name, "w") as output_file:
+        output_file.write('{"T": [')
+        for start in range(0, len(solution), CHUNK_SIZE):
+            if start:
+                output_file.write(", ")
+            chunk = solution[start:start + CHUNK_SIZE].tolist()
+            output_file.write(dumps(chunk)[1:-1])
+        output_file.write("]}")
+
+
+def write_raw(file_name, solution, problem_data=None):
+    """
+    Writes the solution as raw little-endian float64 values, which can be
+    read with numpy.fromfile or numpy.memmap.
+    """
+    with open(file_name, "wb") as output_file:
+        write_chunks(output_file, solution, "<f8")
+
+
+def write_npy(file_name, solution, problem_data=None):
+    """
+    Writes the solution as a NPY file, which can be memory-mapped with
+    numpy.load(file_name, mmap_mode="r").
+    """
+    from numpy.lib.format import write_array
+    from numpy import asarray
+
+    with open(file_name, "wb") as output_file:
+        write_array(output_file, asarray(solution, dtype="<f8"))
+
+
+class SnapshotWriter(object):
+    """
+    Streams the snapshots of a transient solution into a NPY file of shape
+    (count, NN) as they are calculated, so that only the current snapshot is
+    kept in memory. The times of the snapshots are written next to it, with
+    _times.npy suffix, when the writer is closed. Both files can be
+    memory-mapped with numpy.load(file_name, mmap_mode="r").
+    """
+
+    def __init__(self, file_name, count, NN):
+        from numpy.lib.format import write_array_header_1_0
+
+        self.file_name = file_name
+        self.count = count
+        self.times = []
+        self.file = open(file_name, "wb")
+        write_array_header_1_0(self.file, {
+            "descr": "<f8", "fortran_order": False, "shape": (count, NN)
+        })
+
+    def write(self, time, solution):
+        if len(self.times) == self.count:
+            raise ValueError("All {0} snapshots are already written.".format(
+                self.count
+            ))
+        write_chunks(self.file, solution, "<f8")
+        self.times.append(time)
+
+    def close(self):
+        """
+        Closes the snapshot file and writes the times of the snapshots. The
+        snapshot file is incomplete if fewer snapshots than its count were
+        written, which the length of the times shows.
+        """
+        from numpy import asarray
+
+        self.file.close()
+        write_npy(os.path.splitext(self.file_name)[0] + "_times.npy",
+                  asarray(self.times))
+
+
+def write_npz(file_name, solution, problem_data=None):
+    """
+    Writes the solution as "T" of a compressed NPZ archive. The array is
+    compressed as it is written into the archive.
+    """
+    import zipfile
+    from numpy.lib.format import write_array
+    from numpy import asarray
+
+    with zipfile.ZipFile(file_name, "w", zipfile.ZIP_DEFLATED,
+                         allowZip64=True) as archive:
+        with archive.open("T.npy", "w", force_zip64=True) as output_file:
+            write_array(output_file, asarray(solution, dtype="<f8"))
+
+
+def get_mesh(problem_data):
+    from numpy import asarray
+
+    if problem_data is None or problem_data.get("LtoG") is None:
+        raise ValueError("The mesh is needed to write this format.")
+    return asarray(problem_data["nodes"]), asarray(problem_data["LtoG"]), \
+        (problem_data["eType"], problem_data["NEN"])
+
+
+def get_cell_chunks(LtoG, element, header):
+    """
+    Yields the cells of the mesh chunk by chunk, as the flat array of the
+    header of each cell followed by its nodes, and the array of the headers.
+    The header of a cell is given by the header function of its element type
+    and number of nodes. The -1 padding of the elements of mixed meshes is
+    left out.
+    """
+    from numpy import concatenate, zeros, full, unique
+    from psetup import ElementTypes, get_element_widths
+
+    for start in range(0, len(LtoG), CHUNK_SIZE):
+        chunk = LtoG[start:start + CHUNK_SIZE]
+        if element[0] == "mixed":
+            widths = get_element_widths(chunk)
+        else:
+            widths = full(len(chunk), element[1])
+        cells = concatenate((zeros((len(chunk), 1), dtype=chunk.dtype),
+                             chunk), axis=1)
+        for width in unique(widths):
+            cell_type = ElementTypes[width] if element[0] == "mixed" \
+                else element
+            selected = widths == width
+            cells[selected, 0] = header(cell_type)
+            if cell_type in VTKNodeOrder:
+                cells[selected, 1:width + 1] = \
+                    chunk[selected][:, VTKNodeOrder[cell_type]]
+        yield cells[cells >= 0], cells[:, 0]
+
+
+def write_vtk(file_name, solution, problem_data=None):
+    """
+    Writes the mesh and the solution as a legacy binary VTK unstructured
+    grid. Legacy VTK files are big-endian.
+    """
+    from numpy import zeros
+
+    nodes, LtoG, element = get_mesh(problem_data)
+    NN = len(nodes)
+    NE = len(LtoG)
+
+    def nodes_(cell_type):
+        return cell_type[1]
+
+    with open(file_name, "wb") as output_file:
+        def write_(text):
+            output_file.write(text.encode("ascii", "replace"))
+
+        # The title is a single line of at most 256 characters
+        title = " ".join(problem_data.get("title", "Solution").split())
+        write_("# vtk DataFile Version 3.0\n{0}\nBINARY\n"
+               "DATASET UNSTRUCTURED_GRID\n".format(title[:255]))
+
+        write_("POINTS {0} double\n".format(NN))
+        for start in range(0, NN, CHUNK_SIZE):
+            chunk = nodes[start:start + CHUNK_SIZE]
+            points = zeros((len(chunk), 3), dtype=">f8")
+            points[:, :2] = chunk
+            output_file.write(points.tobytes())
+
+        write_("\nCELLS {0} {1}\n".format(NE, NE + int((LtoG >= 0).sum())))
+        for cells, _ in get_cell_chunks(LtoG, element, nodes_):
+            output_file.write(cells.astype(">i4").tobytes())
+
+        write_("\nCELL_TYPES {0}\n".format(NE))
+        for _, cell_types in get_cell_chunks(LtoG, element, VTKCellTypes.get):
+            output_file.write(cell_types.astype(">i4").tobytes())
+
+        write_("\nPOINT_DATA {0}\nSCALARS T double 1\n"
+               "LOOKUP_TABLE default\n".format(NN))
+        write_chunks(output_file, solution, ">f8")
+        write_("\n")
+
+
+def write_xdmf(file_name, solution, problem_data=None):
+    """
+    Writes the mesh and the solution as an XDMF file, which describes the
+    arrays in a raw binary file next to it (with .bin extension). Mixed
+    meshes are written as a mixed topology, with the type number of each
+    element before its nodes.
+    """
+    from xml.sax.saxutils import escape
+
+    check_format("xdmf", problem_data)
+    nodes, LtoG, element = get_mesh(problem_data)
+    NN = len(nodes)
+    NE, NEN = LtoG.shape
+
+    data_name = os.path.splitext(file_name)[0] + ".bin"
+    with open(data_name, "wb") as data_file:
+        write_chunks(data_file, nodes, "<f8")
+        if element[0] == "mixed":
+            topology_size = 0
+            for cells, _ in get_cell_chunks(LtoG, element,
+                                            XDMFMixedTypes.get):
+                write_chunks(data_file, cells, "<i4")
+                topology_size += len(cells)
+            topology = ("Mixed", str(topology_size))
+        else:
+            write_chunks(data_file, LtoG, "<i4")
+            topology_size = NE * NEN
+            topology = (XDMFTopologyTypes[element], "{0} {1}".format(NE, NEN))
+        write_chunks(data_file, solution, "<f8")
+
+    items = (
+        ("nodes", "Float", 8, "{0} 2".format(NN), 0),
+        ("LtoG", "Int", 4, topology[1], NN * 2 * 8),
+        ("T", "Float", 8, str(NN), NN * 2 * 8 + topology_size * 4)
+    )
+
+    def data_item_(index):
+        name, number_type, precision, dimensions, seek = items[index]
+        return ('<DataItem Format="Binary" NumberType="{0}" Precision="{1}" '
+                'Endian="Little" Seek="{2}" Dimensions="{3}">{4}'
+                '</DataItem>').format(number_type, precision, seek,
+                                      dimensions,
+                                      escape(os.path.basename(data_name)))
+
+    with open(file_name, "w") as output_file:
+        output_file.write("\n".join([
+            '<?xml version="1.0" ?>',
+            '<Xdmf Version="3.0">',
+            '<Domain>',
+            '<Grid Name="{0}" GridType="Uniform">'.format(
+                escape(problem_data.get("title", "Solution"), {'"': "&quot;"})
+            ),
+            '<Topology TopologyType="{0}" NumberOfElements="{1}">'.format(
+                topology[0], NE
+            ),
+            data_item_(1),
+            '</Topology>',
+            '<Geometry GeometryType="XY">',
+            data_item_(0),
+            '</Geometry>',
+            '<Attribute Name="T" AttributeType="Scalar" Center="Node">',
+            data_item_(2),
+            '</Attribute>',
+            '</Grid>',
+            '</Domain>',
+            '</Xdmf>',
+            ''
+        ]))
+
+
+Writers = {
+    "json": write_json,
+    "raw": write_raw,
+    "npy": write_npy,
+    "npz": write_npz,
+    "vtk": write_vtk,
+    "xdmf": write_xdmf
+}
+
+# Output file extensions of the formats
+Extensions = {
+    "json": ".json",
+    "raw": ".f64",
+    "npy": ".npy",
+    "npz": ".npz",
+    "vtk": ".vtk",
+    "xdmf": ".xdmf"
+}
+
+
+def get_format(file_name):
+    """
+    Finds the output format from the extension of the file name, defaulting
+    to JSON.
+    """
+    file_ext = os.path.splitext(file_name)[1].lower()
+    if file_ext == ".xmf":
+        return "xdmf"
+    for output_format, extension in Extensions.items():
+        if extension == file_ext:
+            return output_format
+    return "json"
+
+
+def check_format(output_format, problem_data):
+    """
+    Raises a ValueError if the mesh of the problem data can not be written in
+    the given format, so that it is found before the problem is solved. Only
+    XDMF is limited, as it has no cubic elements.
+    """
+    from psetup import ElementTypes, get_element_widths
+
+    if output_format != "xdmf":
+        return
+    nodes, LtoG, element = get_mesh(problem_data)
+    if element[0] == "mixed":
+        cell_types = [ElementTypes[width]
+                      for width in set(get_element_widths(LtoG))]
+        supported = all(cell_type in XDMFMixedTypes
+                        for cell_type in cell_types)
+    else:
+        supported = element in XDMFTopologyTypes
+    if not supported:
+        raise ValueError("Cubic elements can not be written as XDMF.")
@@ -0,0 +1,104 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Shared helpers of the tests. The modules are in src and are imported
+    directly, as the scripts do. Problems are generated on the unit square
+    with meshgen, with the EBC, NBC and MBC tables given by the tests.
+@version: 1.0
+"""
+
+import os
+import sys
+
+import numpy
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src"))
+
+# Element types and numbers of nodes of all supported elements
+ELEMENTS = [("tri", 3), ("tri", 6), ("tri", 10), ("quad", 4), ("quad", 9),
+            ("quad", 16), ("mixed", 4), ("mixed", 9), ("mixed", 16)]
+
+
+def empty_faces():
+    return {"element": numpy.zeros(0, "int32"),
+            "face": numpy.zeros(0, "int32"),
+            "data": numpy.zeros((0, 2))}
+
+
+def make_problem(eType, NEN, NE, functions, exact=None, mesh="structured",
+                 seed=0):
+    """
+    Generates a processed problem with the given functions. If the exact
+    solution is given as a function, it is prescribed on all boundary nodes
+    and there are no NBC or MBC faces.
+    """
+    from meshgen import generate_problem
+    from psetup import process_problem_data
+
+    raw = generate_problem(eType, NEN, NE, mesh, seed, functions=functions)
+    if exact is not None:
+        nodes = numpy.asarray(raw["nodes"])
+        boundary = numpy.flatnonzero(
+            (abs(nodes - .5) > .5 - 1e-9).any(axis=1)
+        )
+        data = numpy.zeros((len(boundary), 2))
+        data[:, 0] = exact(*nodes[boundary].T)
+        raw["BCs"] = {"EBC": {"node": boundary.astype("int32"), "data": data},
+                      "NBC": empty_faces(), "MBC": empty_faces()}
+    return process_problem_data(raw)
+
+
+def solve(problem_data):
+    """
+    Assembles and solves the problem with the default settings, keeping the
+    problem data intact. Returns the solution as a flat array.
+    """
+    from gsystem import calc_global
+    from solveproc import solve_system
+
+    K, F = calc_global(dict(problem_data))
+    return numpy.asarray(solve_system(K, F)).ravel()
+
+
+def solve_with_faces(eType, NEN, BC_type, data, mesh="structured", NE=200):
+    """
+    Solves -lap(T) = -2 with T = 0 on the left edge and the given NBC or
+    MBC data on the right edge, where T = x ** 2 has a * dT/dn = 2.
+    Returns the problem data and the solution.
+    """
+    from psetup import get_boundary_faces, get_element_corners
+
+    problem_data = make_problem(eType, NEN, NE, {
+        "a": "1", "V1": "0", "V2": "0", "c": "0", "f": "-2",
+        "exactSoln": "x ** 2"
+    }, mesh=mesh)
+    nodes = problem_data["nodes"]
+    LtoG = numpy.asarray(problem_data["LtoG"])
+    corners = get_element_corners(problem_data["eType"], LtoG)
+    element, face = get_boundary_faces(LtoG, corners)
+    if not isinstance(corners, int):
+        corners = corners[element]
+    first = LtoG[element, face]
+    second = LtoG[element, (face + 1) % corners]
+    right = (nodes[first, 0] > 1 - 1e-9) & (nodes[second, 0] > 1 - 1e-9)
+    left = numpy.flatnonzero(nodes[:, 0] < 1e-9)
+
+    table = {"element": element[right].astype("int32"),
+             "face": face[right].astype("int32"),
+             "data": numpy.tile(data, (right.sum(), 1))}
+    problem_data["BCs"] = {
+        "EBC": {"node": left.astype("int32"),
+                "data": numpy.zeros((len(left), 2))},
+        "NBC": table if BC_type == "NBC" else empty_faces(),
+        "MBC": table if BC_type == "MBC" else empty_faces()
+    }
+    return problem_data, solve(problem_data)
+
+
+@pytest.fixture
+def sample_dir():
+    return os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "sample_problems")
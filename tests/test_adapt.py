@@ -0,0 +1,116 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the adaptive mesh refinement of adapt.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from conftest import make_problem
+
+from adapt import refine, mark_elements, solve_adaptive
+from psetup import get_edges
+from solveproc import get_solver_settings
+
+# A boundary layer at x = 1, which needs refinement along it
+LayerFunctions = {"a": "0.02", "V1": "1", "V2": "0", "c": "0", "f": "1",
+                  "exactSoln": "?"}
+
+
+def layer_problem(eType="tri", NEN=3):
+    from meshgen import generate_problem
+    from psetup import process_problem_data
+
+    return process_problem_data(generate_problem(
+        eType, NEN, 100, functions=LayerFunctions
+    ))
+
+
+def check_mesh(problem_data):
+    nodes = numpy.asarray(problem_data["nodes"])
+    LtoG = numpy.asarray(problem_data["LtoG"])
+    coords = nodes[LtoG]
+    first = coords[:, 1] - coords[:, 0]
+    second = coords[:, 2] - coords[:, 0]
+    areas = (first[:, 0] * second[:, 1] - first[:, 1] * second[:, 0]) / 2.
+    # Counter-clockwise elements covering the unit square
+    assert (areas > 0.).all()
+    assert areas.sum() == pytest.approx(1.)
+    # Conforming: every edge is shared by two elements or on the boundary
+    edges, edge_index = get_edges(LtoG, 3)
+    counts = numpy.bincount(edge_index.ravel(), minlength=len(edges))
+    assert counts.max() == 2
+    boundary = edges[counts == 1]
+    middle = nodes[boundary].mean(axis=1)
+    assert (abs(middle - .5) > .5 - 1e-9).any(axis=1).all()
+    return edges, edge_index, counts
+
+
+def test_mark_elements():
+    errors = numpy.array([1., 4., 2., 3.])
+    assert mark_elements(errors, .5).tolist() == [False, True, False, True]
+    assert mark_elements(errors, 1.).all()
+
+
+def test_refine():
+    problem_data = layer_problem()
+    NE = len(problem_data["LtoG"])
+    length = dict((BC_type, len(problem_data["BCs"][BC_type]["element"]))
+                  for BC_type in ("NBC", "MBC"))
+    marked = numpy.zeros(NE, dtype=bool)
+    marked[::7] = True
+    solution = problem_data["nodes"][:, 0] + 2. * problem_data["nodes"][:, 1]
+
+    problem_data, solution = refine(problem_data, marked, solution)
+    assert len(problem_data["LtoG"]) >= NE + marked.sum()
+    assert problem_data["NE"] == len(problem_data["LtoG"])
+    edges, edge_index, counts = check_mesh(problem_data)
+    nodes = problem_data["nodes"]
+    # Linear solutions are interpolated exactly
+    assert numpy.allclose(solution, nodes[:, 0] + 2. * nodes[:, 1])
+
+    # The faces are still on the boundary, at least as many as before
+    for BC_type in ("NBC", "MBC"):
+        table = problem_data["BCs"][BC_type]
+        faces = edge_index[table["element"], table["face"]]
+        assert (counts[faces] == 1).all()
+        assert len(faces) >= length[BC_type]
+    # The new EBC nodes are on the left and top edges, where T is 1 and 0
+    EBC = problem_data["BCs"]["EBC"]
+    x, y = nodes[EBC["node"]].T
+    assert ((x < 1e-9) | (y > 1 - 1e-9)).all()
+    values = EBC["data"][:, 0]
+    assert (values[y > 1 - 1e-9] == 0.).all()
+    assert (values[y < 1 - 1e-9] > 0.).all()
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 3), ("quad", 4)])
+def test_solve_adaptive(eType, NEN):
+    problem_data = layer_problem(eType, NEN)
+    settings = get_solver_settings(problem_data)
+    solution, history = solve_adaptive(problem_data, settings, 1e-3,
+                                       max_iterations=3)
+    assert len(history) == 4
+    assert [entry["NE"] for entry in history] == \
+        sorted(entry["NE"] for entry in history)
+    assert history[-1]["error"] < history[0]["error"]
+    assert len(solution) == len(problem_data["nodes"])
+    check_mesh(problem_data)
+
+
+@pytest.mark.parametrize("max_elements", [250, 400])
+def test_element_budget(max_elements):
+    problem_data = layer_problem()
+    settings = get_solver_settings(problem_data)
+    history = solve_adaptive(problem_data, settings, 1e-6, max_elements)[1]
+    assert all(entry["NE"] <= max_elements for entry in history)
+    assert len(history) > 1
+
+
+def test_unsupported_elements():
+    problem_data = make_problem("tri", 6, 50, LayerFunctions)
+    with pytest.raises(ValueError):
+        solve_adaptive(problem_data, get_solver_settings(problem_data))
@@ -0,0 +1,69 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the assembly modes of gsystem, against each other and against
+    the solutions of the sample problems.
+@version: 1.0
+"""
+
+import json
+import os
+
+import numpy
+import pytest
+
+from conftest import ELEMENTS, make_problem, solve
+
+from gsystem import calc_global
+from psetup import get_problem_data
+from solveproc import solve_system
+
+Functions = {"a": "1 + x * y", "V1": "1", "V2": "0.5 * x", "c": "2 * y",
+             "f": "sin(pi * x) * sin(pi * y)", "exactSoln": "?"}
+
+
+def assemble(problem_data, *args, **kwargs):
+    K, F = calc_global(dict(problem_data), *args, **kwargs)
+    return K.toarray() if K is not None else None, numpy.asarray(F).ravel()
+
+
+# The element mode uses numpy.matrix, as the original assembly did
+@pytest.mark.filterwarnings("ignore::PendingDeprecationWarning")
+@pytest.mark.parametrize("eType, NEN", ELEMENTS)
+def test_modes(eType, NEN):
+    from meshgen import generate_problem
+    from psetup import process_problem_data
+
+    problem_data = process_problem_data(
+        generate_problem(eType, NEN, 30, functions=Functions)
+    )
+    K, F = assemble(problem_data, "batch")
+    for args in (("element",), ("batch", 2)):
+        other_K, other_F = assemble(problem_data, *args)
+        assert numpy.allclose(other_K, K, rtol=1e-12, atol=1e-12)
+        assert numpy.allclose(other_F, F, rtol=1e-12, atol=1e-12)
+    assert assemble(problem_data, rhs_only=True)[0] is None
+    assert numpy.allclose(assemble(problem_data, rhs_only=True)[1], F)
+
+
+def test_ebc_methods():
+    problem_data = make_problem("quad", 9, 50, Functions)
+    expected = solve(problem_data)
+    K, F = calc_global(dict(problem_data), ebc_method="symmetric")
+    # The EBC rows and columns are eliminated, keeping only the diagonal
+    nodes = problem_data["BCs"]["EBC"]["node"]
+    eliminated = K.toarray()[:, nodes]
+    eliminated[nodes, numpy.arange(len(nodes))] = 0.
+    assert not eliminated.any()
+    solution = numpy.asarray(solve_system(K, F)).ravel()
+    assert numpy.allclose(solution, expected)
+
+
+@pytest.mark.parametrize("name", ["Sample", "AD2Dsample"])
+def test_sample_problems(sample_dir, name):
+    problem_data = get_problem_data(os.path.join(sample_dir, name + ".json"))
+    with open(os.path.join(sample_dir, name + "_output.json")) as input_file:
+        expected = numpy.asarray(json.load(input_file)["T"]).ravel()
+    assert numpy.allclose(solve(problem_data), expected, rtol=1e-8,
+                          atol=1e-10)
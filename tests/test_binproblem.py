@@ -0,0 +1,59 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the binary problem format of binproblem.
+@version: 1.0
+"""
+
+import os
+
+import numpy
+import pytest
+
+from conftest import solve
+
+from binproblem import ALIGNMENT, write_binary, read_binary
+from psetup import BCFields, read_json, process_bcs, process_problem_data
+
+
+@pytest.mark.parametrize("name", ["Sample", "AD2Dsample", "Channel"])
+def test_round_trip(tmp_path, sample_dir, name):
+    raw = read_json(os.path.join(sample_dir, name + ".json"), "json")
+    file_name = str(tmp_path / (name + ".fpb"))
+    write_binary(raw, file_name)
+    data = read_binary(file_name)
+
+    for key in ("title", "eType", "NEN", "NGP", "functions"):
+        assert data.get(key) == raw.get(key)
+    assert "output" not in data
+    for key in ("nodes", "LtoG", "UV"):
+        if raw.get(key) is None:
+            assert data[key] is None
+            continue
+        assert (data[key] == numpy.asarray(raw[key])).all()
+        # Arrays are memory-mapped as read-only and aligned
+        assert not data[key].flags.writeable
+        assert data[key].offset % ALIGNMENT == 0
+
+    BCs = process_bcs(raw["BCs"])
+    for BC_type, fields in BCFields.items():
+        for field, dtype in fields:
+            assert (data["BCs"][BC_type][field] ==
+                    BCs[BC_type][field]).all()
+
+
+def test_same_solution(tmp_path, sample_dir):
+    file_name = os.path.join(sample_dir, "AD2Dsample.json")
+    raw = read_json(file_name, "json")
+    write_binary(raw, str(tmp_path / "AD2Dsample.fpb"))
+    expected = solve(process_problem_data(read_json(file_name, "json")))
+    solution = solve(process_problem_data(
+        read_binary(str(tmp_path / "AD2Dsample.fpb"))
+    ))
+    assert (solution == expected).all()
+
+
+def test_not_binary(sample_dir):
+    with pytest.raises(ValueError):
+        read_binary(os.path.join(sample_dir, "Sample.json"))
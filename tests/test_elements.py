@@ -0,0 +1,80 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Patch and manufactured solution tests of all element types, and of the
+    NBC and MBC loads on their faces.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from conftest import ELEMENTS, make_problem, solve, solve_with_faces
+
+# Orders of the elements by their number of nodes
+Orders = {3: 1, 4: 1, 6: 2, 9: 2, 10: 3, 16: 3}
+
+
+def linear(x, y):
+    return 1. + 2. * x + 3. * y
+
+
+@pytest.mark.parametrize("mesh", ["structured", "unstructured"])
+@pytest.mark.parametrize("eType, NEN", ELEMENTS)
+def test_linear_patch(eType, NEN, mesh):
+    if mesh == "unstructured" and eType == "mixed":
+        pytest.skip("Mixed meshes can only be structured.")
+    # All terms of the equation: -a * lap(T) + V . grad(T) + c * T = f
+    functions = {"a": "2", "V1": "1", "V2": "2", "c": "1",
+                 "f": "9 + 2 * x + 3 * y", "exactSoln": "1 + 2 * x + 3 * y"}
+    problem_data = make_problem(eType, NEN, 50, functions, linear, mesh)
+    solution = solve(problem_data)
+    exact = linear(*numpy.asarray(problem_data["nodes"]).T)
+    assert abs(solution - exact).max() < 1e-10
+
+
+@pytest.mark.parametrize("eType, NEN", [element for element in ELEMENTS
+                                        if Orders[element[1]] > 1])
+def test_quadratic_patch(eType, NEN):
+    def exact(x, y):
+        return x ** 2 + x * y
+
+    functions = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "-2",
+                 "exactSoln": "x ** 2 + x * y"}
+    problem_data = make_problem(eType, NEN, 50, functions, exact)
+    solution = solve(problem_data)
+    assert abs(solution - exact(*problem_data["nodes"].T)).max() < 1e-10
+
+
+@pytest.mark.parametrize("eType, NEN", ELEMENTS)
+def test_manufactured_solution(eType, NEN):
+    def exact(x, y):
+        return numpy.exp(x) * numpy.sin(y)
+
+    # exp(x) * sin(y) is harmonic
+    functions = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "0",
+                 "exactSoln": "exp(x) * sin(y)"}
+    errors = []
+    for NE in (32, 512):
+        problem_data = make_problem(eType, NEN, NE, functions, exact)
+        solution = solve(problem_data)
+        errors.append(abs(solution - exact(*problem_data["nodes"].T)).max())
+    # The element size is halved twice, so the error drops at least by
+    # about 4 ** (order + 1), less a margin
+    assert errors[0] / errors[1] > .5 * 4 ** (Orders[NEN] + 1)
+
+
+@pytest.mark.parametrize("mesh", ["structured", "unstructured"])
+@pytest.mark.parametrize("eType, NEN", [element for element in ELEMENTS
+                                        if Orders[element[1]] > 1])
+@pytest.mark.parametrize("BC_type, data", [
+    ("NBC", [2., 0.]),
+    # a * dT/dn = -T + 3 is 2 at x = 1
+    ("MBC", [-1., 3.])
+])
+def test_face_loads(eType, NEN, mesh, BC_type, data):
+    if mesh == "unstructured" and eType != "tri":
+        pytest.skip("Unstructured quads are not affine.")
+    problem_data, solution = solve_with_faces(eType, NEN, BC_type, data, mesh)
+    assert abs(solution - problem_data["nodes"][:, 0] ** 2).max() < 1e-10
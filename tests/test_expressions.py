@@ -0,0 +1,61 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the coefficient function expressions of psetup.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from psetup import compile_expression, process_functions
+
+X = numpy.array([[0.1, 0.6], [0.9, 0.3]])
+Y = numpy.array([[0.05, 0.1], [0.95, 0.2]])
+
+
+@pytest.mark.parametrize("expression, expected", [
+    ("sqrt(x) * sin(pi * y)", numpy.sqrt(X) * numpy.sin(numpy.pi * Y)),
+    ("atan2(y, x) + pow(x, 2)", numpy.arctan2(Y, X) + X ** 2),
+    ("max(x, y, 0.2)", numpy.maximum(numpy.maximum(X, Y), .2)),
+    ("min(x, y)", numpy.minimum(X, Y)),
+    ("where(x > y, 1., 2.)", numpy.where(X > Y, 1., 2.)),
+    # Conditional expressions only work point by point
+    ("1.0 if x > 0.5 else 0.0", (X > .5) * 1.),
+    ("x if x > y else max(y, 0.3)",
+     numpy.where(X > Y, X, numpy.maximum(Y, .3)))
+])
+def test_arrays(expression, expected):
+    func = compile_expression(expression)
+    assert func.constant is None
+    assert numpy.allclose(func(X, Y), expected)
+    # Scalars still give scalars, also after the point by point fallback
+    assert numpy.ndim(func(.7, .1)) == 0
+    assert float(func(X[0, 1], Y[0, 1])) == pytest.approx(expected[0, 1])
+
+
+@pytest.mark.parametrize("expression, value", [
+    ("2.5", 2.5), ("max(1, 2, 3)", 3.), ("exp(0) + pi", 1. + numpy.pi)
+])
+def test_constants(expression, value):
+    func = compile_expression(expression)
+    assert func.constant == pytest.approx(value)
+    assert numpy.allclose(func(X, Y), value)
+
+
+def test_invalid():
+    with pytest.raises(SyntaxError):
+        compile_expression("x +")
+    with pytest.raises(NameError):
+        compile_expression("x + unknown")(X, Y)
+
+
+def test_process_functions():
+    nodes = numpy.zeros((1, 2))
+    functions = process_functions({"a": "1 + x", "f": "?"}, None, nodes)
+    assert functions["a"].source == "1 + x"
+    assert numpy.allclose(functions["a"](X, Y), 1. + X)
+    # Unknown functions are zero
+    assert functions["f"].source == "?"
+    assert functions["f"].constant == 0.
@@ -0,0 +1,75 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the phase instrumentation of instrument.
+@version: 1.0
+"""
+
+import builtins
+import json
+import os
+
+import pytest
+
+import instrument
+from instrument import Profiler, activate, phase, record
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    profiler = Profiler(str(tmp_path / "cprofile"))
+    activate(profiler)
+    yield profiler
+    activate(None)
+    profiler.stop()
+
+
+def test_inactive():
+    activate(None)
+    with phase("nothing") as info:
+        assert info is None
+    record(ignored=1)
+    assert builtins.__import__ is not instrument.timed_import
+
+
+def test_phases(profiler, tmp_path):
+    with phase("outer") as info:
+        record(count=3)
+        with phase("inner"):
+            sum(range(1000))
+    assert info["name"] == "outer"
+    names = [info["name"] for info in profiler.phases]
+    assert names == ["outer", "outer.inner"]
+    assert all(info["time"] >= 0. and info["peak_rss"] >= 0
+               for info in profiler.phases)
+    # Only top level phases are run under cProfile
+    assert os.listdir(str(tmp_path / "cprofile")) == ["outer.prof"]
+
+    file_name = str(tmp_path / "report.json")
+    profiler.save(file_name)
+    with open(file_name) as input_file:
+        report = json.load(input_file)
+    assert report["version"] == instrument.REPORT_VERSION
+    assert report["stats"] == {"count": 3}
+    assert [info["name"] for info in report["phases"]] == names
+
+
+def test_phase_exception(profiler):
+    with pytest.raises(RuntimeError):
+        with phase("failing"):
+            raise RuntimeError()
+    assert "time" in profiler.phases[0]
+    assert profiler.stack == []
+
+
+def test_imports(profiler):
+    import sys
+
+    sys.modules.pop("colorsys", None)
+    with phase("importing"):
+        __import__("colorsys")
+    assert any(info["name"] == "colorsys" and info["phase"] == "importing"
+               for info in profiler.imports)
+    activate(None)
+    assert builtins.__import__ is not instrument.timed_import
@@ -0,0 +1,71 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the streaming JSON reader of jsonstream against json.load.
+@version: 1.0
+"""
+
+import io
+import json
+import os
+
+import numpy
+import pytest
+
+import jsonstream
+from jsonstream import load
+
+
+def check_same(data, expected):
+    assert sorted(data) == sorted(expected)
+    for key, value in expected.items():
+        if key in jsonstream.ArrayKeys and value is not None:
+            array = data[key]
+            assert array.dtype == jsonstream.ArrayKeys[key][0]
+            assert (array == numpy.asarray(value)).all()
+        else:
+            assert data[key] == value
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 20, 7])
+@pytest.mark.parametrize("name", ["Sample", "AD2Dsample", "Channel"])
+def test_sample_problems(sample_dir, monkeypatch, chunk_size, name):
+    # Small chunks split the numbers and the other values between them
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    file_name = os.path.join(sample_dir, name + ".json")
+    with io.open(file_name, "r", encoding="utf-8") as input_file:
+        data = load(input_file)
+    with open(file_name, "r") as input_file:
+        expected = json.load(input_file)
+    check_same(data, expected)
+
+
+@pytest.mark.parametrize("chunk_size", [1 << 20, 3])
+def test_values(monkeypatch, chunk_size):
+    monkeypatch.setattr(jsonstream, "CHUNK_SIZE", chunk_size)
+    expected = {
+        "title": "A \"quoted\" title, with [brackets]",
+        "nodes": [[0, 0.5], [1e-3, -2.25E2], [3.125, 1]],
+        "LtoG": [[0, 1, 2]],
+        "UV": None,
+        "NGP": 3,
+        "functions": {"a": "1", "f": "sin(x)"},
+        "BCs": {"EBC": {"node": [0, 2], "data": [[1, 0], [0, 0]]}}
+    }
+    text = json.dumps(expected, indent=1)
+    check_same(load(io.StringIO(text)), expected)
+    assert load(io.StringIO(" { } ")) == {}
+
+
+def test_ragged_elements():
+    # Elements of mixed meshes are padded with -1
+    data = load(io.StringIO('{"LtoG": [[0, 1, 2], [2, 1, 3, 4]]}'))
+    assert data["LtoG"].tolist() == [[0, 1, 2, -1], [2, 1, 3, 4]]
+
+
+@pytest.mark.parametrize("text", ['{"nodes": [[0, 1], [2', '{"a": 1 "b"',
+                                  '{"title": "open'])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        load(io.StringIO(text))
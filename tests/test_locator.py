@@ -0,0 +1,80 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the point location and interpolation of locator, and of the
+    nodal U and V fields evaluated with it.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from conftest import ELEMENTS
+
+from locator import PointLocator
+from meshgen import generate_mesh
+
+Orders = {3: 1, 4: 1, 6: 2, 9: 2, 10: 3, 16: 3}
+
+
+def random_points(count=200, seed=1):
+    return numpy.random.RandomState(seed).uniform(0., 1., (count, 2))
+
+
+@pytest.mark.parametrize("mesh", ["structured", "unstructured"])
+@pytest.mark.parametrize("eType, NEN", ELEMENTS)
+def test_interpolate(eType, NEN, mesh):
+    if mesh == "unstructured" and eType == "mixed":
+        pytest.skip("Mixed meshes can only be structured.")
+    nodes, LtoG = generate_mesh(eType, NEN, 50, mesh)
+    locator = PointLocator(nodes, LtoG, eType, NEN)
+    x, y = random_points().T
+    if Orders[NEN] > 1 and mesh == "structured":
+        def field(x, y):
+            return x ** 2 - x * y + 2. * y
+    else:
+        def field(x, y):
+            return 1. + x - 2. * y
+    values = locator.interpolate(field(*nodes.T), x, y)
+    assert numpy.allclose(values, field(x, y), atol=1e-10)
+
+
+def test_locate():
+    nodes, LtoG = generate_mesh("quad", 4, 50, "unstructured")
+    locator = PointLocator(nodes, LtoG, "quad", 4)
+    points = random_points()
+    elements, ref_coords = locator.locate(points)
+    assert (abs(ref_coords) <= 1. + 1e-9).all()
+    # Mapped back with the bilinear shape functions of the elements
+    xi, eta = ref_coords.T
+    S = numpy.stack(((1 - xi) * (1 - eta), (1 + xi) * (1 - eta),
+                     (1 + xi) * (1 + eta), (1 - xi) * (1 + eta)), axis=1) / 4.
+    mapped = numpy.einsum("pn,pni->pi", S, nodes[LtoG[elements]])
+    assert numpy.allclose(mapped, points)
+
+
+def test_shapes():
+    nodes, LtoG = generate_mesh("tri", 6, 50)
+    locator = PointLocator(nodes, LtoG, "tri", 6)
+    values = nodes[:, 0] + nodes[:, 1]
+    # The result has the shape of the broadcast x and y
+    assert numpy.shape(locator.interpolate(values, .25, .5)) == ()
+    grid = locator.interpolate(values, numpy.full((3, 4), .25), .5)
+    assert grid.shape == (3, 4)
+    assert numpy.allclose(grid, .75)
+
+
+def test_nodal_fields():
+    from meshgen import generate_problem
+    from psetup import process_problem_data
+
+    raw = generate_problem("quad", 9, 32, functions={
+        "a": "x", "V1": "y", "V2": "0", "c": "0", "f": "0", "exactSoln": "?"
+    })
+    nodes = numpy.asarray(raw["nodes"])
+    raw["UV"] = numpy.stack((1. + nodes[:, 0] ** 2, nodes[:, 1]))
+    functions = process_problem_data(raw)["functions"]
+    x, y = random_points(20).T
+    assert numpy.allclose(functions["a"](x, y), 1. + x ** 2)
+    assert numpy.allclose(functions["V1"](x, y), y)
@@ -0,0 +1,133 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the synthetic meshes and problems of meshgen and of the
+    benchmark cases run on them.
+@version: 1.0
+"""
+
+import argparse
+
+import numpy
+import pytest
+
+from conftest import ELEMENTS
+
+from meshgen import get_element_names, generate_mesh, generate_problem, \
+    write_problem
+from psetup import get_element_corners, get_edges, \
+    get_boundary_faces, process_bcs, read_problem_data
+
+
+def get_areas(nodes, LtoG, eType):
+    """
+    Returns the signed areas of the polygons of the element corners.
+    """
+    corners = get_element_corners(eType, LtoG)
+    if isinstance(corners, int):
+        corners = numpy.full(len(LtoG), corners)
+    areas = numpy.zeros(len(LtoG))
+    for count in numpy.unique(corners):
+        selected = corners == count
+        points = nodes[LtoG[selected, :count]]
+        following = numpy.roll(points, -1, axis=1)
+        areas[selected] = (points[..., 0] * following[..., 1] -
+                           following[..., 0] * points[..., 1]).sum(axis=1) / 2.
+    return areas
+
+
+def test_element_names():
+    names = get_element_names()
+    assert sorted(names.values()) == sorted(ELEMENTS)
+    assert names["tri6"] == ("tri", 6)
+    assert names["mixed16"] == ("mixed", 16)
+
+
+@pytest.mark.parametrize("mesh", ["structured", "unstructured"])
+@pytest.mark.parametrize("eType, NEN", ELEMENTS)
+def test_meshes(eType, NEN, mesh):
+    if mesh == "unstructured" and eType == "mixed":
+        with pytest.raises(ValueError):
+            generate_mesh(eType, NEN, 100, mesh)
+        return
+    nodes, LtoG = generate_mesh(eType, NEN, 100, mesh)
+    assert nodes.shape[1] == 2 and LtoG.shape[1] == NEN
+    assert .5 * 100 < len(LtoG) < 2 * 100
+    # Every node is used and the elements are counter-clockwise
+    assert (numpy.bincount(LtoG[LtoG >= 0]) > 0).all()
+    assert len(numpy.unique(LtoG[LtoG >= 0])) == len(nodes)
+    areas = get_areas(nodes, LtoG, eType)
+    assert (areas > 0.).all()
+    assert areas.sum() == pytest.approx(1.)
+    assert (nodes >= -1e-12).all() and (nodes <= 1. + 1e-12).all()
+
+    # Conforming: the faces of one element are on the sides of the square
+    corners = get_element_corners(eType, LtoG)
+    edges, edge_index = get_edges(LtoG, corners)
+    counts = numpy.bincount(edge_index[edge_index >= 0])
+    assert counts.max() == 2
+    element, face = get_boundary_faces(LtoG, corners)
+    assert len(element) == (counts == 1).sum()
+    middle = nodes[edges[counts == 1]].mean(axis=1)
+    assert (abs(middle - .5) > .5 - 1e-9).any(axis=1).all()
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 3), ("quad", 9),
+                                        ("mixed", 4)])
+def test_boundary_conditions(eType, NEN):
+    problem_data = generate_problem(eType, NEN, 50)
+    nodes = problem_data["nodes"]
+    LtoG = problem_data["LtoG"]
+    BCs = problem_data["BCs"]
+    EBC = BCs["EBC"]
+    x, y = nodes[EBC["node"]].T
+    assert ((x < 1e-9) | (y > 1 - 1e-9)).all()
+    assert (EBC["data"][y > 1 - 1e-9, 0] == 0.).all()
+    assert (EBC["data"][y < 1 - 1e-9, 0] == 1.).all()
+    for BC_type, side in (("NBC", (1, 0.)), ("MBC", (0, 1.))):
+        table = BCs[BC_type]
+        assert len(table["element"]) > 0
+        corners = get_element_corners(eType, LtoG)
+        if not isinstance(corners, int):
+            corners = corners[table["element"]]
+        first = LtoG[table["element"], table["face"]]
+        second = LtoG[table["element"], (table["face"] + 1) % corners]
+        axis, value = side
+        assert numpy.allclose(nodes[first, axis], value)
+        assert numpy.allclose(nodes[second, axis], value)
+
+
+@pytest.mark.parametrize("extension", [".json", ".fpb"])
+def test_write_problem(tmp_path, extension):
+    problem_data = generate_problem("tri", 6, 50, "unstructured", seed=3)
+    file_name = str(tmp_path / ("problem" + extension))
+    write_problem(problem_data, file_name)
+    data = read_problem_data(file_name)
+    for key in ("title", "eType", "NEN", "NGP", "functions"):
+        assert data[key] == problem_data[key]
+    assert (numpy.asarray(data["nodes"]) == problem_data["nodes"]).all()
+    assert (numpy.asarray(data["LtoG"]) == problem_data["LtoG"]).all()
+    # JSON files have the BC tables in their original layout
+    BCs = process_bcs(data["BCs"])
+    for BC_type, table in problem_data["BCs"].items():
+        for field, values in table.items():
+            assert (BCs[BC_type][field] == values).all()
+
+
+def test_benchmark_case():
+    from benchmark import Phases, run_case, summarize
+
+    arguments = argparse.Namespace(
+        format="fpb", output_format="npy", seed=0, reorder="rcm", workers=1,
+        ebc="row", solver=None, precond=None, tol=None, maxiter=None
+    )
+    case = {"eType": "quad", "NEN": 4, "mesh": "unstructured", "NE": 200}
+    report = run_case(case, arguments)
+    result = summarize(case, [report, report])
+    assert result["NE"] == 200
+    assert result["NN"] > 0
+    assert result["solver"]["method"] == "direct"
+    assert set(result["times"]) <= set(Phases)
+    assert {"read", "process", "reorder", "solve", "output"} <= \
+        set(result["times"])
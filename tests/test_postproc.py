@@ -0,0 +1,103 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the derived quantities of postproc: the integrals and errors
+    over the domain and the fluxes through the NBC, MBC and boundary faces.
+@version: 1.0
+"""
+
+import json
+
+import numpy
+import pytest
+
+from conftest import make_problem, solve, solve_with_faces
+
+from postproc import calc_boundary_fluxes, calc_quantities, save_quantities
+
+
+def harmonic(x, y):
+    return numpy.exp(x) * numpy.sin(y)
+
+
+HarmonicFunctions = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "0",
+                     "exactSoln": "exp(x) * sin(y)"}
+
+
+@pytest.mark.parametrize("eType, NEN, order", [
+    ("tri", 3, 1), ("quad", 9, 2), ("tri", 10, 3), ("mixed", 9, 2)
+])
+def test_error_convergence(eType, NEN, order):
+    errors = []
+    for NE in (32, 512):
+        problem_data = make_problem(eType, NEN, NE, HarmonicFunctions,
+                                    harmonic)
+        integrals = calc_quantities(problem_data,
+                                    solve(problem_data))["integrals"]
+        assert integrals["area"] == pytest.approx(1.)
+        errors.append((integrals["L2_error"], integrals["H1_error"]))
+    L2_rate, H1_rate = numpy.log2(numpy.divide(*errors)) / 2.
+    assert L2_rate > order + .7
+    assert H1_rate > order - .3
+
+
+def test_exact_gradient():
+    # The quadratic solution is exact, so is its gradient, which the exact
+    # gradient differences have to resolve
+    problem_data, solution = solve_with_faces("quad", 9, "NBC", [2., 0.])
+    integrals = calc_quantities(problem_data, solution)["integrals"]
+    assert integrals["L2_error"] < 1e-10
+    assert integrals["H1_error"] < 1e-6
+
+
+def test_missing_exact_solution():
+    functions = dict(HarmonicFunctions)
+    del functions["exactSoln"]
+    problem_data = make_problem("tri", 6, 32, functions, harmonic)
+    integrals = calc_quantities(problem_data,
+                                solve(problem_data))["integrals"]
+    assert "L2_error" not in integrals
+    assert integrals["area"] == pytest.approx(1.)
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 6), ("quad", 9),
+                                        ("quad", 16)])
+def test_boundary_fluxes(eType, NEN):
+    problem_data, solution = solve_with_faces(eType, NEN, "NBC", [2., 0.])
+    boundary = calc_boundary_fluxes(problem_data, solution)
+    NBC = boundary["NBC"]["total"]
+    assert NBC["length"] == pytest.approx(1.)
+    assert NBC["diffusive"] == pytest.approx(NBC["prescribed"], abs=1e-10)
+    # The only outward flux is through x = 1 and balances the source -2
+    total = boundary["boundary"]["total"]
+    assert total["length"] == pytest.approx(4.)
+    assert total["diffusive"] == pytest.approx(-2., abs=1e-10)
+    assert total["advective"] == pytest.approx(0., abs=1e-12)
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 6), ("quad", 9)])
+def test_MBC_prescribed_flux(eType, NEN):
+    # T = y ** 2 varies along the MBC faces on x = 1, so that alpha * T has
+    # to be integrated along them, not taken from the corner values
+    problem_data = solve_with_faces(eType, NEN, "MBC", [-1., 3.], NE=8)[0]
+    solution = problem_data["nodes"][:, 1] ** 2
+    MBC = calc_boundary_fluxes(problem_data, solution)["MBC"]["total"]
+    assert MBC["prescribed"] == pytest.approx(-(-1. / 3. + 3.), abs=1e-12)
+
+
+def test_save_quantities(tmp_path):
+    problem_data, solution = solve_with_faces("quad", 9, "MBC", [-1., 3.])
+    quantities = calc_quantities(problem_data, solution)
+
+    save_quantities(str(tmp_path / "q.json"), quantities)
+    with open(str(tmp_path / "q.json")) as input_file:
+        summary = json.load(input_file)
+    assert summary["integrals"]["area"] == pytest.approx(1.)
+    assert summary["boundary"]["MBC"]["diffusive"] == \
+        pytest.approx(summary["boundary"]["MBC"]["prescribed"], abs=1e-10)
+
+    save_quantities(str(tmp_path / "q.npz"), quantities)
+    arrays = numpy.load(str(tmp_path / "q.npz"))
+    assert arrays["nodal_gradients"].shape == (len(solution), 2)
+    assert json.loads(str(arrays["summary"])) == summary
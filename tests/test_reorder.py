@@ -0,0 +1,59 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the node renumbering of reorder.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from conftest import solve
+
+from meshgen import generate_problem
+from psetup import process_problem_data
+from reorder import get_bandwidth, reorder, restore_order
+
+
+def generated_problem(eType, NEN, NE=400):
+    return process_problem_data(generate_problem(eType, NEN, NE,
+                                                 "unstructured"))
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 3), ("quad", 9),
+                                        ("tri", 10)])
+def test_reorder(eType, NEN):
+    expected_data = generated_problem(eType, NEN)
+    expected = solve(expected_data)
+    nodes = expected_data["nodes"].copy()
+    LtoG = numpy.asarray(expected_data["LtoG"]).copy()
+
+    problem_data = reorder(generated_problem(eType, NEN))
+    # The unstructured meshes are numbered randomly
+    assert get_bandwidth(problem_data["LtoG"]) < get_bandwidth(LtoG) / 4
+    solution = solve(problem_data)
+    assert not numpy.allclose(solution, expected)
+
+    solution = restore_order(problem_data, solution)
+    assert numpy.allclose(solution, expected)
+    assert "node_order" not in problem_data
+    assert (problem_data["nodes"] == nodes).all()
+    # The elements keep their sorted order, with the original node numbers
+    assert sorted(map(tuple, problem_data["LtoG"])) == \
+        sorted(map(tuple, LtoG))
+
+
+def test_well_ordered():
+    # A structured mesh is already well ordered, so it is not renumbered
+    problem_data = process_problem_data(generate_problem("quad", 4, 100))
+    bandwidth = get_bandwidth(problem_data["LtoG"])
+    problem_data = reorder(problem_data)
+    assert get_bandwidth(problem_data["LtoG"]) == bandwidth
+    assert (problem_data["node_order"] ==
+            numpy.arange(problem_data["NN"])).all()
+
+
+def test_not_reordered():
+    solution = numpy.arange(3.)
+    assert restore_order({}, solution) is solution
@@ -0,0 +1,157 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the linear solvers and preconditioners of solveproc.
+@version: 1.0
+"""
+
+import argparse
+import os
+
+import numpy
+import pytest
+
+from conftest import make_problem
+
+import solveproc
+from gsystem import calc_global, calc_operator_key
+from solveproc import DefaultSolverSettings, get_solver_settings, \
+    solve_system, get_factorization, store_factorization, solve_factorized
+
+
+def assemble(functions, symmetric=False, **kwargs):
+    problem_data = make_problem("tri", 6, 200, functions)
+    return calc_global(dict(problem_data),
+                       ebc_method="symmetric" if symmetric else "row",
+                       **kwargs)
+
+
+Diffusion = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "1",
+             "exactSoln": "?"}
+Advection = dict(Diffusion, V1="2", V2="1")
+
+
+def test_settings():
+    settings = get_solver_settings({"solver": {"method": "gmres"}})
+    assert settings["method"] == "gmres"
+    assert settings["tol"] == DefaultSolverSettings["tol"]
+    arguments = argparse.Namespace(solver="cg", precond="jacobi", tol=1e-6,
+                                   maxiter=None)
+    settings = get_solver_settings({"solver": {"method": "gmres"}},
+                                   arguments)
+    assert (settings["method"], settings["preconditioner"],
+            settings["tol"]) == ("cg", "jacobi", 1e-6)
+    with pytest.raises(ValueError):
+        get_solver_settings({"solver": {"method": "lu"}})
+    with pytest.raises(ValueError):
+        get_solver_settings({"solver": {"preconditioner": "amg"}})
+
+
+@pytest.mark.parametrize("method, preconditioner, symmetric", [
+    ("gmres", "none", False), ("gmres", "ilu", False),
+    ("bicgstab", "jacobi", False), ("bicgstab", "ilu", False),
+    ("cg", "none", True), ("cg", "jacobi", True)
+])
+def test_krylov(method, preconditioner, symmetric):
+    K, F = assemble(Diffusion if symmetric else Advection, symmetric)
+    expected = numpy.asarray(solve_system(K, F)).ravel()
+    settings = dict(DefaultSolverSettings, method=method,
+                    preconditioner=preconditioner, tol=1e-10)
+    solution = numpy.asarray(solve_system(K, F, settings)).ravel()
+    report = settings["report"]
+    assert report["converged"]
+    assert 0 < report["iterations"]
+    assert report["residual"] < 1e-9
+    assert numpy.allclose(solution, expected, atol=1e-7)
+    if method == "gmres":
+        assert len(report["residuals"]) == report["iterations"]
+    else:
+        assert "residuals" not in report
+
+
+def test_residual_history():
+    K, F = assemble(Advection)
+    settings = dict(DefaultSolverSettings, method="bicgstab",
+                    preconditioner="jacobi", residual_history=True)
+    solve_system(K, F, settings)
+    report = settings["report"]
+    residuals = report["residuals"]
+    assert len(residuals) == report["iterations"] > 1
+    # The residuals are the ones of the iterates, up to the solution
+    assert residuals[-1] == pytest.approx(report["residual"])
+    assert residuals[-1] < residuals[0]
+
+
+def test_not_converged():
+    K, F = assemble(Advection)
+    settings = dict(DefaultSolverSettings, method="gmres", maxiter=1,
+                    restart=2)
+    solve_system(K, F, settings)
+    assert not settings["report"]["converged"]
+
+
+def test_operator_key():
+    problem_data = make_problem("quad", 9, 50, Advection)
+    key = calc_operator_key(problem_data)
+
+    def changed_(functions=None, BC_type=None, column=None, value=1.5):
+        changed = make_problem("quad", 9, 50, dict(Advection,
+                                                   **functions or {}))
+        if BC_type:
+            table = changed["BCs"][BC_type]
+            if column is None:
+                table["node"] = table["node"][1:]
+                table["data"] = table["data"][1:]
+            else:
+                table["data"][:, column] = value
+        return calc_operator_key(changed)
+
+    assert changed_() == key
+    # Only F changes
+    assert changed_({"f": "2 * x"}) == key
+    assert changed_(BC_type="EBC", column=0) == key
+    assert changed_(BC_type="NBC", column=0) == key
+    assert changed_(BC_type="MBC", column=1) == key
+    # K changes
+    assert changed_({"a": "2"}) != key
+    assert changed_({"V2": "0"}) != key
+    assert changed_(BC_type="MBC", column=0) != key
+    assert changed_(BC_type="EBC") != key
+
+
+def test_factorization_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(solveproc, "Factorizations", {})
+    K, F = assemble(Advection)
+    settings = dict(DefaultSolverSettings)
+    expected = numpy.asarray(solve_system(K, F, settings)).ravel()
+    cache_dir = str(tmp_path / "cache")
+    store_factorization("key", settings["factor"], cache_dir)
+    assert get_factorization("key") is settings["factor"]
+    assert get_factorization("other", cache_dir) is None
+
+    # Loaded from the cache directory by a new process
+    monkeypatch.setattr(solveproc, "Factorizations", {})
+    assert get_factorization("key") is None
+    factor = get_factorization("key", cache_dir)
+    assert numpy.allclose(solve_factorized(factor, F), expected)
+    other_F = assemble(dict(Advection, f="x * y"), rhs_only=True)[1]
+    assert numpy.allclose(solve_factorized(factor, other_F),
+                          numpy.asarray(solve_system(K, other_F)).ravel())
+
+
+def test_cached_runs(tmp_path, sample_dir, capsys, monkeypatch):
+    from SteadyAD2D import get_parser, parse_arguments, run
+
+    arguments = ["-i", os.path.join(sample_dir, "AD2Dsample.json"), "-P",
+                 "-o", str(tmp_path / "T.npy"), "--factor-cache",
+                 str(tmp_path / "cache")]
+    monkeypatch.setattr(solveproc, "Factorizations", {})
+    expected = run(parse_arguments(get_parser(), arguments))[1]
+    capsys.readouterr()
+    # A new process only finds the factorization in the cache directory
+    monkeypatch.setattr(solveproc, "Factorizations", {})
+    solution = run(parse_arguments(get_parser(), arguments))[1]
+    assert "Loading cached factorization" in capsys.readouterr().out
+    assert numpy.allclose(solution, expected)
+    assert numpy.allclose(numpy.load(str(tmp_path / "T.npy")), expected)
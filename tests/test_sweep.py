@@ -0,0 +1,77 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the parametric sweeps of sweep.
+@version: 1.0
+"""
+
+import json
+import os
+
+import numpy
+import pytest
+
+from conftest import solve
+
+from psetup import get_problem_data
+from solveproc import get_solver_settings
+from sweep import read_parameters, get_variant, run_sweep
+
+Variants = [
+    {"name": "base"},
+    {"f": "2 * x"},
+    {"a": "0.5", "MBC.beta": "2"},
+    {"EBC": "3", "NBC": "-1", "MBC.alpha": "-2"},
+    {"f": "0"}
+]
+
+
+def test_read_parameters(tmp_path):
+    csv_name = str(tmp_path / "table.csv")
+    with open(csv_name, "w") as output_file:
+        output_file.write("name, a, MBC.beta\nfirst, 2, \nsecond, , 0.5\n")
+    assert read_parameters(csv_name) == [
+        {"name": "first", "a": "2"},
+        {"name": "second", "MBC.beta": "0.5"}
+    ]
+
+    json_name = str(tmp_path / "table.json")
+    with open(json_name, "w") as output_file:
+        json.dump(Variants, output_file)
+    assert read_parameters(json_name) == Variants
+
+    with open(json_name, "w") as output_file:
+        json.dump([{"b": 1}], output_file)
+    with pytest.raises(ValueError):
+        read_parameters(json_name)
+
+
+def test_get_variant(sample_dir):
+    problem_data = get_problem_data(os.path.join(sample_dir,
+                                                 "AD2Dsample.json"))
+    variant = get_variant(problem_data, Variants[3])
+    # The base problem is not changed, and unchanged data is shared
+    assert variant["functions"]["a"] is problem_data["functions"]["a"]
+    assert (variant["BCs"]["EBC"]["data"][:, 0] == 3.).all()
+    assert not (problem_data["BCs"]["EBC"]["data"][:, 0] == 3.).all()
+    assert variant["LtoG"] is problem_data["LtoG"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_run_sweep(sample_dir, workers):
+    problem_data = get_problem_data(os.path.join(sample_dir,
+                                                 "AD2Dsample.json"))
+    expected = [solve(get_variant(problem_data, parameters))
+                for parameters in Variants]
+    settings = get_solver_settings(problem_data)
+    results = list(run_sweep(problem_data, Variants, settings, workers))
+
+    assert [index for index, _, _ in results] == list(range(len(Variants)))
+    for (index, solution, report), values in zip(results, expected):
+        assert numpy.allclose(numpy.asarray(solution).ravel(), values)
+        assert report["total_time"] >= 0.
+    if workers == 1:
+        # The last variant only changes F, so K is factorized once for it
+        # and the base problem
+        assert results[-1][2]["method"] == "cached factorization"
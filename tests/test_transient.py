@@ -0,0 +1,106 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the theta method time stepping of TransientAD2D.
+@version: 1.0
+"""
+
+import numpy
+import pytest
+
+from conftest import make_problem
+
+from solveproc import get_solver_settings
+from TransientAD2D import get_transient_settings, get_snapshot_count, \
+    get_initial_condition, step_transient
+
+HeatFunctions = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "0",
+                 "exactSoln": "?"}
+
+
+def heat_problem(NE=200):
+    # sin(pi * x) * sin(pi * y) decays as exp(-2 * pi ** 2 * t)
+    return make_problem("tri", 6, NE, HeatFunctions, lambda x, y: 0. * x)
+
+
+def run_steps(problem_data, solver_settings=None, **settings):
+    settings = dict(get_transient_settings(problem_data), **settings)
+    solver_settings = solver_settings or get_solver_settings(problem_data)
+    return list(step_transient(problem_data, settings, solver_settings))
+
+
+def decay_error(problem_data, steps, theta, dt, solver_settings=None):
+    history = run_steps(problem_data, solver_settings, steps=steps,
+                        theta=theta, dt=dt,
+                        initial="sin(pi * x) * sin(pi * y)")
+    step, time, solution = history[-1]
+    x, y = problem_data["nodes"].T
+    exact = numpy.exp(-2. * numpy.pi ** 2 * time) * numpy.sin(numpy.pi * x) * \
+        numpy.sin(numpy.pi * y)
+    return abs(solution - exact).max()
+
+
+def test_settings():
+    problem_data = {"transient": {"dt": .5, "steps": 10}}
+    settings = get_transient_settings(problem_data)
+    assert settings["dt"] == .5
+    assert settings["theta"] == 1.
+    assert get_snapshot_count(dict(settings, save_every=3)) == 5
+    assert get_snapshot_count(dict(settings, save_every=5)) == 3
+    with pytest.raises(ValueError):
+        get_transient_settings({"transient": {"theta": 2.}})
+    with pytest.raises(ValueError):
+        get_transient_settings({"transient": {"dt": 0.}})
+
+
+def test_initial_condition():
+    problem_data = heat_problem()
+    values = get_initial_condition(problem_data, "1 + x * y")
+    x, y = problem_data["nodes"].T
+    EBC = problem_data["BCs"]["EBC"]["node"]
+    assert (values[EBC] == 0.).all()
+    inside = numpy.ones(len(values), dtype=bool)
+    inside[EBC] = False
+    assert numpy.allclose(values[inside], 1. + x[inside] * y[inside])
+
+
+def test_steps():
+    problem_data = heat_problem()
+    history = run_steps(problem_data, steps=3, dt=.1)
+    assert [step for step, _, _ in history] == [0, 1, 2, 3]
+    assert numpy.allclose([time for _, time, _ in history],
+                          [0., .1, .2, .3])
+    # Every step yields a new array
+    assert len(set(id(solution) for _, _, solution in history)) == 4
+
+
+@pytest.mark.parametrize("theta, order", [(1., 1), (.5, 2)])
+def test_time_convergence(theta, order):
+    problem_data = heat_problem()
+    errors = [decay_error(problem_data, steps, theta, .04 / steps)
+              for steps in (4, 8)]
+    assert numpy.log2(errors[0] / errors[1]) > order - .3
+
+
+def test_iterative_solver():
+    problem_data = heat_problem()
+    solver_settings = dict(get_solver_settings(problem_data), method="cg",
+                           preconditioner="jacobi", tol=1e-12)
+    direct = decay_error(problem_data, 4, .5, .01)
+    iterative = decay_error(problem_data, 4, .5, .01, solver_settings)
+    assert iterative == pytest.approx(direct, rel=1e-6)
+    assert "x0" not in solver_settings
+
+
+def test_steady_state():
+    # Implicit Euler steps converge to the steady solution
+    def exact(x, y):
+        return 1. + 2. * x + 3. * y
+
+    problem_data = make_problem("quad", 9, 50, {
+        "a": "1", "V1": "1", "V2": "0", "c": "1", "f": "3 + 2 * x + 3 * y",
+        "exactSoln": "1 + 2 * x + 3 * y"
+    }, exact)
+    solution = run_steps(problem_data, steps=100, dt=1.)[-1][2]
+    assert abs(solution - exact(*problem_data["nodes"].T)).max() < 1e-10
@@ -0,0 +1,191 @@
+"""
+@author: BYK, Deli
+@contact: gulen.ilker@hotmail.com, madbyk@gmail.com
+@summary:
+    Tests of the solution writers: every format is read back and compared
+    to the solution and the mesh.
+@version: 1.0
+"""
+
+import json
+import os
+import xml.etree.ElementTree as ElementTree
+
+import numpy
+import pytest
+
+from conftest import make_problem
+
+import writers
+from writers import Writers, Extensions, SnapshotWriter, get_format, \
+    check_format, get_cell_chunks
+
+Functions = {"a": "1", "V1": "0", "V2": "0", "c": "0", "f": "0",
+             "exactSoln": "?"}
+
+
+def mesh_problem(eType="quad", NEN=9):
+    problem_data = make_problem(eType, NEN, 20, Functions)
+    solution = numpy.linspace(0., 1., problem_data["NN"])
+    return problem_data, solution
+
+
+def write(tmp_path, output_format, problem_data, solution):
+    file_name = str(tmp_path / ("T" + Extensions[output_format]))
+    Writers[output_format](file_name, solution, problem_data)
+    return file_name
+
+
+def test_get_format():
+    assert get_format("a/b.NPY") == "npy"
+    assert get_format("b.xmf") == "xdmf"
+    assert get_format("b.f64") == "raw"
+    assert get_format("b.txt") == "json"
+    for output_format, extension in Extensions.items():
+        assert get_format("T" + extension) == output_format
+
+
+def test_array_formats(tmp_path, monkeypatch):
+    # Small chunks, so that the arrays are written in several of them
+    monkeypatch.setattr(writers, "CHUNK_SIZE", 7)
+    problem_data, solution = mesh_problem()
+
+    with open(write(tmp_path, "json", problem_data, solution)) as input_file:
+        assert json.load(input_file) == {"T": solution.tolist()}
+    raw = numpy.fromfile(write(tmp_path, "raw", problem_data, solution),
+                         dtype="<f8")
+    assert (raw == solution).all()
+    npy = numpy.load(write(tmp_path, "npy", problem_data, solution),
+                     mmap_mode="r")
+    assert (npy == solution).all()
+    npz = numpy.load(write(tmp_path, "npz", problem_data, solution))
+    assert (npz["T"] == solution).all()
+
+
+def read_section(data, name, dtype, count):
+    """
+    Reads the binary data after the header line of a section of a legacy
+    VTK file. Returns the header line and the data.
+    """
+    start = data.index(name.encode("ascii"))
+    end = data.index(b"\n", start)
+    return data[start:end].decode("ascii"), \
+        numpy.frombuffer(data, dtype, count, end + 1)
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 6), ("quad", 16),
+                                        ("mixed", 9)])
+def test_vtk(tmp_path, eType, NEN):
+    problem_data, solution = mesh_problem(eType, NEN)
+    with open(write(tmp_path, "vtk", problem_data, solution), "rb") as \
+            input_file:
+        data = input_file.read()
+    NN = problem_data["NN"]
+    LtoG = numpy.asarray(problem_data["LtoG"])
+    NE = len(LtoG)
+    widths = (LtoG >= 0).sum(axis=1)
+
+    header, points = read_section(data, "POINTS", ">f8", 3 * NN)
+    assert header == "POINTS {0} double".format(NN)
+    points = points.reshape(NN, 3)
+    assert (points[:, :2] == problem_data["nodes"]).all()
+    assert (points[:, 2] == 0.).all()
+
+    size = NE + widths.sum()
+    header, cells = read_section(data, "CELLS", ">i4", size)
+    assert header == "CELLS {0} {1}".format(NE, size)
+    # Each cell is the number of its nodes followed by them
+    offsets = numpy.concatenate(([0], numpy.cumsum(widths + 1)[:-1]))
+    assert (cells[offsets] == widths).all()
+    cell_types = read_section(data, "CELL_TYPES", ">i4", NE)[1]
+    assert set(cell_types) <= set(writers.VTKCellTypes.values())
+
+    values = read_section(data, "LOOKUP_TABLE", ">f8", NN)[1]
+    assert (values == solution).all()
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 3), ("quad", 9),
+                                        ("mixed", 4)])
+def test_xdmf(tmp_path, eType, NEN):
+    problem_data, solution = mesh_problem(eType, NEN)
+    file_name = write(tmp_path, "xdmf", problem_data, solution)
+    root = ElementTree.parse(file_name).getroot()
+    items = list(root.iter("DataItem"))
+    assert all(item.text == "T.bin" for item in items)
+
+    with open(str(tmp_path / "T.bin"), "rb") as input_file:
+        binary = input_file.read()
+    nodes_seek, T_seek = sorted(int(item.get("Seek")) for item in items
+                                if item.get("NumberType") == "Float")
+    NN = problem_data["NN"]
+    nodes = numpy.frombuffer(binary, "<f8", 2 * NN, nodes_seek)
+    assert (nodes.reshape(NN, 2) == problem_data["nodes"]).all()
+    assert (numpy.frombuffer(binary, "<f8", NN, T_seek) == solution).all()
+    assert len(binary) == T_seek + 8 * NN
+    topology = root.find(".//Topology").get("TopologyType")
+    assert topology == ("Mixed" if eType == "mixed" else
+                        writers.XDMFTopologyTypes[(eType, NEN)])
+
+
+@pytest.mark.parametrize("eType, NEN", [("tri", 10), ("quad", 16),
+                                        ("mixed", 16)])
+def test_xdmf_cubic(tmp_path, eType, NEN):
+    problem_data, solution = mesh_problem(eType, NEN)
+    with pytest.raises(ValueError):
+        check_format("xdmf", problem_data)
+    with pytest.raises(ValueError):
+        write(tmp_path, "xdmf", problem_data, solution)
+    check_format("vtk", problem_data)
+
+
+def test_mesh_needed(tmp_path):
+    with pytest.raises(ValueError):
+        Writers["vtk"](str(tmp_path / "T.vtk"), numpy.zeros(3), None)
+
+
+def test_xdmf_checked_before_solving(tmp_path, monkeypatch):
+    import gsystem
+    from meshgen import generate_problem, write_problem
+    from SteadyAD2D import get_parser, parse_arguments, run
+
+    input_name = str(tmp_path / "cubic.json")
+    write_problem(generate_problem("tri", 10, 20), input_name)
+
+    def calc_global(*args, **kwargs):
+        raise AssertionError("The problem is assembled.")
+
+    monkeypatch.setattr(gsystem, "calc_global", calc_global)
+    arguments = parse_arguments(get_parser(),
+                                ["-i", input_name, "-F", "xdmf", "-P"])
+    with pytest.raises(ValueError):
+        run(arguments)
+    assert not os.path.exists(str(tmp_path / "cubic.xdmf"))
+
+
+def test_cell_chunks(monkeypatch):
+    monkeypatch.setattr(writers, "CHUNK_SIZE", 5)
+    problem_data = mesh_problem("mixed", 9)[0]
+    LtoG = numpy.asarray(problem_data["LtoG"])
+    chunks = list(get_cell_chunks(LtoG, ("mixed", 9),
+                                  writers.XDMFMixedTypes.get))
+    assert len(chunks) == -(-len(LtoG) // 5)
+    cells = numpy.concatenate([cells for cells, _ in chunks])
+    headers = numpy.concatenate([headers for _, headers in chunks])
+    assert len(cells) == len(LtoG) + (LtoG >= 0).sum()
+    assert set(headers) <= set(writers.XDMFMixedTypes.values())
+
+
+def test_snapshots(tmp_path):
+    file_name = str(tmp_path / "s.npy")
+    snapshots = SnapshotWriter(file_name, 3, 4)
+    for step in range(3):
+        snapshots.write(step * .5, numpy.full(4, float(step)))
+    with pytest.raises(ValueError):
+        snapshots.write(2., numpy.zeros(4))
+    snapshots.close()
+
+    values = numpy.load(file_name, mmap_mode="r")
+    assert values.shape == (3, 4)
+    assert (values == numpy.arange(3.)[:, None]).all()
+    times = numpy.load(str(tmp_path / "s_times.npy"))
+    assert times.tolist() == [0., .5, 1.]